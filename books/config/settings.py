@@ -41,11 +41,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'store.middleware.QueryMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'store.middleware.PrimaryPinMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     "debug_toolbar.middleware.DebugToolbarMiddleware",
@@ -82,9 +84,120 @@ DATABASES = {
         'PASSWORD': os.getenv('DB_PASS'),
         'HOST': os.getenv('DB_HOST'),
         'PORT': os.getenv('DB_PORT'),
+        # Keep connections open between requests ('None' means forever, 0 closes
+        # them after each request) and ping reused ones before the first query.
+        'CONN_MAX_AGE': None if os.getenv('DB_CONN_MAX_AGE') == 'None' else int(os.getenv('DB_CONN_MAX_AGE', '60')),
+        'CONN_HEALTH_CHECKS': os.getenv('DB_CONN_HEALTH_CHECKS', 'True') == 'True',
+        # Required behind PgBouncer in transaction pooling mode.
+        'DISABLE_SERVER_SIDE_CURSORS': os.getenv('DB_DISABLE_SERVER_SIDE_CURSORS', 'False') == 'True',
+        'OPTIONS': {},
     }
 }
 
+# Abort queries running longer than this many milliseconds (0 disables it).
+DB_STATEMENT_TIMEOUT = int(os.getenv('DB_STATEMENT_TIMEOUT', '0'))
+if DB_STATEMENT_TIMEOUT:
+    DATABASES['default']['OPTIONS']['options'] = f'-c statement_timeout={DB_STATEMENT_TIMEOUT}'
+
+# Comma separated read replica hosts, each exposed as a replica_N alias.
+# BookViewSet list/retrieve read from them, except anonymous requests, whose
+# responses fill the shared cache from the primary; a user who has just
+# written is pinned to the primary for REPLICA_PIN_SECONDS to read their own writes.
+for index, host in enumerate(filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(','))):
+    DATABASES[f'replica_{index}'] = {**DATABASES['default'], 'HOST': host, 'TEST': {'MIRROR': 'default'}}
+
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias.startswith('replica_')]
+DATABASE_ROUTERS = ['store.routers.PrimaryReplicaRouter']
+REPLICA_PIN_SECONDS = float(os.getenv('REPLICA_PIN_SECONDS', '5'))
+
+# Requests running more SQL queries than this log an N+1 warning; keys of
+# STORE_QUERY_BUDGETS are URL names such as 'book-list'.
+STORE_QUERY_BUDGET = int(os.getenv('STORE_QUERY_BUDGET', '20'))
+STORE_QUERY_BUDGETS = {
+    # A few queries per BOOK_IMPORT_BATCH_SIZE rows.
+    'book-import': 10_000,
+}
+
+# /metrics/ answers staff users and scrapers from these addresses only.
+METRICS_ALLOWED_IPS = [ip for ip in os.getenv('METRICS_ALLOWED_IPS', '').split(',') if ip] or INTERNAL_IPS
+
+# Coalesce rating updates in the store_pendingrating table and apply them
+# with `manage.py process_rating_queue` instead of updating the book row
+# on every rate change.
+RATING_QUEUE_ENABLED = os.getenv('RATING_QUEUE_ENABLED', 'False') == 'True'
+RATING_QUEUE_FLUSH_INTERVAL = float(os.getenv('RATING_QUEUE_FLUSH_INTERVAL', '1.0'))
+RATING_QUEUE_BATCH_SIZE = int(os.getenv('RATING_QUEUE_BATCH_SIZE', '10000'))
+
+# Likes, new readers and ratings older than this count half as much
+# towards /book/trending/.
+TRENDING_HALF_LIFE_HOURS = float(os.getenv('TRENDING_HALF_LIFE_HOURS', '24'))
+
+# Default and maximum number of books returned by the leaderboards.
+LEADERBOARD_SIZE = int(os.getenv('LEADERBOARD_SIZE', '10'))
+LEADERBOARD_MAX_SIZE = int(os.getenv('LEADERBOARD_MAX_SIZE', '100'))
+
+# Readers embedded in each book; the full list is served by /book/{id}/readers/.
+BOOK_READERS_PREVIEW_SIZE = int(os.getenv('BOOK_READERS_PREVIEW_SIZE', '5'))
+
+# Serialize book lists from .values() rows with FastBookSerializer.
+BOOK_FAST_SERIALIZER = os.getenv('BOOK_FAST_SERIALIZER', 'True') == 'True'
+
+# Maximum number of entries accepted by POST /book-relation/bulk/.
+BOOK_RELATION_BULK_MAX = int(os.getenv('BOOK_RELATION_BULK_MAX', '1000'))
+
+# /book/changes/ leaves out changes younger than this, so writes that commit
+# late are not skipped; keep it above the longest write transaction.
+BOOK_CHANGES_LAG_SECONDS = float(os.getenv('BOOK_CHANGES_LAG_SECONDS', '5'))
+BOOK_CHANGES_PAGE_SIZE = int(os.getenv('BOOK_CHANGES_PAGE_SIZE', '100'))
+BOOK_CHANGES_MAX_PAGE_SIZE = int(os.getenv('BOOK_CHANGES_MAX_PAGE_SIZE', '1000'))
+
+# Rows validated and inserted per transaction by import_books and
+# POST /book/import/, and the number of rejected rows the endpoint reports.
+BOOK_IMPORT_BATCH_SIZE = int(os.getenv('BOOK_IMPORT_BATCH_SIZE', '5000'))
+BOOK_IMPORT_MAX_ERRORS = int(os.getenv('BOOK_IMPORT_MAX_ERRORS', '1000'))
+# Insert with COPY instead of an executemany() INSERT on PostgreSQL.
+BOOK_IMPORT_USE_COPY = os.getenv('BOOK_IMPORT_USE_COPY', 'True') == 'True'
+
+# /book/{id}/similar/ and build_similar_books: a like or a rate of at least
+# BOOK_SIMILAR_MIN_RATE counts a reader, and neighbours need BOOK_SIMILAR_MIN_COUNT
+# common readers. Users with more than BOOK_SIMILAR_MAX_BASKET such books are
+# left out, their pairs say little and cost the square of their size. Incremental
+# builds affecting more than BOOK_SIMILAR_MAX_TARGETS books run as full ones.
+BOOK_SIMILAR_TOP_K = int(os.getenv('BOOK_SIMILAR_TOP_K', '50'))
+BOOK_SIMILAR_SIZE = int(os.getenv('BOOK_SIMILAR_SIZE', '10'))
+BOOK_SIMILAR_MIN_RATE = int(os.getenv('BOOK_SIMILAR_MIN_RATE', '4'))
+BOOK_SIMILAR_MIN_COUNT = int(os.getenv('BOOK_SIMILAR_MIN_COUNT', '2'))
+BOOK_SIMILAR_MAX_BASKET = int(os.getenv('BOOK_SIMILAR_MAX_BASKET', '1000'))
+BOOK_SIMILAR_CHUNK_USERS = int(os.getenv('BOOK_SIMILAR_CHUNK_USERS', '5000'))
+BOOK_SIMILAR_MAX_TARGETS = int(os.getenv('BOOK_SIMILAR_MAX_TARGETS', '10000'))
+
+# Rows fetched per server-side cursor round-trip by /book/export/.
+BOOK_EXPORT_CHUNK_SIZE = int(os.getenv('BOOK_EXPORT_CHUNK_SIZE', '2000'))
+
+# LocMemCache is only fit for development and tests: cache invalidation
+# needs a backend shared by every worker, which `check --deploy` enforces.
+# Replica pins need one as well, which is checked on every start once
+# DB_REPLICA_HOSTS is set.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+# Anonymous /book/ list and detail responses are cached per query string
+# and invalidated through per-book version keys.
+BOOK_CACHE_ALIAS = 'default'
+BOOK_CACHE_TIMEOUT = int(os.getenv('BOOK_CACHE_TIMEOUT', '300'))
+
+# JSON is encoded with orjson when it is installed (the fast-json extra), see store.renderers.
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'store.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+}
+
 AUTHENTICATION_BACKENDS = (
     'social_core.backends.github.GithubOAuth2',
     'django.contrib.auth.backends.ModelBackend',
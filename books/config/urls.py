@@ -2,16 +2,23 @@ from django.contrib import admin
 from django.urls import path, include
 from rest_framework.routers import SimpleRouter
 
-from store.views import BookViewSet, auth, UserBookRelationView
+from store import async_views
+from store.views import AuthorStatsView, BookViewSet, BookmarksView, LikesView, auth, metrics, UserBookRelationView
 
 router = SimpleRouter()
 router.register('book', BookViewSet)
 router.register('book-relation', UserBookRelationView)
+router.register('me/bookmarks', BookmarksView, basename='me-bookmarks')
+router.register('me/likes', LikesView, basename='me-likes')
+router.register('author', AuthorStatsView)
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('social_django.urls', namespace='social')),
     path('auth/', auth),
+    path('metrics/', metrics),
+    path('async/book/', async_views.book_list, name='async-book-list'),
+    path('async/book/<int:pk>/', async_views.book_detail, name='async-book-detail'),
     path("__debug__/", include("debug_toolbar.urls")),
 ]
 
@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.contrib.admin import ModelAdmin
 
-from store.models import Book, UserBookRelation
+from store.models import AuthorStats, Book, UserBookRelation
 
 
 @admin.register(Book)
@@ -11,4 +11,9 @@ class BookAdmin(ModelAdmin):
 
 @admin.register(UserBookRelation)
 class UserBookRelationAdmin(ModelAdmin):
-    ...
+    list_select_related = ('user', 'book')
+
+
+@admin.register(AuthorStats)
+class AuthorStatsAdmin(ModelAdmin):
+    list_display = ('author_name', 'books_count', 'likes_count', 'rating')
@@ -1,6 +1,24 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_delete
 
 
 class StoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'store'
+
+    def ready(self):
+        from django.contrib.auth.models import User
+
+        from store import checks  # noqa: F401
+        from store.cache import bump_changed_book
+        from store.middleware import install_query_recorder
+        from store.models import Book
+        from store.services import record_tombstone, remove_author_stats, remove_user_relation_counters
+        connection_created.connect(install_query_recorder, dispatch_uid='store_install_query_recorder')
+        post_delete.connect(record_tombstone, sender=Book, dispatch_uid='store_record_tombstone')
+        post_save.connect(bump_changed_book, sender=Book, dispatch_uid='store_bump_saved_book')
+        post_delete.connect(bump_changed_book, sender=Book, dispatch_uid='store_bump_deleted_book')
+        pre_delete.connect(remove_user_relation_counters, sender=User,
+                           dispatch_uid='store_remove_user_relation_counters')
+        post_delete.connect(remove_author_stats, sender=Book, dispatch_uid='store_remove_author_stats')
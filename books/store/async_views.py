@@ -0,0 +1,72 @@
+"""
+ASGI-native versions of the anonymous BookViewSet reads.
+
+Filtering, ordering and pagination are taken from BookViewSet so both
+paths return the same JSON. Queries go through the async ORM, so a single
+event loop can hold many slow clients without a thread per request.
+These views always read from a replica and neither use the response cache
+nor identify the user, so clients that need their own writes should use
+the sync endpoints.
+"""
+from django.contrib.auth.models import AnonymousUser, User
+from django.http import HttpResponse
+from rest_framework.exceptions import APIException, NotFound
+from rest_framework.request import Request
+
+from store.renderers import FastJSONRenderer
+from store.routers import use_replica
+from store.services import readers_preview_queryset
+from store.views import BookViewSet
+
+
+async def book_list(request):
+    view = _view(request, 'list')
+    try:
+        with use_replica():
+            queryset = view.filter_queryset(view.get_queryset()).prefetch_related(None)
+            page = await view.paginator.apaginate_queryset(queryset, view.request, view=view)
+            await _attach_readers_preview(page)
+    except APIException as exc:
+        return _error(exc)
+
+    data = view.get_serializer(page, many=True).data
+    return _render(view.paginator.get_paginated_response(data).data)
+
+
+async def book_detail(request, pk):
+    view = _view(request, 'retrieve')
+    with use_replica():
+        book = await view.get_queryset().prefetch_related(None).filter(pk=pk).afirst()
+        if book is None:
+            return _error(NotFound())
+        await _attach_readers_preview([book])
+    return _render(view.get_serializer(book).data)
+
+
+def _view(request, action):
+    view = BookViewSet(action=action, args=(), kwargs={}, format_kwarg=None)
+    view.request = Request(request)
+    # Resolving the session user would need a synchronous query.
+    view.request.user = AnonymousUser()
+    return view
+
+
+async def _attach_readers_preview(books):
+    # The async ORM cannot prefetch, so the first readers of every book are
+    # fetched with one windowed query instead.
+    previews = {book.id: [] for book in books}
+    if not previews:
+        return
+
+    async for book_id, first_name, last_name in readers_preview_queryset(list(previews)):
+        previews[book_id].append(User(first_name=first_name, last_name=last_name))
+    for book in books:
+        book.readers_preview = previews[book.id]
+
+
+def _render(data, status=200):
+    return HttpResponse(FastJSONRenderer().render(data), content_type='application/json', status=status)
+
+
+def _error(exc):
+    return _render({'detail': exc.detail}, status=exc.status_code)
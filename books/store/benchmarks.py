@@ -0,0 +1,337 @@
+import asyncio
+import json
+import random
+import statistics
+import subprocess
+import threading
+import time
+from datetime import datetime, timezone
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.db import close_old_connections, connection, connections
+from django.test import AsyncClient, Client, override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from store.middleware import recording
+from store.models import Book
+from store.renderers import FastJSONRenderer
+from store.serializers import BookSerializer, FastBookSerializer
+from store.services import attach_readers_previews
+
+WORDS = ('silent', 'river', 'ring', 'shadow', 'empire', 'garden', 'winter', 'code', 'star', 'night',
+         'stone', 'glass', 'city', 'ocean', 'fire', 'machine', 'letters', 'crown', 'forest', 'dream')
+
+
+class Scenario:
+    has_async_view = False
+
+    def __init__(self, name, method='get', authenticated=False):
+        self.name = name
+        self.method = method
+        self.authenticated = authenticated
+
+    def build(self, rng, context):
+        raise NotImplementedError
+
+
+class ListScenario(Scenario):
+    has_async_view = True
+
+    def __init__(self, name, params=None, **kwargs):
+        super().__init__(name, **kwargs)
+        self.params = params or {}
+
+    def build(self, rng, context):
+        params = {'page_size': context['page_size'], **self.params}
+        if params.get('search') == '{word}':
+            params['search'] = rng.choice(WORDS)
+        return '/book/', params
+
+
+class DetailScenario(Scenario):
+    has_async_view = True
+
+    def build(self, rng, context):
+        return f'/book/{rng.choice(context["book_ids"])}/', {}
+
+
+class RelationPatchScenario(Scenario):
+    def __init__(self, name):
+        super().__init__(name, method='patch', authenticated=True)
+
+    def build(self, rng, context):
+        return f'/book-relation/{rng.choice(context["book_ids"])}/', {'rate': rng.randint(1, 5)}
+
+
+SCENARIOS = {scenario.name: scenario for scenario in [
+    ListScenario('list'),
+    ListScenario('search', {'search': '{word}'}),
+    ListScenario('ordering', {'ordering': '-price'}),
+    DetailScenario('detail'),
+    RelationPatchScenario('relation_patch'),
+]}
+
+
+# wsgi runs the sync views on threads, asgi runs them through the ASGI
+# handler on one event loop and asgi-async uses the /async/ views there.
+MODES = ('wsgi', 'asgi', 'asgi-async')
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+class BenchmarkRunner:
+    def __init__(self, requests=200, warmup=20, concurrency=1, page_size=50, cold_cache=False, seed=42,
+                 host='localhost', conn_max_age=None, mode='wsgi', client_class=Client,
+                 async_client_class=AsyncClient):
+        self.requests = requests
+        self.warmup = warmup
+        self.concurrency = concurrency
+        self.cold_cache = cold_cache
+        self.seed = seed
+        self.host = host
+        self.client_class = client_class
+        self.conn_max_age = conn_max_age
+        self.mode = mode
+        self.async_client_class = async_client_class
+        self.context = {
+            'page_size': page_size,
+            'book_ids': list(Book.objects.order_by('?').values_list('id', flat=True)[:10_000]),
+        }
+        self.user, _ = User.objects.get_or_create(username='bench_runner')
+
+    def run(self, scenario_names):
+        if self.conn_max_age is not None:
+            for alias in connections:
+                connections[alias].settings_dict['CONN_MAX_AGE'] = self.conn_max_age
+            connections.close_all()
+        # The debug toolbar middleware is sync-only and would push every ASGI
+        # request back onto a thread, so it is left out of every mode.
+        # AsyncClient always sends Host: testserver on Django 4.2, so allow it.
+        middleware = [name for name in settings.MIDDLEWARE if not name.startswith('debug_toolbar.')]
+        overrides = {'MIDDLEWARE': middleware, 'ALLOWED_HOSTS': [*settings.ALLOWED_HOSTS, self.host, 'testserver']}
+        if self.cold_cache:
+            # Responses are built and stored as usual but expire at once. Clearing
+            # the cache per request still let concurrent workers hit each other's entries.
+            overrides['BOOK_CACHE_TIMEOUT'] = 0
+        with override_settings(**overrides):
+            return {
+                'meta': self.meta(),
+                'scenarios': {name: self.run_scenario(SCENARIOS[name]) for name in scenario_names},
+            }
+
+    def run_scenario(self, scenario):
+        if self.mode == 'wsgi':
+            samples, errors, spans = self.run_threads(scenario)
+        else:
+            samples, errors, spans = async_to_sync(self.run_tasks)(scenario)
+
+        wall = max(end for _, end in spans) - min(start for start, _ in spans)
+        return summarize(samples, errors, wall)
+
+    def run_threads(self, scenario):
+        samples = []
+        errors = []
+        spans = []
+        lock = threading.Lock()
+        per_worker = max(1, self.requests // self.concurrency)
+
+        def worker(index):
+            rng = random.Random(self.seed + index)
+            client = self.client_class(HTTP_HOST=self.host)
+            if scenario.authenticated:
+                client.force_login(self.user)
+
+            measured_from = time.perf_counter()
+            for iteration in range(self.warmup + per_worker):
+                if iteration == self.warmup:
+                    measured_from = time.perf_counter()
+                path, params = scenario.build(rng, self.context)
+
+                with recording() as recorder:
+                    start = time.perf_counter()
+                    self.close_old_connections()
+                    if scenario.method == 'get':
+                        response = client.get(path, params)
+                    else:
+                        response = getattr(client, scenario.method)(path, params, content_type='application/json')
+                    self.close_old_connections()
+                    elapsed = time.perf_counter() - start
+
+                if iteration < self.warmup:
+                    continue
+                with lock:
+                    if response.status_code >= 400:
+                        errors.append(response.status_code)
+                    samples.append((elapsed, recorder.count))
+            with lock:
+                spans.append((measured_from, time.perf_counter()))
+
+        if self.concurrency == 1:
+            worker(0)
+        else:
+            threads = [threading.Thread(target=self.in_thread(worker), args=(index, ))
+                       for index in range(self.concurrency)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        return samples, errors, spans
+
+    async def run_tasks(self, scenario):
+        # One event loop serves every worker, like a single ASGI process.
+        samples = []
+        errors = []
+        spans = []
+        per_worker = max(1, self.requests // self.concurrency)
+
+        async def worker(index):
+            rng = random.Random(self.seed + index)
+            client = self.async_client_class()
+            if scenario.authenticated:
+                await sync_to_async(client.force_login)(self.user)
+
+            measured_from = time.perf_counter()
+            for iteration in range(self.warmup + per_worker):
+                if iteration == self.warmup:
+                    measured_from = time.perf_counter()
+                path, params = scenario.build(rng, self.context)
+                if self.mode == 'asgi-async' and scenario.has_async_view:
+                    path = f'/async{path}'
+
+                with recording() as recorder:
+                    start = time.perf_counter()
+                    if scenario.method == 'get':
+                        response = await client.get(path, params)
+                    else:
+                        response = await getattr(client, scenario.method)(path, params,
+                                                                          content_type='application/json')
+                    elapsed = time.perf_counter() - start
+
+                if iteration < self.warmup:
+                    continue
+                if response.status_code >= 400:
+                    errors.append(response.status_code)
+                samples.append((elapsed, recorder.count))
+            spans.append((measured_from, time.perf_counter()))
+
+        await asyncio.gather(*(worker(index) for index in range(self.concurrency)))
+        return samples, errors, spans
+
+    def close_old_connections(self):
+        # The test client skips the connection cleanup the request handler
+        # does, so run it here when connection persistence is under test.
+        if self.conn_max_age is not None:
+            close_old_connections()
+
+    @staticmethod
+    def in_thread(worker):
+        def run(index):
+            try:
+                worker(index)
+            finally:
+                connections.close_all()
+        return run
+
+    def meta(self):
+        try:
+            commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                    check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+
+        return {
+            'commit': commit,
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'vendor': connection.vendor,
+            'books': Book.objects.count(),
+            'requests': self.requests,
+            'concurrency': self.concurrency,
+            'mode': self.mode,
+            'cold_cache': self.cold_cache,
+            'conn_max_age': connection.settings_dict['CONN_MAX_AGE'],
+        }
+
+
+def bench_serializers(limit=1000, repeat=10, user=None):
+    """
+    Time serializing and rendering one page of books with BookSerializer and
+    JSONRenderer against FastBookSerializer and FastJSONRenderer.
+
+    Rows are loaded once beforehand, so only the per-row CPU cost is
+    measured. Both paths must produce the same bytes.
+    """
+    from store.views import BookViewSet
+
+    request = Request(APIRequestFactory().get('/book/'))
+    request.user = user or AnonymousUser()
+    view = BookViewSet(action='list', request=request, format_kwarg=None, args=(), kwargs={})
+    context = view.get_serializer_context()
+    queryset = view.get_queryset().order_by('id')[:limit]
+    books = list(queryset)
+    rows = attach_readers_previews(list(view.get_rows(queryset)))
+
+    paths = {
+        'drf': lambda: JSONRenderer().render(BookSerializer(books, many=True, context=context).data),
+        'fast': lambda: FastJSONRenderer().render(FastBookSerializer(rows, many=True, context=context).data),
+    }
+    results = {'rows': len(books), 'identical': paths['drf']() == paths['fast']()}
+    for name, render in paths.items():
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            render()
+            timings.append(time.perf_counter() - start)
+        results[name] = {
+            'median_ms': statistics.median(timings) * 1000,
+            'per_row_us': statistics.median(timings) / len(books) * 1_000_000 if books else None,
+        }
+    return results
+
+
+def summarize(samples, errors, wall):
+    latencies = [elapsed * 1000 for elapsed, _ in samples]
+    queries = [count for _, count in samples]
+    return {
+        'requests': len(samples),
+        'errors': len(errors),
+        'p50_ms': percentile(latencies, 0.50),
+        'p95_ms': percentile(latencies, 0.95),
+        'p99_ms': percentile(latencies, 0.99),
+        'mean_ms': statistics.mean(latencies) if latencies else None,
+        'queries_mean': statistics.mean(queries) if queries else None,
+        'queries_max': max(queries) if queries else None,
+        'throughput_rps': len(samples) / wall if wall > 0 else None,
+    }
+
+
+def compare(current, baseline):
+    rows = []
+    for name, result in current['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if not previous:
+            continue
+        for metric in ('p50_ms', 'p95_ms', 'p99_ms', 'queries_mean', 'throughput_rps'):
+            new, old = result.get(metric), previous.get(metric)
+            if new is None or not old:
+                continue
+            rows.append((name, metric, old, new, (new - old) / old * 100))
+    return rows
+
+
+def load(path):
+    with open(path) as file:
+        return json.load(file)
+
+
+def dump(results, path):
+    with open(path, 'w') as file:
+        json.dump(results, file, indent=2)
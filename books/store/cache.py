@@ -0,0 +1,162 @@
+import hashlib
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.http import http_date, parse_http_date_safe
+from rest_framework import status
+from rest_framework.response import Response
+
+CATALOGUE_KEY = 'store:version:catalogue'
+
+
+def book_key(book_id):
+    return f'store:version:book:{book_id}'
+
+
+def get_cache():
+    return caches[settings.BOOK_CACHE_ALIAS]
+
+
+def _new_version():
+    return time.time(), uuid.uuid4().hex
+
+
+def _bump(keys):
+    keys = list(keys)
+    if not keys:
+        return
+
+    def set_versions():
+        version = _new_version()
+        get_cache().set_many({key: version for key in keys}, timeout=None)
+
+    # Bump now so readers in this process stop serving the old entry, and
+    # again after commit so an entry rebuilt from pre-commit data is dropped.
+    set_versions()
+    transaction.on_commit(set_versions)
+
+
+def bump_books(book_ids):
+    _bump(book_key(book_id) for book_id in book_ids)
+
+
+def bump_book(book_id):
+    bump_books([book_id])
+
+
+def bump_catalogue(book_id=None):
+    keys = [CATALOGUE_KEY]
+    if book_id is not None:
+        keys.append(book_key(book_id))
+    _bump(keys)
+
+
+def bump_changed_book(sender, instance, **kwargs):
+    # post_save and post_delete receiver, so queryset and admin deletes drop
+    # the cached entries as well.
+    bump_catalogue(instance.pk)
+
+
+def get_versions(keys):
+    cache = get_cache()
+    versions = cache.get_many(keys)
+    missing = {key: _new_version() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        versions.update(missing)
+    return versions
+
+
+class CachedReadMixin:
+    """
+    Serve anonymous list/retrieve responses from the cache.
+
+    Each entry remembers the version of every key it depends on: the
+    catalogue version for lists plus the version of each book it contains.
+    Writes bump only the affected versions, so unrelated entries stay warm.
+    Put it before ReplicaReadMixin: responses that fill the cache are built
+    from the primary, so a lagging replica's rows are never stored under a
+    version that is already newer than them.
+    """
+
+    def reads_from_primary(self, request):
+        return self.caches_response(request) or super().reads_from_primary(request)
+
+    def caches_response(self, request):
+        return not request.user.is_authenticated
+
+    def list(self, request, *args, **kwargs):
+        return self._cached_response('list', request, super().list, args, kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._cached_response('retrieve', request, super().retrieve, args, kwargs)
+
+    def _cached_response(self, action, request, get_response, args, kwargs):
+        if not self.caches_response(request):
+            return get_response(request, *args, **kwargs)
+
+        cache = get_cache()
+        key = self._entry_key(action, request)
+        entry = cache.get(key)
+        if entry is not None and get_versions(list(entry['versions'])) == entry['versions']:
+            if self._not_modified(request, entry):
+                return self._with_validators(Response(status=status.HTTP_304_NOT_MODIFIED), entry)
+            return self._with_validators(Response(entry['data']), entry)
+
+        if action == 'list':
+            versions = get_versions([CATALOGUE_KEY])
+        else:
+            versions = get_versions([book_key(kwargs[self.lookup_url_kwarg or self.lookup_field])])
+        started = time.time()
+        response = get_response(request, *args, **kwargs)
+        if response.status_code != status.HTTP_200_OK:
+            return response
+
+        if action == 'list':
+            keys = [book_key(book['id']) for book in self._books(response.data)]
+            book_versions = cache.get_many(keys)
+            # A book bumped while the page was built may be newer than the
+            # row read for it, so that page is served but not stored.
+            if any(version[0] > started for version in book_versions.values()):
+                return response
+            versions.update(book_versions)
+            versions.update(get_versions([key for key in keys if key not in book_versions]))
+
+        entry = {
+            'data': response.data,
+            'versions': versions,
+            'etag': '"%s"' % hashlib.md5(repr((key, sorted(versions.items()))).encode()).hexdigest(),
+            'last_modified': max(version[0] for version in versions.values()),
+        }
+        cache.set(key, entry, settings.BOOK_CACHE_TIMEOUT)
+        return self._with_validators(response, entry)
+
+    @staticmethod
+    def _entry_key(action, request):
+        params = sorted((name, values) for name, values in request.query_params.lists())
+        raw = repr((request.get_host(), request.path, params, request.accepted_media_type))
+        return f'store:response:{action}:{hashlib.md5(raw.encode()).hexdigest()}'
+
+    @staticmethod
+    def _books(data):
+        if isinstance(data, dict):
+            data = data['results']
+        return data
+
+    @staticmethod
+    def _not_modified(request, entry):
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match is not None:
+            return entry['etag'] in [tag.strip() for tag in if_none_match.split(',')] or if_none_match == '*'
+
+        if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+        return if_modified_since is not None and int(entry['last_modified']) <= if_modified_since
+
+    @staticmethod
+    def _with_validators(response, entry):
+        response['ETag'] = entry['etag']
+        response['Last-Modified'] = http_date(entry['last_modified'])
+        return response
@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+LOCMEM_CACHE = 'django.core.cache.backends.locmem.LocMemCache'
+DUMMY_CACHE = 'django.core.cache.backends.dummy.DummyCache'
+
+
+def _cache_backend():
+    return settings.CACHES[settings.BOOK_CACHE_ALIAS]['BACKEND']
+
+
+@register(Tags.caches, deploy=True)
+def check_response_cache(app_configs, **kwargs):
+    # The version keys invalidating cached responses must be shared by every worker.
+    if _cache_backend() != LOCMEM_CACHE:
+        return []
+    return [Error(
+        'BOOK_CACHE_ALIAS uses LocMemCache, so every worker process keeps its own book versions '
+        'and serves cached responses for up to BOOK_CACHE_TIMEOUT after a write handled by another.',
+        hint='Set CACHE_BACKEND to a shared backend such as Redis, Memcached or the database cache.',
+        id='store.E001',
+    )]
+
+
+@register(Tags.caches, Tags.database)
+def check_replica_pins(app_configs, **kwargs):
+    # A user pinned to the primary by one worker must be pinned for every worker,
+    # or their next read may reach a replica that has not caught up with their write.
+    if not settings.DATABASE_REPLICAS or _cache_backend() not in (LOCMEM_CACHE, DUMMY_CACHE):
+        return []
+    return [Error(
+        'DB_REPLICA_HOSTS is set but BOOK_CACHE_ALIAS keeps primary pins in a process-local cache, '
+        'so a user may not read their own writes when the next request reaches another worker.',
+        hint='Set CACHE_BACKEND to a shared backend such as Redis, Memcached or the database cache.',
+        id='store.E002',
+    )]
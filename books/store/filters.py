@@ -0,0 +1,76 @@
+from functools import reduce
+import operator
+
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.db import connection
+from django.db.models import Case, FloatField, Value, When
+from django.db.models.functions import Greatest
+from django_filters import rest_framework as filters
+from rest_framework.exceptions import NotAuthenticated
+from rest_framework.filters import SearchFilter
+
+from store.models import Book, UserBookRelation
+
+
+class BookFilter(filters.FilterSet):
+    """
+    `?bookmarked=me` and `?liked=me` keep the books the requesting user
+    bookmarked or liked, looked up through the partial relation indexes.
+    """
+    bookmarked = filters.ChoiceFilter(field_name='in_bookmarks', choices=[('me', 'me')], method='filter_mine')
+    liked = filters.ChoiceFilter(field_name='like', choices=[('me', 'me')], method='filter_mine')
+
+    class Meta:
+        model = Book
+        fields = ['price']
+
+    def filter_mine(self, queryset, name, value):
+        user = getattr(self.request, 'user', None)
+        if user is None or not user.is_authenticated:
+            raise NotAuthenticated()
+        return queryset.filter(id__in=UserBookRelation.objects.filter(user=user, **{name: True}).values('book_id'))
+
+
+class BookSearchFilter(SearchFilter):
+    """
+    SearchFilter that also annotates a `relevance` score for ordering.
+
+    The `icontains` lookups are kept as they are; on PostgreSQL they compile
+    to `UPPER(column) LIKE UPPER(term)`, which the pg_trgm GIN indexes on
+    UPPER(name) and UPPER(author_name) serve, and are ranked by trigram word
+    similarity. Other backends rank exact, prefix and substring matches.
+    """
+    relevance_field = 'relevance'
+
+    def filter_queryset(self, request, queryset, view):
+        queryset = super().filter_queryset(request, queryset, view)
+        search_fields = [str(field).lstrip(''.join(self.lookup_prefixes)) for field in
+                         self.get_search_fields(view, request) or ()]
+        search_terms = self.get_search_terms(request)
+
+        if not search_fields or not search_terms:
+            relevance = Value(0.0, output_field=FloatField())
+        else:
+            relevance = reduce(operator.add, [
+                self._greatest([self.get_similarity(term, field) for field in search_fields])
+                for term in search_terms
+            ])
+        return queryset.annotate(**{self.relevance_field: relevance})
+
+    def get_similarity(self, term, field):
+        if connection.vendor == 'postgresql':
+            return TrigramWordSimilarity(term, field)
+
+        return Case(
+            When(**{f'{field}__iexact': term}, then=Value(1.0)),
+            When(**{f'{field}__istartswith': term}, then=Value(0.5)),
+            When(**{f'{field}__icontains': term}, then=Value(0.25)),
+            default=Value(0.0),
+            output_field=FloatField(),
+        )
+
+    @staticmethod
+    def _greatest(expressions):
+        if len(expressions) == 1:
+            return expressions[0]
+        return Greatest(*expressions)
@@ -0,0 +1,228 @@
+"""
+Bulk import of books from CSV or NDJSON, used by `manage.py import_books`
+and POST /book/import/.
+
+Input is streamed and validated a chunk at a time with BookSerializer's own
+fields, so the accepted values and error messages match POST /book/, but
+without building a serializer per row. Valid rows of a chunk are written
+in one transaction as raw column values, with COPY ... FROM STDIN on
+PostgreSQL and a single executemany() INSERT elsewhere, so Book.save() and
+its signals do not run; invalid rows are skipped and reported by line
+number. AuthorStats book counts are added with one upsert per chunk.
+"""
+import csv
+import decimal
+import io
+import json
+import re
+import time
+from collections import Counter
+from itertools import islice
+
+from django.conf import settings
+from django.core.validators import MaxLengthValidator, ProhibitNullCharactersValidator
+from django.db import connection, transaction
+from rest_framework import serializers
+from rest_framework.fields import SkipField, empty
+from rest_framework.settings import api_settings
+from rest_framework.validators import ProhibitSurrogateCharactersValidator
+
+from store.cache import bump_catalogue
+from store.models import Book
+from store.serializers import BookSerializer
+from store.services import update_author_stats
+
+# Characters rejected by the ProhibitNullCharacters and ProhibitSurrogateCharacters validators.
+PROHIBITED_CHARACTERS = re.compile('[\x00\ud800-\udfff]')
+
+CONTENT_TYPES = {'text/csv': 'csv', 'application/x-ndjson': 'ndjson'}
+
+
+def decode_lines(stream):
+    # Undecodable bytes become lone surrogates, which the field validators
+    # reject, so a bad row is reported like any other invalid one.
+    for line in stream:
+        yield line.decode('utf-8', errors='surrogateescape')
+
+
+def read_csv(lines):
+    # csv.reader plus zip() rather than DictReader, which is several times slower per row.
+    reader = csv.reader(lines)
+    header = next(reader, None)
+    for values in reader:
+        if values:
+            yield reader.line_num, dict(zip(header, values))
+
+
+def read_ndjson(lines):
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line)
+        except ValueError:
+            yield number, None
+
+
+READERS = {'csv': read_csv, 'ndjson': read_ndjson}
+
+
+class BookImporter:
+    def __init__(self, owner=None, batch_size=None, max_errors=None, progress=None):
+        self.owner = owner
+        self.batch_size = batch_size or settings.BOOK_IMPORT_BATCH_SIZE
+        self.max_errors = settings.BOOK_IMPORT_MAX_ERRORS if max_errors is None else max_errors
+        self.progress = progress
+        self.validators = [(name, field.source, self._validator(field))
+                           for name, field in BookSerializer().fields.items() if not field.read_only]
+        self.fields = [field for field in Book._meta.concrete_fields if not field.primary_key]
+        self.use_copy = settings.BOOK_IMPORT_USE_COPY and connection.vendor == 'postgresql'
+        self.rows = 0
+        self.imported = 0
+        self.error_count = 0
+        self.errors = []
+        self.started = time.perf_counter()
+
+    def run(self, rows):
+        """Import (line number, row dict) pairs; returns self."""
+        rows = iter(rows)
+        while chunk := list(islice(rows, self.batch_size)):
+            valid = []
+            for line, row in chunk:
+                try:
+                    valid.append(self.validate(row))
+                except serializers.ValidationError as exc:
+                    self.add_error(line, exc.detail)
+
+            with transaction.atomic():
+                self.insert(valid)
+                update_author_stats((author_name, books, 0, 0, 0)
+                                    for author_name, books in Counter(row['author_name'] for row in valid).items())
+                bump_catalogue()
+            self.rows += len(chunk)
+            self.imported += len(valid)
+            if self.progress:
+                self.progress(self)
+        return self
+
+    def validate(self, row):
+        if not isinstance(row, dict):
+            message = serializers.Serializer.default_error_messages['invalid'].format(datatype=type(row).__name__)
+            raise serializers.ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [message]})
+
+        values = {}
+        errors = {}
+        for name, source, validate in self.validators:
+            try:
+                values[source] = validate(row.get(name, empty))
+            except serializers.ValidationError as exc:
+                errors[name] = exc.detail
+            except SkipField:
+                pass
+        if errors:
+            raise serializers.ValidationError(errors)
+        return values
+
+    def insert(self, rows):
+        """
+        Insert validated rows as they are; every other column gets the value
+        Book(owner=owner).save() would write, computed once per chunk.
+        """
+        if not rows:
+            return
+
+        template = Book(owner=self.owner)
+        defaults = [field.get_db_prep_save(field.pre_save(template, add=True), connection) for field in self.fields]
+        columns = [(index, field.attname) for index, field in enumerate(self.fields)
+                   if any(field.attname == source for _, source, _ in self.validators)]
+        params = []
+        for row in rows:
+            # Validated values are str and Decimal, which every driver adapts.
+            values = defaults.copy()
+            for index, name in columns:
+                values[index] = row[name]
+            params.append(values)
+        if self.use_copy:
+            self._copy(params)
+        else:
+            self._insert(params)
+
+    def add_error(self, line, detail):
+        self.error_count += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'line': line, 'errors': detail})
+
+    @property
+    def rate(self):
+        elapsed = time.perf_counter() - self.started
+        return self.rows / elapsed if elapsed else 0.0
+
+    def summary(self):
+        return {'rows': self.rows, 'imported': self.imported, 'error_count': self.error_count,
+                'errors': self.errors}
+
+    def _insert(self, params):
+        # One prepared statement run by the driver for every row, instead of
+        # bulk_create() compiling and adapting each value in Python.
+        placeholders = ', '.join(['%s'] * len(self.fields))
+        with connection.cursor() as cursor:
+            cursor.executemany(f'INSERT INTO {self._table()} VALUES ({placeholders})', params)
+
+    def _copy(self, params):
+        buffer = io.StringIO()
+        for values in params:
+            # Unquoted empty is NULL and a quoted one an empty string in COPY's CSV format.
+            buffer.write(','.join('' if value is None else '"%s"' % str(value).replace('"', '""')
+                                  for value in values))
+            buffer.write('\n')
+        buffer.seek(0)
+
+        with connection.cursor() as cursor:
+            cursor.copy_expert(f'COPY {self._table()} FROM STDIN WITH (FORMAT csv)', buffer)
+
+    def _table(self):
+        columns = ', '.join(connection.ops.quote_name(field.column) for field in self.fields)
+        return f'{connection.ops.quote_name(Book._meta.db_table)} ({columns})'
+
+    @staticmethod
+    def _validator(field):
+        # Plain values take a short path; anything else goes through the field
+        # itself, which either accepts it or raises the usual error.
+        run_validation = field.run_validation
+        if type(field) is serializers.CharField and not field.allow_blank and field.min_length is None \
+                and all(isinstance(validator, (MaxLengthValidator, ProhibitNullCharactersValidator,
+                                               ProhibitSurrogateCharactersValidator))
+                        for validator in field.validators):
+            max_length = min((validator.limit_value for validator in field.validators
+                              if isinstance(validator, MaxLengthValidator)), default=float('inf'))
+            trim = field.trim_whitespace
+
+            def validate_char(value):
+                if type(value) is str:
+                    text = value.strip() if trim else value
+                    if text and len(text) <= max_length and not PROHIBITED_CHARACTERS.search(text):
+                        return text
+                return run_validation(value)
+            return validate_char
+
+        if type(field) is serializers.DecimalField and not field.validators and field.decimal_places is not None \
+                and field.max_digits is not None:
+            places, whole = field.decimal_places, field.max_digits - field.decimal_places
+            exponent = decimal.Decimal('.1') ** places
+            context = decimal.getcontext().copy()
+            context.prec = field.max_digits
+
+            def validate_decimal(value):
+                if type(value) is str:
+                    try:
+                        number = decimal.Decimal(value.strip())
+                    except decimal.InvalidOperation:
+                        return run_validation(value)
+                    if number.is_finite():
+                        _, digits, number_exponent = number.as_tuple()
+                        if -places <= number_exponent <= 0 and len(digits) + number_exponent <= whole:
+                            return number.quantize(exponent, rounding=field.rounding, context=context)
+                return run_validation(value)
+            return validate_decimal
+
+        return run_validation
@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from store.benchmarks import MODES, SCENARIOS, BenchmarkRunner, compare, dump, load
+
+
+class Command(BaseCommand):
+    help = 'Drive the books API through the Django test client and report latency, queries and throughput.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                            help='Scenario to run; repeat to run several. Defaults to all of them.')
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--warmup', type=int, default=20)
+        parser.add_argument('--concurrency', type=int, default=1)
+        parser.add_argument('--mode', choices=MODES, default='wsgi',
+                            help='wsgi: sync views on threads; asgi: sync views behind the ASGI handler; '
+                                 'asgi-async: the /async/ read views behind the ASGI handler.')
+        parser.add_argument('--page-size', type=int, default=50)
+        parser.add_argument('--cold-cache', action='store_true',
+                            help='Run with BOOK_CACHE_TIMEOUT=0, so no request is served from the response cache.')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--host', default='localhost', help='Host header; must be in ALLOWED_HOSTS.')
+        parser.add_argument('--conn-max-age', type=int,
+                            help='Override CONN_MAX_AGE and close connections between requests like the '
+                                 'request handler does; compare 0 with a positive value.')
+        parser.add_argument('--output', help='Write the results as JSON to this file.')
+        parser.add_argument('--compare', help='JSON results of a previous run to compare against.')
+
+    def handle(self, *args, **options):
+        runner = BenchmarkRunner(
+            requests=options['requests'],
+            warmup=options['warmup'],
+            concurrency=options['concurrency'],
+            page_size=options['page_size'],
+            cold_cache=options['cold_cache'],
+            seed=options['seed'],
+            host=options['host'],
+            conn_max_age=options['conn_max_age'],
+            mode=options['mode'],
+        )
+        if not runner.context['book_ids']:
+            raise CommandError('No books found; run generate_dataset first.')
+
+        results = runner.run(options['scenario'] or list(SCENARIOS))
+        self.report(results)
+
+        if options['output']:
+            dump(results, options['output'])
+            self.stdout.write(f'Results written to {options["output"]}')
+        if options['compare']:
+            self.stdout.write('')
+            for name, metric, old, new, change in compare(results, load(options['compare'])):
+                self.stdout.write(f'{name:<16} {metric:<15} {old:>10.2f} -> {new:>10.2f} ({change:+.1f}%)')
+
+    def report(self, results):
+        meta = results['meta']
+        self.stdout.write(f'{meta["vendor"]}, {meta["books"]} books, {meta["mode"]} x{meta["concurrency"]}, '
+                          f'CONN_MAX_AGE {meta["conn_max_age"]}, commit {meta["commit"]}')
+        self.stdout.write(f'{"scenario":<16} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} '
+                          f'{"queries":>8} {"req/s":>8} {"errors":>7}')
+        for name, result in results['scenarios'].items():
+            self.stdout.write(
+                f'{name:<16} {result["p50_ms"]:>8.2f} {result["p95_ms"]:>8.2f} {result["p99_ms"]:>8.2f} '
+                f'{result["queries_mean"]:>8.1f} {result["throughput_rps"]:>8.1f} {result["errors"]:>7}'
+            )
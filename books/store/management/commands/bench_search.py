@@ -0,0 +1,49 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from rest_framework.filters import SearchFilter
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from store.filters import BookSearchFilter
+from store.models import Book
+from store.views import BookViewSet
+
+
+class Command(BaseCommand):
+    help = 'Compare the stock SearchFilter with BookSearchFilter on the configured database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('terms', nargs='*', default=['tolkien', 'ring', 'x'])
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--limit', type=int, default=50)
+        parser.add_argument('--explain', action='store_true')
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory()
+        view = BookViewSet()
+        self.stdout.write(f'{connection.vendor}, {Book.objects.count()} books')
+
+        for term in options['terms']:
+            for backend, ordering in [(SearchFilter, 'id'), (BookSearchFilter, 'id'),
+                                      (BookSearchFilter, '-relevance')]:
+                request = Request(factory.get('/book/', {'search': term}))
+                queryset = backend().filter_queryset(request, Book.objects.all(), view)
+                queryset = queryset.order_by(ordering).values_list('id', flat=True)[:options['limit']]
+
+                timings = []
+                for _ in range(options['repeat']):
+                    start = time.perf_counter()
+                    matches = len(list(queryset.all()))
+                    timings.append((time.perf_counter() - start) * 1000)
+
+                timings.sort()
+                self.stdout.write(
+                    f'{term!r:>12} {backend.__name__:>16} order={ordering:<11} matches={matches:<5} '
+                    f'median={statistics.median(timings):.2f}ms '
+                    f'p95={timings[int(len(timings) * 0.95) - 1]:.2f}ms'
+                )
+                if options['explain']:
+                    self.stdout.write(queryset.explain())
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from store.benchmarks import bench_serializers
+
+
+class Command(BaseCommand):
+    help = 'Compare BookSerializer and JSONRenderer with FastBookSerializer and FastJSONRenderer per row.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=1000, help='Books serialized per run.')
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        results = bench_serializers(limit=options['limit'], repeat=options['repeat'])
+        if not results['rows']:
+            raise CommandError('No books found; run generate_dataset first.')
+
+        self.stdout.write(f'{results["rows"]} books, identical output: {results["identical"]}')
+        for name in ('drf', 'fast'):
+            self.stdout.write(f'{name:<6} median={results[name]["median_ms"]:.2f}ms '
+                              f'per_row={results[name]["per_row_us"]:.1f}us')
+        self.stdout.write(f'speedup x{results["drf"]["per_row_us"] / results["fast"]["per_row_us"]:.1f}')
+        if not results['identical']:
+            raise CommandError('FastBookSerializer output differs from BookSerializer.')
@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store.similarity import build_neighbours
+
+
+class Command(BaseCommand):
+    help = ('Compute the "readers also liked" neighbours served by /book/{id}/similar/; after the first run '
+            'only books with new activity and the books co-read with them are recounted unless --full is given.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Recount every book.')
+        parser.add_argument('--processes', type=int, default=1,
+                            help='Worker processes, each counting a shard of books at a time.')
+        parser.add_argument('--shards', type=int,
+                            help='Shards of books, one per process by default. Memory held while counting '
+                                 'scales with the co-read pairs of a shard, so more shards bound it.')
+        parser.add_argument('--top-k', type=int, help='Neighbours kept per book.')
+        parser.add_argument('--min-count', type=int, help='Common readers a neighbour needs.')
+        parser.add_argument('--max-basket', type=int, help='Skip users who are readers of more books than this.')
+        parser.add_argument('--chunk-size', type=int, help='Users whose relations are read per query.')
+
+    def handle(self, *args, **options):
+        if options['processes'] < 1:
+            raise CommandError('--processes must be at least 1.')
+        for name in ('shards', 'top_k', 'chunk_size'):
+            if options[name] is not None and options[name] < 1:
+                raise CommandError(f'--{name.replace("_", "-")} must be at least 1.')
+        if options['min_count'] is not None and options['min_count'] < 0:
+            raise CommandError('--min-count must not be negative.')
+
+        started = time.perf_counter()
+        build = build_neighbours(full=options['full'], processes=options['processes'],
+                                 shards=options['shards'], top_k=options['top_k'],
+                                 min_count=options['min_count'], max_basket=options['max_basket'],
+                                 chunk_size=options['chunk_size'])
+        kind = 'full' if build.full else 'incremental'
+        self.stdout.write(self.style.SUCCESS(
+            f'Built neighbours of {build.books} books ({kind}) in {time.perf_counter() - started:.1f}s'
+        ))
@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from store.cache import bump_books
+from store.models import Book
+from store.services import lock_books, rebuild_author_stats
+
+
+class Command(BaseCommand):
+    help = 'Compare denormalized book counters with UserBookRelation rows and optionally repair drift.'
+    counters = ['likes_count', 'readers_count']
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repair', action='store_true', help='Write the recomputed values back.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = 0
+        drifted = 0
+        books = Book.objects.order_by('id').annotate(
+            actual_likes_count=Count('userbookrelation', filter=Q(userbookrelation__like=True)),
+            actual_readers_count=Count('userbookrelation'),
+        ).only('id', 'updated_at', *self.counters)
+
+        while True:
+            with transaction.atomic():
+                if options['repair']:
+                    # Counted under the row locks, so no concurrent delta is overwritten.
+                    batch = list(books.filter(id__in=lock_books(last_id, batch_size)))
+                else:
+                    batch = list(books.filter(id__gt=last_id)[:batch_size])
+                if not batch:
+                    break
+
+                stale = []
+                for book in batch:
+                    drifted_counters = []
+                    for counter in self.counters:
+                        stored, actual = getattr(book, counter), getattr(book, f'actual_{counter}')
+                        if stored != actual:
+                            drifted_counters.append(f'{counter} {stored} != {actual}')
+                            setattr(book, counter, actual)
+                    if drifted_counters:
+                        book.updated_at = timezone.now()
+                        self.stdout.write(f'Book {book.id}: {", ".join(drifted_counters)}')
+                        stale.append(book)
+
+                if stale and options['repair']:
+                    Book.objects.bulk_update(stale, [*self.counters, 'updated_at'])
+                    bump_books(book.id for book in stale)
+
+            drifted += len(stale)
+            last_id = batch[-1].id
+
+        if options['repair']:
+            rebuild_author_stats()
+
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS('All counters are consistent'))
+        elif options['repair']:
+            self.stdout.write(self.style.SUCCESS(f'Repaired {drifted} books'))
+        else:
+            self.stdout.write(self.style.WARNING(f'Found {drifted} books with drifted counters'))
@@ -0,0 +1,140 @@
+import random
+import time
+from array import array
+from bisect import bisect_left
+from itertools import accumulate
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from store.benchmarks import WORDS
+from store.cache import bump_catalogue
+from store.models import Book, UserBookRelation
+from store.services import HISTOGRAM_FIELDS, rebuild_author_stats
+
+RATE_WEIGHTS = (5, 10, 20, 35, 30)
+
+
+class Command(BaseCommand):
+    help = 'Generate a synthetic catalogue with skewed book popularity for load testing.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=1_000_000)
+        parser.add_argument('--users', type=int, default=100_000)
+        parser.add_argument('--relations', type=int, default=20_000_000)
+        parser.add_argument('--authors', type=int, default=50_000)
+        parser.add_argument('--skew', type=float, default=1.1, help='Zipf exponent of book popularity.')
+        parser.add_argument('--batch-size', type=int, default=10_000)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.started = time.perf_counter()
+        rng = random.Random(options['seed'])
+
+        # Popularity rank -> book index, so popular books are spread over the id range.
+        self.ranked_books = list(range(options['books']))
+        rng.shuffle(self.ranked_books)
+        self.cumulative_weights = list(accumulate(1 / (rank + 1) ** options['skew']
+                                                  for rank in range(options['books'])))
+
+        counters = self.count_relations()
+        user_ids = self.create_users()
+        book_ids = self.create_books(rng, counters)
+        self.create_relations(user_ids, book_ids)
+        rebuild_author_stats(self.options['batch_size'])
+        bump_catalogue()
+
+        self.stdout.write(self.style.SUCCESS(f'Done in {time.perf_counter() - self.started:.1f}s'))
+
+    def user_relations(self, user_index):
+        # Each user's relations come from a dedicated seed, so the counting pass
+        # and the insert pass generate exactly the same rows.
+        rng = random.Random(self.options['seed'] * 1_000_003 + user_index)
+        mean = self.options['relations'] / self.options['users']
+        wanted = min(int(rng.expovariate(1 / mean)) if mean else 0, self.options['books'])
+        total = self.cumulative_weights[-1]
+
+        books = set()
+        for _ in range(wanted * 2):
+            if len(books) >= wanted:
+                break
+            rank = bisect_left(self.cumulative_weights, rng.random() * total)
+            books.add(self.ranked_books[min(rank, len(self.ranked_books) - 1)])
+
+        for book_index in sorted(books):
+            rate = rng.choices(range(1, 6), RATE_WEIGHTS)[0] if rng.random() < 0.5 else None
+            yield book_index, rng.random() < 0.3, rng.random() < 0.1, rate
+
+    def count_relations(self):
+        books = self.options['books']
+        counters = {name: array('L', bytes(array('L').itemsize * books))
+                    for name in ('likes', 'readers', 'rating_sum', 'rating_count', *HISTOGRAM_FIELDS.values())}
+
+        for user_index in range(self.options['users']):
+            for book_index, like, _, rate in self.user_relations(user_index):
+                counters['readers'][book_index] += 1
+                counters['likes'][book_index] += like
+                if rate is not None:
+                    counters['rating_sum'][book_index] += rate
+                    counters['rating_count'][book_index] += 1
+                    counters[HISTOGRAM_FIELDS[rate]][book_index] += 1
+        self.progress('Counted relations')
+        return counters
+
+    def create_users(self):
+        user_ids = array('q')
+        batch_size = self.options['batch_size']
+        for start in range(0, self.options['users'], batch_size):
+            users = [User(username=f'bench_user_{index}', password='!')
+                     for index in range(start, min(start + batch_size, self.options['users']))]
+            user_ids.extend(user.id for user in User.objects.bulk_create(users))
+            self.progress(f'Users: {len(user_ids)}')
+        return user_ids
+
+    def create_books(self, rng, counters):
+        book_ids = array('q')
+        batch_size = self.options['batch_size']
+        for start in range(0, self.options['books'], batch_size):
+            books = []
+            for index in range(start, min(start + batch_size, self.options['books'])):
+                rating_count = counters['rating_count'][index]
+                books.append(Book(
+                    name=f'{rng.choice(WORDS).title()} {rng.choice(WORDS)} {index}',
+                    price=round(rng.uniform(1, 200), 2),
+                    author_name=f'Author {rng.randrange(self.options["authors"])}',
+                    rating=round(counters['rating_sum'][index] / rating_count, 2) if rating_count else None,
+                    rating_sum=counters['rating_sum'][index],
+                    rating_count=rating_count,
+                    likes_count=counters['likes'][index],
+                    readers_count=counters['readers'][index],
+                    **{field: counters[field][index] for field in HISTOGRAM_FIELDS.values()},
+                ))
+            book_ids.extend(book.id for book in Book.objects.bulk_create(books))
+            self.progress(f'Books: {len(book_ids)}')
+        return book_ids
+
+    def create_relations(self, user_ids, book_ids):
+        batch = []
+        self.relations_created = 0
+        for user_index, user_id in enumerate(user_ids):
+            for book_index, like, in_bookmarks, rate in self.user_relations(user_index):
+                batch.append(UserBookRelation(user_id=user_id, book_id=book_ids[book_index],
+                                              like=like, in_bookmarks=in_bookmarks, rate=rate))
+            if len(batch) >= self.options['batch_size']:
+                self.insert_relations(batch)
+                batch = []
+        self.insert_relations(batch)
+
+    def insert_relations(self, batch):
+        if not batch:
+            return
+
+        with transaction.atomic():
+            UserBookRelation.objects.bulk_create(batch)
+        self.relations_created += len(batch)
+        self.progress(f'Relations: {self.relations_created}')
+
+    def progress(self, message):
+        self.stdout.write(f'[{time.perf_counter() - self.started:8.1f}s] {message}')
@@ -0,0 +1,54 @@
+import io
+import json
+import os
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from store.imports import READERS, BookImporter
+
+
+class Command(BaseCommand):
+    help = 'Import books from a CSV or NDJSON file with name, price and author_name columns.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Input file, or '-' for stdin.")
+        parser.add_argument('--format', choices=sorted(READERS),
+                            help='Input format; taken from the file extension by default.')
+        parser.add_argument('--owner', help='Username set as the owner of every imported book.')
+        parser.add_argument('--batch-size', type=int, help='Rows validated and inserted per transaction.')
+        parser.add_argument('--errors', help='Write every rejected row as NDJSON to this file.')
+
+    def handle(self, *args, **options):
+        input_format = options['format'] or os.path.splitext(options['path'])[1].lstrip('.').lower()
+        if input_format not in READERS:
+            raise CommandError('Pass --format, the format cannot be told from the file name.')
+
+        owner = None
+        if options['owner']:
+            try:
+                owner = User.objects.get(username=options['owner'])
+            except User.DoesNotExist:
+                raise CommandError(f'Unknown user {options["owner"]!r}.')
+
+        importer = BookImporter(owner=owner, batch_size=options['batch_size'],
+                                max_errors=sys.maxsize if options['errors'] else 0, progress=self.progress)
+        # Undecodable bytes are rejected by the field validators, see imports.decode_lines().
+        text = {'encoding': 'utf-8', 'errors': 'surrogateescape', 'newline': ''}
+        if options['path'] == '-':
+            importer.run(READERS[input_format](io.TextIOWrapper(sys.stdin.buffer, **text)))
+        else:
+            with open(options['path'], **text) as file:
+                importer.run(READERS[input_format](file))
+
+        if options['errors']:
+            with open(options['errors'], 'w') as file:
+                for error in importer.errors:
+                    file.write(json.dumps(error) + '\n')
+        message = f'Imported {importer.imported} of {importer.rows} rows, {importer.error_count} rejected'
+        self.stdout.write(self.style.SUCCESS(message) if not importer.error_count else self.style.WARNING(message))
+
+    def progress(self, importer):
+        self.stdout.write(f'{importer.rows} rows, {importer.imported} imported, {importer.error_count} rejected, '
+                          f'{importer.rate:.0f} rows/s')
@@ -0,0 +1,27 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from store.services import flush_rating_queue
+
+
+class Command(BaseCommand):
+    help = 'Apply queued rating changes, coalescing them into one UPDATE per book.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=settings.RATING_QUEUE_FLUSH_INTERVAL,
+                            help='Seconds to sleep between flushes when the queue is drained.')
+        parser.add_argument('--batch-size', type=int, default=settings.RATING_QUEUE_BATCH_SIZE)
+        parser.add_argument('--once', action='store_true', help='Drain the queue and exit.')
+
+    def handle(self, *args, **options):
+        while True:
+            processed = flush_rating_queue(options['batch_size'])
+            if processed:
+                self.stdout.write(f'Applied {processed} queued rating changes')
+                continue
+
+            if options['once']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,69 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Avg, Count, Sum
+from django.utils import timezone
+
+from store.cache import bump_books
+from store.models import Book
+from store.services import HISTOGRAM_FIELDS, flush_rating_queue, histogram_aggregates, lock_books, \
+    rebuild_author_stats
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the denormalized rating counters of every book from UserBookRelation rows, then AuthorStats.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        while flush_rating_queue():
+            pass
+
+        last_id = 0
+        checked = 0
+        rebuilt = 0
+        rating_field = Book._meta.get_field('rating')
+        fields = ['rating', 'rating_sum', 'rating_count', *HISTOGRAM_FIELDS.values()]
+
+        while True:
+            with transaction.atomic():
+                # The rows are locked before the ratings are read, so no delta lands in between.
+                book_ids = lock_books(last_id, batch_size)
+                if not book_ids:
+                    break
+
+                books = Book.objects.filter(id__in=book_ids).order_by('id').annotate(
+                    actual_rating=Avg('userbookrelation__rate'),
+                    actual_sum=Sum('userbookrelation__rate'),
+                    actual_count=Count('userbookrelation__rate'),
+                    **{f'actual_{field}': count
+                       for field, count in histogram_aggregates('userbookrelation__').items()},
+                ).only('id', *fields)
+
+                now = timezone.now()
+                stale = []
+                for book in books:
+                    # Rounded like the column, so only drifted books are written.
+                    actual = {
+                        'rating': rating_field.to_python(book.actual_rating),
+                        'rating_sum': book.actual_sum or 0,
+                        'rating_count': book.actual_count,
+                        **{field: getattr(book, f'actual_{field}') for field in HISTOGRAM_FIELDS.values()},
+                    }
+                    if any(getattr(book, field) != value for field, value in actual.items()):
+                        for field, value in actual.items():
+                            setattr(book, field, value)
+                        book.updated_at = now
+                        stale.append(book)
+
+                if stale:
+                    Book.objects.bulk_update(stale, [*fields, 'updated_at'])
+                    bump_books(book.id for book in stale)
+
+            last_id = book_ids[-1]
+            checked += len(book_ids)
+            rebuilt += len(stale)
+
+        rebuild_author_stats()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt ratings for {rebuilt} of {checked} books'))
@@ -0,0 +1,58 @@
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+
+
+class Histogram:
+    def __init__(self, name, documentation, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._series = defaultdict(lambda: [[0] * (len(buckets) + 1), 0.0])
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counts, _ = series = self._series[key]
+            counts[bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def collect(self):
+        with self._lock:
+            return {key: (list(counts), total) for key, (counts, total) in self._series.items()}
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        for key, (counts, total) in sorted(self.collect().items()):
+            labels = ','.join(f'{name}="{value}"' for name, value in key)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf', ), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{labels}}} {total}')
+            lines.append(f'{self.name}_count{{{labels}}} {cumulative}')
+        return '\n'.join(lines)
+
+
+request_duration = Histogram('store_request_duration_seconds',
+                             'Total time spent handling the request.', LATENCY_BUCKETS)
+db_duration = Histogram('store_request_db_duration_seconds',
+                        'Time spent executing SQL queries during the request.', LATENCY_BUCKETS)
+render_duration = Histogram('store_request_render_duration_seconds',
+                            'Time spent rendering the response body.', LATENCY_BUCKETS)
+query_count = Histogram('store_request_queries',
+                        'Number of SQL queries executed during the request.', QUERY_BUCKETS)
+
+REGISTRY = (request_duration, db_duration, render_duration, query_count)
+
+
+def render_metrics():
+    return '\n'.join(histogram.render() for histogram in REGISTRY) + '\n'
@@ -0,0 +1,141 @@
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from rest_framework.permissions import SAFE_METHODS
+
+from store import metrics
+from store.routers import pin_to_primary
+
+logger = logging.getLogger(__name__)
+
+_recorders = ContextVar('store_query_recorders', default=())
+
+
+class QueryRecorder:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def add(self, duration):
+        self.duration += duration
+        self.count += 1
+
+
+def record_queries(execute, sql, params, many, context):
+    """
+    Execute wrapper installed on every connection by StoreConfig.ready().
+
+    Async views run their queries in a worker thread with its own
+    connection, so the active recorders are looked up in a context variable,
+    which is copied into that thread, rather than wrapped per connection.
+    """
+    recorders = _recorders.get()
+    if not recorders:
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - start
+        for recorder in recorders:
+            recorder.add(duration)
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    if record_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_queries)
+
+
+@contextmanager
+def recording():
+    """Count the queries run in this context, including by nested recorders."""
+    recorder = QueryRecorder()
+    token = _recorders.set(_recorders.get() + (recorder, ))
+    try:
+        yield recorder
+    finally:
+        _recorders.reset(token)
+
+
+class QueryMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        start = time.perf_counter()
+        with recording() as recorder:
+            response = self.get_response(request)
+        self.observe(request, recorder, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        with recording() as recorder:
+            response = await self.get_response(request)
+        self.observe(request, recorder, time.perf_counter() - start)
+        return response
+
+    def observe(self, request, recorder, duration):
+        match = getattr(request, 'resolver_match', None)
+        labels = {'endpoint': match.view_name if match else 'unresolved', 'method': request.method}
+        metrics.request_duration.observe(duration, **labels)
+        metrics.db_duration.observe(recorder.duration, **labels)
+        metrics.query_count.observe(recorder.count, **labels)
+
+        budget = settings.STORE_QUERY_BUDGETS.get(labels['endpoint'], settings.STORE_QUERY_BUDGET)
+        if recorder.count > budget:
+            logger.warning('%s %s ran %d queries (budget %d), possible N+1',
+                           request.method, request.path, recorder.count, budget)
+
+    def process_template_response(self, request, response):
+        start = time.perf_counter()
+        match = request.resolver_match
+        labels = {'endpoint': match.view_name, 'method': request.method}
+        response.add_post_render_callback(
+            lambda rendered: metrics.render_duration.observe(time.perf_counter() - start, **labels)
+        )
+        return response
+
+
+class PrimaryPinMiddleware:
+    """Pin users to the primary database after a successful write request."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        response = self.get_response(request)
+        if self.is_write(request, response):
+            pin_to_primary(request.user)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if self.is_write(request, response):
+            # Resolving the lazy user loads the session from the database.
+            await sync_to_async(pin_to_primary)(request.user)
+        return response
+
+    @staticmethod
+    def is_write(request, response):
+        return request.method not in SAFE_METHODS and response.status_code < 400 and hasattr(request, 'user')
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.4 on 2026-10-17 14:48
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def fill_rating_counters(apps, schema_editor):
+    Book = apps.get_model('store', 'Book')
+    books = Book.objects.annotate(actual_sum=Sum('userbookrelation__rate'),
+                                  actual_count=Count('userbookrelation__rate'))
+    for book in books.iterator():
+        book.rating_sum = book.actual_sum or 0
+        book.rating_count = book.actual_count
+        book.save(update_fields=['rating_sum', 'rating_count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0007_book_rating'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_rating_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.4 on 2026-10-17 14:49
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def fill_likes_count(apps, schema_editor):
+    Book = apps.get_model('store', 'Book')
+    books = Book.objects.annotate(actual_likes=Count('userbookrelation', filter=Q(userbookrelation__like=True)))
+    for book in books.iterator():
+        book.likes_count = book.actual_likes
+        book.save(update_fields=['likes_count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0008_book_rating_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_likes_count, migrations.RunPython.noop),
+    ]
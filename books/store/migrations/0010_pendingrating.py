@@ -0,0 +1,23 @@
+# Generated by Django 4.2.4 on 2026-10-17 14:49
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0009_book_likes_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingRating',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('old_rate', models.PositiveSmallIntegerField(null=True)),
+                ('new_rate', models.PositiveSmallIntegerField(null=True)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='store.book')),
+            ],
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.4 on 2026-10-17 14:51
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_readers_count(apps, schema_editor):
+    Book = apps.get_model('store', 'Book')
+    UserBookRelation = apps.get_model('store', 'UserBookRelation')
+    # One UPDATE with a correlated count instead of a save() per book.
+    readers = UserBookRelation.objects.filter(book=OuterRef('pk')).order_by().values('book').annotate(
+        count=Count('id'),
+    ).values('count')
+    Book.objects.update(readers_count=Coalesce(Subquery(readers), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0011_book_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='readers_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_readers_count, migrations.RunPython.noop),
+    ]
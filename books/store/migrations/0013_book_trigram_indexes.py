@@ -0,0 +1,27 @@
+# Generated by Django 4.2.4 on 2026-10-17 14:53
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+from store.operations import AddPostgresIndexConcurrently
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('store', '0012_book_readers_count'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        AddPostgresIndexConcurrently(
+            model_name='book',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='store_book_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+        AddPostgresIndexConcurrently(
+            model_name='book',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['author_name'], name='store_book_author_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+    ]
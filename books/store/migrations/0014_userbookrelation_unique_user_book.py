@@ -0,0 +1,47 @@
+# Generated by Django 4.2.4 on 2026-10-17 14:55
+
+from django.db import migrations, models
+from django.db.models import Avg, Count, Min, Q, Sum
+
+
+def remove_duplicate_relations(apps, schema_editor):
+    Book = apps.get_model('store', 'Book')
+    UserBookRelation = apps.get_model('store', 'UserBookRelation')
+
+    duplicates = (UserBookRelation.objects.values('user_id', 'book_id')
+                  .annotate(relations=Count('id'), keep_id=Min('id')).filter(relations__gt=1))
+    book_ids = set()
+    for duplicate in duplicates:
+        UserBookRelation.objects.filter(user_id=duplicate['user_id'], book_id=duplicate['book_id']) \
+            .exclude(id=duplicate['keep_id']).delete()
+        book_ids.add(duplicate['book_id'])
+
+    books = Book.objects.filter(id__in=book_ids).annotate(
+        actual_rating=Avg('userbookrelation__rate'),
+        actual_sum=Sum('userbookrelation__rate'),
+        actual_count=Count('userbookrelation__rate'),
+        actual_likes=Count('userbookrelation', filter=Q(userbookrelation__like=True)),
+        actual_readers=Count('userbookrelation'),
+    )
+    for book in books:
+        book.rating = book.actual_rating
+        book.rating_sum = book.actual_sum or 0
+        book.rating_count = book.actual_count
+        book.likes_count = book.actual_likes
+        book.readers_count = book.actual_readers
+        book.save(update_fields=['rating', 'rating_sum', 'rating_count', 'likes_count', 'readers_count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0013_book_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_relations, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='userbookrelation',
+            constraint=models.UniqueConstraint(fields=('user', 'book'), name='store_userbookrelation_user_book_uniq'),
+        ),
+    ]
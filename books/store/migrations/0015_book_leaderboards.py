@@ -0,0 +1,30 @@
+# Generated by Django 4.2.4 on 2026-10-17 15:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0014_userbookrelation_unique_user_book'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='trending_score',
+            field=models.FloatField(default=None, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['-rating', 'id'], name='store_book_rating_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['-likes_count', 'id'], name='store_book_likes_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['-trending_score', 'id'], name='store_book_trending_id_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.4 on 2026-10-17 15:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0015_book_leaderboards'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='userbookrelation',
+            index=models.Index(condition=models.Q(('in_bookmarks', True)), fields=['user', 'book'], name='store_ubr_user_bookmarks_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userbookrelation',
+            index=models.Index(condition=models.Q(('like', True)), fields=['user', 'book'], name='store_ubr_user_likes_idx'),
+        ),
+    ]
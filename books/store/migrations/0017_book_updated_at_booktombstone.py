@@ -0,0 +1,34 @@
+# Generated by Django 4.2.4 on 2026-10-17 15:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0016_userbookrelation_shelf_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('book_id', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['updated_at', 'id'], name='store_book_updated_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booktombstone',
+            index=models.Index(fields=['deleted_at', 'book_id'], name='store_tombstone_deleted_idx'),
+        ),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 4.2.4 on 2026-10-17 15:40
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def fill_rating_histogram(apps, schema_editor):
+    Book = apps.get_model('store', 'Book')
+    UserBookRelation = apps.get_model('store', 'UserBookRelation')
+    relations = UserBookRelation.objects.filter(book=OuterRef('pk')).order_by().values('book')
+    # One UPDATE with a correlated count per rate instead of a save() per book.
+    Book.objects.update(**{
+        f'rating_{rate}': Coalesce(Subquery(relations.filter(rate=rate).annotate(count=Count('id')).values('count')), 0)
+        for rate in range(1, 6)
+    })
+
+
+def fill_author_stats(apps, schema_editor):
+    Book = apps.get_model('store', 'Book')
+    AuthorStats = apps.get_model('store', 'AuthorStats')
+    rows = Book.objects.order_by().values('author_name').annotate(
+        books=Count('id'), likes=Sum('likes_count'), total=Sum('rating_sum'), count=Sum('rating_count'),
+    )
+    AuthorStats.objects.bulk_create([
+        AuthorStats(author_name=row['author_name'], books_count=row['books'], likes_count=row['likes'],
+                    rating_sum=row['total'], rating_count=row['count'],
+                    rating=round(row['total'] / row['count'], 2) if row['count'] else None)
+        for row in rows.iterator()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0017_book_updated_at_booktombstone'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthorStats',
+            fields=[
+                ('author_name', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('books_count', models.PositiveIntegerField(default=0)),
+                ('likes_count', models.PositiveIntegerField(default=0)),
+                ('rating_sum', models.PositiveIntegerField(default=0)),
+                ('rating_count', models.PositiveIntegerField(default=0)),
+                ('rating', models.DecimalField(decimal_places=2, default=None, max_digits=3, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating_1',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating_2',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating_3',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating_4',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating_5',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_rating_histogram, migrations.RunPython.noop),
+        migrations.RunPython(fill_author_stats, migrations.RunPython.noop),
+    ]
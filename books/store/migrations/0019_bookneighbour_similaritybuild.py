@@ -0,0 +1,35 @@
+# Generated by Django 4.2.4 on 2026-10-17 15:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0018_book_rating_histogram_authorstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarityBuild',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField()),
+                ('full', models.BooleanField()),
+                ('books', models.PositiveIntegerField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='BookNeighbour',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('book', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='store.book')),
+                ('neighbour', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='neighbour_of', to='store.book')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['book', '-score'], name='store_neighbour_book_score_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.4 on 2026-10-17 16:20
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.db import migrations
+
+from store.operations import AddPostgresIndexConcurrently, RemovePostgresIndexConcurrently
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('store', '0019_bookneighbour_similaritybuild'),
+    ]
+
+    operations = [
+        RemovePostgresIndexConcurrently(
+            model_name='book',
+            name='store_book_name_trgm_idx',
+        ),
+        RemovePostgresIndexConcurrently(
+            model_name='book',
+            name='store_book_author_trgm_idx',
+        ),
+        AddPostgresIndexConcurrently(
+            model_name='book',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('name'), name='gin_trgm_ops'), name='store_book_name_trgm_idx'),
+        ),
+        AddPostgresIndexConcurrently(
+            model_name='book',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('author_name'), name='gin_trgm_ops'), name='store_book_author_trgm_idx'),
+        ),
+    ]
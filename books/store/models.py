@@ -1,5 +1,7 @@
 from django.contrib.auth.models import User
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.db import models, transaction
+from django.db.models.functions import Upper
 
 
 class Book(models.Model):
@@ -9,15 +11,138 @@ class Book(models.Model):
     owner = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='my_books')
     readers = models.ManyToManyField(User, through='UserBookRelation', related_name='books')
     rating = models.DecimalField(max_digits=3, decimal_places=2, null=True, default=None)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    # Number of ratings per RATE_CHOICES value.
+    rating_1 = models.PositiveIntegerField(default=0)
+    rating_2 = models.PositiveIntegerField(default=0)
+    rating_3 = models.PositiveIntegerField(default=0)
+    rating_4 = models.PositiveIntegerField(default=0)
+    rating_5 = models.PositiveIntegerField(default=0)
+    likes_count = models.PositiveIntegerField(default=0)
+    readers_count = models.PositiveIntegerField(default=0)
+    # log of the activity weighted by 2 ** (t / half-life), see services.trending_expression().
+    trending_score = models.FloatField(null=True, default=None)
+    # Also set by the counter updates; /book/changes/ pages through it.
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['price', 'id'], name='store_book_price_id_idx'),
+            models.Index(fields=['author_name', 'id'], name='store_book_author_id_idx'),
+            models.Index(fields=['-rating', 'id'], name='store_book_rating_id_idx'),
+            models.Index(fields=['-likes_count', 'id'], name='store_book_likes_id_idx'),
+            models.Index(fields=['-trending_score', 'id'], name='store_book_trending_id_idx'),
+            models.Index(fields=['updated_at', 'id'], name='store_book_updated_id_idx'),
+            # On the UPPER() expressions `icontains` compiles to, which SearchFilter uses.
+            GinIndex(OpClass(Upper('name'), name='gin_trgm_ops'), name='store_book_name_trgm_idx'),
+            GinIndex(OpClass(Upper('author_name'), name='gin_trgm_ops'), name='store_book_author_trgm_idx'),
+        ]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Read from __dict__ so instances loaded with only() stay lazy.
+        self.old_author_name = self.__dict__.get('author_name')
 
     def __str__(self):
         return f'{self.name}'
 
+    def save(self, *args, **kwargs):
+        from store.services import refresh_author_stats, update_author_stats
+
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'updated_at' not in update_fields:
+            kwargs['update_fields'] = [*update_fields, 'updated_at']
+
+        is_creating = self._state.adding
+        old_author_name = self.old_author_name
+        if is_creating or (old_author_name is not None and old_author_name != self.author_name):
+            with transaction.atomic(savepoint=False):
+                super().save(*args, **kwargs)
+                if is_creating:
+                    update_author_stats([(self.author_name, 1, self.likes_count, self.rating_sum, self.rating_count)])
+                else:
+                    update_author_stats([(self.author_name, 0, 0, 0, 0)])
+                    refresh_author_stats([old_author_name, self.author_name])
+        else:
+            super().save(*args, **kwargs)
+        self.old_author_name = self.__dict__.get('author_name')
+
+
+class AuthorStats(models.Model):
+    """
+    Per-author totals, kept in step with Book saves; counter updates add
+    to them after their transaction commits.
+    Books inserted without Book.save() are counted by
+    services.update_author_stats() or `manage.py rebuild_ratings`.
+    """
+    author_name = models.CharField(max_length=255, primary_key=True)
+    books_count = models.PositiveIntegerField(default=0)
+    likes_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    rating = models.DecimalField(max_digits=3, decimal_places=2, null=True, default=None)
+
+    def __str__(self):
+        return self.author_name
+
+
+class BookNeighbour(models.Model):
+    """
+    One of the BOOK_SIMILAR_TOP_K books most often liked by readers of
+    `book`, written by `manage.py build_similar_books`. There are no foreign
+    key constraints, so deleting a book does not touch this table; /similar/
+    joins the neighbours to Book and the next build drops the stale rows.
+    """
+    book = models.ForeignKey(Book, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False,
+                             related_name='+')
+    neighbour = models.ForeignKey(Book, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False,
+                                  related_name='neighbour_of')
+    # Cosine similarity of the two books' reader sets.
+    score = models.FloatField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['book', '-score'], name='store_neighbour_book_score_idx'),
+        ]
+
+
+class SimilarityBuild(models.Model):
+    """A finished build_similar_books run; the next incremental run starts from `started_at`."""
+    started_at = models.DateTimeField()
+    full = models.BooleanField()
+    books = models.PositiveIntegerField()
+
+
+class BookTombstone(models.Model):
+    """A deleted book, so /book/changes/ can tell clients to drop it."""
+    book_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['deleted_at', 'book_id'], name='store_tombstone_deleted_idx'),
+        ]
+
+
+class UserBookRelationQuerySet(models.QuerySet):
+    def delete(self):
+        # Deleting a book or a user removes its relations without this, see
+        # services.remove_user_relation_counters().
+        from store.services import uncount_relations
+
+        with transaction.atomic():
+            rows = list(self.select_for_update().values_list('book_id', 'like', 'rate'))
+            result = super().delete()
+            uncount_relations(rows)
+        return result
+
 
 class UserBookRelation(models.Model):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.old_rate = self.rate
+        self.old_like = self.like
 
     RATE_CHOICES = (
         (1, 'Ok'),
@@ -33,14 +158,52 @@ class UserBookRelation(models.Model):
     in_bookmarks = models.BooleanField(default=False)
     rate = models.PositiveSmallIntegerField(choices=RATE_CHOICES, null=True)
 
+    objects = UserBookRelationQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'book'], name='store_userbookrelation_user_book_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'book'], condition=models.Q(in_bookmarks=True),
+                         name='store_ubr_user_bookmarks_idx'),
+            models.Index(fields=['user', 'book'], condition=models.Q(like=True),
+                         name='store_ubr_user_likes_idx'),
+        ]
+
     def __str__(self):
         return f'{self.user.username}: {self.book}, Rate: {self.rate}'
 
     def save(self, *args, **kwargs):
+        from store.services import update_likes, update_rating, update_readers
+
         is_creating = not self.pk
+        old_rate = None if is_creating else self.old_rate
+        old_like = False if is_creating else self.old_like
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+            if is_creating:
+                update_readers(self.book_id, 1)
+            if old_rate != self.rate:
+                update_rating(self.book_id, old_rate, self.rate)
+            if old_like != self.like:
+                update_likes(self.book_id, old_like, self.like)
+
+        self.old_rate = self.rate
+        self.old_like = self.like
+
+    def delete(self, *args, **kwargs):
+        from store.services import uncount_relations
 
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            uncount_relations([(self.book_id, self.old_like, self.old_rate)])
+        return result
 
-        if self.old_rate != self.rate or is_creating:
-            from store.services import set_rating
-            set_rating(self.book)
+
+class PendingRating(models.Model):
+    book = models.ForeignKey(Book, on_delete=models.CASCADE)
+    old_rate = models.PositiveSmallIntegerField(null=True)
+    new_rate = models.PositiveSmallIntegerField(null=True)
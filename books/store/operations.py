@@ -0,0 +1,21 @@
+from django.contrib.postgres.operations import AddIndexConcurrently, RemoveIndexConcurrently
+
+
+class PostgresOnly:
+    """GIN/trigram indexes only exist on PostgreSQL; other backends keep the state change only."""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+class AddPostgresIndexConcurrently(PostgresOnly, AddIndexConcurrently):
+    """CREATE INDEX CONCURRENTLY, so writes to the table are not blocked; needs `atomic = False`."""
+
+
+class RemovePostgresIndexConcurrently(PostgresOnly, RemoveIndexConcurrently):
+    """DROP INDEX CONCURRENTLY; needs `atomic = False`."""
@@ -0,0 +1,175 @@
+import base64
+import binascii
+import json
+from collections import OrderedDict
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def positive_int(value, cutoff=None):
+    """Parse a query parameter as an integer above zero, capped at `cutoff`; raise ValueError otherwise."""
+    value = int(value)
+    if value <= 0:
+        raise ValueError(value)
+    if cutoff:
+        return min(value, cutoff)
+    return value
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination over an arbitrary ordering with an `id` tiebreaker.
+
+    The cursor stores the ordering values of the boundary row, so every page
+    is fetched with a `WHERE (f1, ..., id) > (v1, ..., vn)` style seek that
+    a composite index can answer regardless of how deep the page is. The
+    tiebreaker follows the direction of the first field, so the index is
+    scanned one way. Every list is paginated, at most `max_page_size` rows
+    a page. Ordering fields must be non-nullable.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = 50
+    max_page_size = 500
+    ordering = ('id',)
+    tiebreaker = 'id'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.set_page(list(self.get_page_queryset(queryset, request, view)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        return self.set_page([row async for row in self.get_page_queryset(queryset, request, view)])
+
+    def get_page_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(request, queryset, view)
+
+        cursor = self.decode_cursor(request)
+        if cursor is None:
+            self.position, self.reverse = None, False
+        else:
+            self.position, self.reverse = cursor
+
+        ordering = self._reverse(self.ordering) if self.reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if self.position is not None:
+            queryset = queryset.filter(self._seek(ordering, self.position))
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, results):
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+
+        if self.reverse:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.position is not None
+
+        self.page = results
+        return results
+
+    def get_page_size(self, request):
+        try:
+            return positive_int(request.query_params[self.page_size_query_param], cutoff=self.max_page_size)
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def get_ordering(self, request, queryset, view):
+        ordering = None
+        for backend in getattr(view, 'filter_backends', ()):
+            if issubclass(backend, OrderingFilter):
+                ordering = backend().get_ordering(request, queryset, view)
+                break
+
+        ordering = [self.tiebreaker if field == 'pk' else f'-{self.tiebreaker}' if field == '-pk' else field
+                    for field in ordering or self.ordering]
+        if not any(field.lstrip('-') == self.tiebreaker for field in ordering):
+            ordering.append(f'-{self.tiebreaker}' if ordering[0].startswith('-') else self.tiebreaker)
+        return tuple(ordering)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def encode_cursor(self, row, reverse):
+        position = [self._value(row, field.lstrip('-')) for field in self.ordering]
+        payload = json.dumps({'o': self.ordering, 'p': position, 'r': reverse}, cls=DjangoJSONEncoder)
+        encoded = base64.urlsafe_b64encode(payload.encode()).decode()
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            ordering, position, reverse = tuple(cursor['o']), cursor['p'], bool(cursor['r'])
+        except (TypeError, ValueError, KeyError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+
+        if ordering != self.ordering or len(position) != len(ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    @staticmethod
+    def _value(row, field):
+        if isinstance(row, dict):
+            return row[field]
+        return getattr(row, field)
+
+    @staticmethod
+    def _reverse(ordering):
+        return tuple(field[1:] if field.startswith('-') else f'-{field}' for field in ordering)
+
+    @staticmethod
+    def _seek(ordering, position):
+        # (f1 > v1) OR (f1 = v1 AND f2 > v2) OR ..., plus a leading f1 >= v1
+        # bound so the planner can start an index range scan at the cursor.
+        fields = [(field.lstrip('-'), 'lt' if field.startswith('-') else 'gt') for field in ordering]
+        seek = Q()
+        equal = Q()
+        for (field, lookup), value in zip(fields, position):
+            seek |= equal & Q(**{f'{field}__{lookup}': value})
+            equal &= Q(**{field: value})
+
+        first_field, first_lookup = fields[0]
+        return Q(**{f'{first_field}__{first_lookup}e': position[0]}) & seek
+
+
+class ReaderPagination(KeysetPagination):
+    def get_ordering(self, request, queryset, view):
+        return self.ordering
+
+
+class ShelfPagination(KeysetPagination):
+    ordering = ('shelf_id',)
+    tiebreaker = 'shelf_id'
+
+
+class AuthorPagination(KeysetPagination):
+    ordering = ('author_name',)
+    tiebreaker = 'author_name'
@@ -8,5 +8,5 @@ class IsOwnerOrStaffORReadOnly(BasePermission):
             request.method in SAFE_METHODS or
             request.user and
             request.user.is_authenticated and
-            (obj.owner == request.user or request.user.is_staff)
+            (obj.owner_id == request.user.id or request.user.is_staff)
         )
@@ -0,0 +1,70 @@
+import json
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _orjson_dumps(data):
+    # Datetimes go through DRF's encoder as well, orjson would format them differently.
+    # U+2028/9 are escaped like JSONRenderer does for JavaScript compatibility.
+    return orjson.dumps(
+        data, default=encoders.JSONEncoder().default, option=orjson.OPT_PASSTHROUGH_DATETIME
+    ).replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+def use_orjson():
+    # orjson only produces DRF's compact, unescaped unicode output.
+    return orjson is not None and api_settings.UNICODE_JSON and api_settings.COMPACT_JSON
+
+
+def dumps(data):
+    if use_orjson():
+        try:
+            return _orjson_dumps(data).decode()
+        except TypeError:
+            pass
+
+    return json.dumps(
+        data,
+        cls=encoders.JSONEncoder,
+        ensure_ascii=not api_settings.UNICODE_JSON,
+        allow_nan=not api_settings.STRICT_JSON,
+        separators=(',', ':') if api_settings.COMPACT_JSON else (', ', ': '),
+    )
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer encoding with orjson when it is installed.
+
+    Falls back to the stock encoder for indented output and for data orjson
+    rejects, such as integers beyond 64 bits or non-string keys. Large and
+    tiny floats may be written in a different, equivalent exponent form.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None or not use_orjson() or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            return _orjson_dumps(data)
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+
+
+def iter_json_array(rows):
+    yield '['
+    for index, row in enumerate(rows):
+        yield (',' if index else '') + dumps(row)
+    yield ']'
+
+
+def iter_ndjson(rows):
+    for row in rows:
+        yield dumps(row) + '\n'
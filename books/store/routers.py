@@ -0,0 +1,77 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+from store.cache import get_cache
+
+_read_from_replica = ContextVar('store_read_from_replica', default=False)
+
+
+def pin_key(user_id):
+    return f'store:primary-pin:{user_id}'
+
+
+def pin_to_primary(user):
+    """Serve this user's reads from the primary until replicas have caught up."""
+    if user.is_authenticated and settings.DATABASE_REPLICAS:
+        get_cache().set(pin_key(user.id), True, settings.REPLICA_PIN_SECONDS)
+
+
+def is_pinned(user):
+    return user.is_authenticated and get_cache().get(pin_key(user.id), False)
+
+
+@contextmanager
+def use_replica():
+    token = _read_from_replica.set(True)
+    try:
+        yield
+    finally:
+        _read_from_replica.reset(token)
+
+
+class PrimaryReplicaRouter:
+    """
+    Send reads made inside `use_replica()` to a random replica, everything
+    else to `default`. Replicas hold the same data, so relations between
+    objects loaded from different aliases are allowed.
+    """
+
+    def db_for_read(self, model, **hints):
+        if _read_from_replica.get() and settings.DATABASE_REPLICAS:
+            return random.choice(settings.DATABASE_REPLICAS)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
+
+
+class ReplicaReadMixin:
+    """Run list/retrieve against a replica unless the user has written recently."""
+
+    def reads_from_primary(self, request):
+        return is_pinned(request.user)
+
+    def list(self, request, *args, **kwargs):
+        with self._replica_scope(request):
+            return super().list(request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        with self._replica_scope(request):
+            return super().retrieve(request, *args, **kwargs)
+
+    @contextmanager
+    def _replica_scope(self, request):
+        if self.reads_from_primary(request):
+            yield
+        else:
+            with use_replica():
+                yield
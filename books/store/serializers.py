@@ -1,7 +1,12 @@
+import decimal
+
+from django.conf import settings
 from django.contrib.auth.models import User
 from rest_framework import serializers
+from rest_framework.settings import api_settings
 
-from store.models import Book, UserBookRelation
+from store.models import AuthorStats, Book, UserBookRelation
+from store.services import HISTOGRAM_FIELDS
 
 
 class BookReaderSerializer(serializers.ModelSerializer):
@@ -11,18 +16,134 @@ class BookReaderSerializer(serializers.ModelSerializer):
 
 
 class BookSerializer(serializers.ModelSerializer):
-    annotated_likes = serializers.IntegerField(read_only=True)
+    annotated_likes = serializers.IntegerField(source='likes_count', read_only=True)
     rating = serializers.DecimalField(max_digits=3, decimal_places=2, read_only=True)
     owner_name = serializers.CharField(read_only=True)
-    readers = BookReaderSerializer(many=True, read_only=True)
+    readers_count = serializers.IntegerField(read_only=True)
+    readers_preview = serializers.SerializerMethodField()
+    my_like = serializers.BooleanField(read_only=True, default=False)
+    my_bookmark = serializers.BooleanField(read_only=True, default=False)
+    my_rate = serializers.IntegerField(read_only=True, allow_null=True)
+
+    user_fields = ('my_like', 'my_bookmark', 'my_rate')
 
     class Meta:
         model = Book
         fields = ('id', 'name', 'price', 'author_name',
-                  'annotated_likes', 'rating', 'owner_name', 'readers')
+                  'annotated_likes', 'rating', 'owner_name', 'readers_count', 'readers_preview',
+                  'my_like', 'my_bookmark', 'my_rate')
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        if request is None or not request.user.is_authenticated:
+            for name in self.user_fields:
+                fields.pop(name)
+        return fields
+
+    def get_readers_preview(self, book):
+        readers = getattr(book, 'readers_preview', None)
+        if readers is None:
+            readers = book.readers.only('id', 'first_name', 'last_name').order_by('id')
+            readers = readers[:settings.BOOK_READERS_PREVIEW_SIZE]
+        return BookReaderSerializer(readers, many=True).data
+
+
+class FastBookSerializer(serializers.BaseSerializer):
+    """
+    Read-only BookSerializer for `.values()` rows.
+
+    Rows carry the fields under their BookSerializer source names, plus
+    `readers_preview` as a list of name dicts. Converters are built from
+    BookSerializer's own fields once per serializer, so each row costs one
+    plain call per field and renders to the same JSON.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.converters = [(name, self._source(name, field), self._converter(field))
+                           for name, field in BookSerializer(context=self.context).fields.items()]
+
+    @property
+    def value_fields(self):
+        return [source for name, source, _ in self.converters if name != 'readers_preview']
+
+    def to_representation(self, row):
+        ret = {}
+        for name, source, convert in self.converters:
+            value = row[source]
+            ret[name] = None if value is None else convert(value)
+        return ret
+
+    @staticmethod
+    def _source(name, field):
+        return name if field.source == '*' else field.source
+
+    @staticmethod
+    def _converter(field):
+        field_class = type(field)
+        if field_class is serializers.SerializerMethodField:
+            return list
+        if field_class is serializers.IntegerField:
+            return int
+        if field_class is serializers.CharField:
+            return str
+        if field_class is serializers.BooleanField:
+            return bool
+        coerce_to_string = getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+        if field_class is serializers.DecimalField and coerce_to_string and not field.localize \
+                and field.decimal_places is not None:
+            exponent = decimal.Decimal('.1') ** field.decimal_places
+            context = decimal.getcontext().copy()
+            if field.max_digits is not None:
+                context.prec = field.max_digits
+
+            def to_string(value):
+                if not isinstance(value, decimal.Decimal):
+                    value = decimal.Decimal(str(value).strip())
+                return '{:f}'.format(value.quantize(exponent, rounding=field.rounding, context=context))
+            return to_string
+        return field.to_representation
+
+
+class BookRatingsSerializer(serializers.ModelSerializer):
+    histogram = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Book
+        fields = ('id', 'rating', 'rating_count', 'histogram')
+
+    def get_histogram(self, book):
+        return {str(rate): getattr(book, field) for rate, field in HISTOGRAM_FIELDS.items()}
+
+
+class AuthorStatsSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = AuthorStats
+        fields = ('author_name', 'books_count', 'likes_count', 'rating', 'rating_count')
 
 
 class UserBookRelationSerializer(serializers.ModelSerializer):
     class Meta:
         model = UserBookRelation
         fields = ('book', 'like', 'in_bookmarks', 'rate')
+
+
+class UserBookRelationBulkListSerializer(serializers.ListSerializer):
+    def validate(self, attrs):
+        book_ids = {item['book_id'] for item in attrs}
+        missing = book_ids - set(Book.objects.filter(id__in=book_ids).values_list('id', flat=True))
+        if missing:
+            raise serializers.ValidationError(
+                {'book': [f'Invalid pk "{book_id}" - object does not exist.' for book_id in sorted(missing)]}
+            )
+        return attrs
+
+
+class UserBookRelationBulkSerializer(serializers.ModelSerializer):
+    book = serializers.IntegerField(source='book_id')
+
+    class Meta:
+        model = UserBookRelation
+        fields = ('book', 'like', 'in_bookmarks', 'rate')
+        list_serializer_class = UserBookRelationBulkListSerializer
@@ -1,9 +1,512 @@
-from django.db.models import Avg
+import math
+import time
+from collections import defaultdict
+from functools import partial
+from itertools import islice
+from operator import attrgetter
 
-from store.models import UserBookRelation
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, Count, DecimalField, ExpressionWrapper, F, FloatField, Q, Sum, Value, When
+from django.db.models import OuterRef, Subquery, Window
+from django.db.models.functions import Cast, Coalesce, Exp, Greatest, Least, Ln, RowNumber
+from django.db.models.lookups import GreaterThan
+from django.utils import timezone
 
+from store.cache import bump_book, bump_books
+from store.models import AuthorStats, Book, BookTombstone, PendingRating, UserBookRelation
 
-def set_rating(book):
-    rating = UserBookRelation.objects.filter(book=book).aggregate(rating=Avg('rate')).get('rating')
-    book.rating = rating
-    book.save()
+
+# Book columns counting the ratings of each RATE_CHOICES value.
+HISTOGRAM_FIELDS = {rate: f'rating_{rate}' for rate, _ in UserBookRelation.RATE_CHOICES}
+
+
+def lock_books(last_id, batch_size):
+    """
+    Lock the next `batch_size` books after `last_id` in id order and return
+    their ids. Commands that write recomputed counters call it inside their
+    transaction, so concurrent F() deltas wait for the write instead of
+    being overwritten by it.
+    """
+    return list(Book.objects.select_for_update().filter(id__gt=last_id).order_by('id')
+                .values_list('id', flat=True)[:batch_size])
+
+
+def histogram_aggregates(prefix=''):
+    return {field: Count(f'{prefix}rate', filter=Q(**{f'{prefix}rate': rate}))
+            for rate, field in HISTOGRAM_FIELDS.items()}
+
+
+def readers_preview_queryset(book_ids):
+    # The first readers of every book in one windowed query, the same rows
+    # as the readers_preview Prefetch of BookViewSet.
+    return UserBookRelation.objects.filter(book_id__in=book_ids).annotate(
+        position=Window(RowNumber(), partition_by=F('book_id'), order_by=F('user_id').asc())
+    ).filter(
+        position__lte=settings.BOOK_READERS_PREVIEW_SIZE
+    ).order_by('book_id', 'user_id').values_list('book_id', 'user__first_name', 'user__last_name')
+
+
+def attach_readers_previews(rows):
+    """Set `readers_preview` on `.values()` rows of books."""
+    previews = {row['id']: [] for row in rows}
+    if previews:
+        for book_id, first_name, last_name in readers_preview_queryset(list(previews)):
+            previews[book_id].append({'first_name': first_name, 'last_name': last_name})
+    for row in rows:
+        row['readers_preview'] = previews[row['id']]
+    return rows
+
+
+def update_rating(book_id, old_rate, new_rate):
+    if settings.RATING_QUEUE_ENABLED:
+        PendingRating.objects.create(book_id=book_id, old_rate=old_rate, new_rate=new_rate)
+        return
+
+    update_book_counters(book_id, **_rating_delta(old_rate, new_rate))
+
+
+def update_likes(book_id, old_like, new_like):
+    update_book_counters(book_id, likes=int(new_like) - int(old_like))
+
+
+def update_readers(book_id, delta):
+    update_book_counters(book_id, readers=delta)
+
+
+def update_book_counters(book_id, likes=0, readers=0, rating_sum=0, rating_count=0, activity=None, rates=None):
+    """
+    Apply counter deltas to a book, and to its AuthorStats row once the
+    transaction commits; `rates` maps RATE_CHOICES values to rating
+    histogram deltas.
+    """
+    if activity is None:
+        activity = _activity(likes, readers, rating_sum, rating_count)
+
+    updates = _totals_updates(likes, rating_sum, rating_count)
+    if activity:
+        updates['trending_score'] = trending_expression(activity)
+    if readers:
+        updates['readers_count'] = F('readers_count') + readers
+    for rate, delta in (rates or {}).items():
+        if delta:
+            updates[HISTOGRAM_FIELDS[rate]] = F(HISTOGRAM_FIELDS[rate]) + delta
+    if not updates:
+        return
+
+    Book.objects.filter(pk=book_id).update(**updates, updated_at=timezone.now())
+    if likes or rating_sum or rating_count:
+        # After commit, so the author's row, which every like and rate of their
+        # books updates, is locked for one statement instead of the rest of the
+        # transaction and concurrent writes to those books do not queue on it.
+        transaction.on_commit(partial(update_author_totals, [(book_id, likes, rating_sum, rating_count)]))
+    bump_book(book_id)
+
+
+def bulk_update_book_counters(deltas):
+    """
+    Apply {book_id: update_book_counters() keyword arguments} to many books
+    in one UPDATE ... FROM (VALUES ...), and to their AuthorStats rows in
+    one more statement once the transaction commits.
+    """
+    rows, author_rows = [], []
+    now = trending_time()
+    # In book_id order, so concurrent batches lock their common books in the
+    # same order instead of deadlocking.
+    for book_id, book_deltas in sorted(deltas.items()):
+        likes, readers = book_deltas.get('likes', 0), book_deltas.get('readers', 0)
+        rating_sum, rating_count = book_deltas.get('rating_sum', 0), book_deltas.get('rating_count', 0)
+        rates = book_deltas.get('rates') or {}
+        activity = book_deltas.get('activity')
+        if activity is None:
+            activity = _activity(likes, readers, rating_sum, rating_count)
+        histogram = [rates.get(rate, 0) for rate in HISTOGRAM_FIELDS]
+        if not (likes or readers or rating_sum or rating_count or activity or any(histogram)):
+            continue
+        rows.append((book_id, likes, readers, rating_sum, rating_count, *histogram,
+                     math.log(activity) + now if activity else None))
+        if likes or rating_sum or rating_count:
+            author_rows.append((book_id, likes, rating_sum, rating_count))
+    if not rows:
+        return
+
+    opts = Book._meta
+    quote = connection.ops.quote_name
+    table = quote(opts.db_table)
+    columns = {name: quote(opts.get_field(name).column) for name in (
+        'id', 'likes_count', 'readers_count', 'rating_sum', 'rating_count', 'rating', 'trending_score', 'updated_at',
+        *HISTOGRAM_FIELDS.values(),
+    )}
+    old = {name: f'{table}.{column}' for name, column in columns.items()}
+    greatest, least = ('MAX', 'MIN') if connection.vendor == 'sqlite' else ('GREATEST', 'LEAST')
+    # A column of NULLs has no type on PostgreSQL.
+    score = f'CAST(d.score AS {FloatField().db_type(connection)})'
+    high, low = f'{greatest}({old["trending_score"]}, {score})', f'{least}({old["trending_score"]}, {score})'
+    # Counters stop at zero, so uncounting relations of drifted books does not break their CHECK constraints.
+    new_sum = f'{greatest}({old["rating_sum"]} + d.rating_sum, 0)'
+    new_count = f'{greatest}({old["rating_count"]} + d.rating_count, 0)'
+    histogram = ', '.join(f'{columns[name]} = {greatest}({old[name]} + d.{name}, 0)'
+                          for name in HISTOGRAM_FIELDS.values())
+    values = ', '.join([f'({", ".join(["%s"] * len(rows[0]))})'] * len(rows))
+    # The same arithmetic as update_book_counters() and trending_expression().
+    sql = f'''
+        WITH d (book_id, likes, readers, rating_sum, rating_count, {', '.join(HISTOGRAM_FIELDS.values())}, score)
+        AS (VALUES {values})
+        UPDATE {table} SET
+            {columns["likes_count"]} = {greatest}({old["likes_count"]} + d.likes, 0),
+            {columns["readers_count"]} = {greatest}({old["readers_count"]} + d.readers, 0),
+            {columns["rating_sum"]} = {new_sum},
+            {columns["rating_count"]} = {new_count},
+            {columns["rating"]} = CASE WHEN {new_count} > 0 THEN 1.0 * ({new_sum}) / ({new_count}) END,
+            {histogram},
+            {columns["trending_score"]} = CASE
+                WHEN d.score IS NULL THEN {old["trending_score"]}
+                WHEN {old["trending_score"]} IS NULL THEN {score}
+                ELSE {high} + LN(1.0 + EXP({greatest}({low} - {high}, -50.0)))
+            END,
+            {columns["updated_at"]} = %s
+        FROM d WHERE {old["id"]} = d.book_id
+    '''
+    params = [value for row in rows for value in row]
+    params.append(timezone.now())
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+    if author_rows:
+        transaction.on_commit(partial(update_author_totals, author_rows))
+    bump_books([row[0] for row in rows])
+
+
+def update_author_totals(rows):
+    """
+    Add (book_id, likes, rating_sum, rating_count) deltas to the AuthorStats
+    rows of those books, summed per author, in one UPDATE.
+    """
+    opts, book_opts = AuthorStats._meta, Book._meta
+    quote = connection.ops.quote_name
+    table, book_table = quote(opts.db_table), quote(book_opts.db_table)
+    name, likes, rating_sum, rating_count, rating = (
+        quote(opts.get_field(field).column)
+        for field in ('author_name', 'likes_count', 'rating_sum', 'rating_count', 'rating')
+    )
+    new_sum, new_count = f'{table}.{rating_sum} + totals.rating_sum', f'{table}.{rating_count} + totals.rating_count'
+    values = ', '.join(['(%s, %s, %s, %s)'] * len(rows))
+    sql = f'''
+        WITH d (book_id, likes, rating_sum, rating_count) AS (VALUES {values}),
+        totals AS (
+            SELECT {book_table}.{quote(book_opts.get_field('author_name').column)} AS author_name,
+                   SUM(d.likes) AS likes, SUM(d.rating_sum) AS rating_sum, SUM(d.rating_count) AS rating_count
+            FROM d INNER JOIN {book_table} ON {book_table}.{quote(book_opts.pk.column)} = d.book_id
+            GROUP BY 1
+        )
+        UPDATE {table} SET
+            {likes} = {table}.{likes} + totals.likes,
+            {rating_sum} = {new_sum},
+            {rating_count} = {new_count},
+            {rating} = CASE WHEN {new_count} > 0 THEN 1.0 * ({new_sum}) / ({new_count}) END
+        FROM totals WHERE {table}.{name} = totals.author_name
+    '''
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [value for row in rows for value in row])
+
+
+def _activity(likes, readers, rating_sum, rating_count):
+    return max(likes, 0) + max(readers, 0) + bool(rating_sum or rating_count)
+
+
+def _totals_updates(likes, rating_sum, rating_count):
+    # Counters Book and AuthorStats share, under the same names.
+    updates = {}
+    if likes:
+        updates['likes_count'] = F('likes_count') + likes
+    if rating_sum or rating_count:
+        new_sum = F('rating_sum') + rating_sum
+        new_count = F('rating_count') + rating_count
+        updates['rating_sum'] = new_sum
+        updates['rating_count'] = new_count
+        updates['rating'] = _average(new_sum, new_count)
+    return updates
+
+
+def _average(total, count):
+    return Case(
+        When(GreaterThan(count, 0),
+             then=ExpressionWrapper(Cast(total, FloatField()) / count, output_field=DecimalField())),
+        default=None,
+    )
+
+
+def trending_time():
+    return time.time() / (settings.TRENDING_HALF_LIFE_HOURS * 3600) * math.log(2)
+
+
+def trending_expression(activity):
+    # Adding `activity` events now is log(exp(score) + activity * 2 ** (t / half-life)).
+    # Older events weigh exponentially less than new ones, so ordering by the
+    # stored score ranks books by decayed activity without rewriting the table.
+    now = Value(math.log(activity) + trending_time(), output_field=FloatField())
+    old = F('trending_score')
+    high, low = Greatest(old, now), Least(old, now)
+    return Case(
+        When(trending_score__isnull=True, then=now),
+        # exp() underflows to an error on PostgreSQL, and the tail is negligible anyway.
+        default=high + Ln(Value(1.0) + Exp(Greatest(low - high, Value(-50.0)))),
+        output_field=FloatField(),
+    )
+
+
+def flush_rating_queue(batch_size=10000):
+    with transaction.atomic():
+        pending = list(
+            PendingRating.objects.select_for_update(skip_locked=True).order_by('id').values_list(
+                'id', 'book_id', 'old_rate', 'new_rate'
+            )[:batch_size]
+        )
+        if not pending:
+            return 0
+
+        deltas = defaultdict(dict)
+        for _, book_id, old_rate, new_rate in pending:
+            _add_rating_delta(deltas[book_id], old_rate, new_rate)
+            deltas[book_id]['activity'] = deltas[book_id].get('activity', 0) + 1
+
+        bulk_update_book_counters(deltas)
+
+        PendingRating.objects.filter(id__in=[row[0] for row in pending]).delete()
+
+    return len(pending)
+
+
+RELATION_FIELDS = ('like', 'in_bookmarks', 'rate')
+
+
+def bulk_update_relations(user, entries):
+    states = {}
+    for entry in entries:
+        states.setdefault(entry['book_id'], {}).update(entry)
+
+    with transaction.atomic():
+        locked = UserBookRelation.objects.select_for_update().filter(user=user)
+        existing = {relation.book_id: relation for relation in locked.filter(book_id__in=states)}
+        missing = [UserBookRelation(user=user, book_id=book_id, **{
+            name: state[name] for name in RELATION_FIELDS if name in state
+        }) for book_id, state in states.items() if book_id not in existing]
+        inserted = _insert_relations(user, missing) if missing else {}
+        lost = [book_id for book_id in states if book_id not in existing and book_id not in inserted]
+        if lost:
+            # Inserted by another request since the lookup, or the book is
+            # gone; the committed rows are read again like upsert_relation().
+            existing.update((relation.book_id, relation) for relation in locked.filter(book_id__in=lost))
+
+        relations = []
+        deltas = defaultdict(lambda: {'readers': 0, 'likes': 0})
+        pending = []
+        for book_id, state in states.items():
+            if book_id in inserted:
+                relation, old_like, old_rate = inserted[book_id], False, None
+                deltas[book_id]['readers'] += 1
+            elif book_id in existing:
+                relation = existing[book_id]
+                old_like, old_rate = relation.like, relation.rate
+                for name in RELATION_FIELDS:
+                    setattr(relation, name, state.get(name, getattr(relation, name)))
+            else:
+                continue
+            relations.append(relation)
+
+            deltas[book_id]['likes'] += int(relation.like) - int(old_like)
+            if old_rate != relation.rate:
+                if settings.RATING_QUEUE_ENABLED:
+                    pending.append(PendingRating(book_id=book_id, old_rate=old_rate, new_rate=relation.rate))
+                else:
+                    _add_rating_delta(deltas[book_id], old_rate, relation.rate)
+
+        UserBookRelation.objects.bulk_update([relation for relation in relations if relation.book_id in existing],
+                                             RELATION_FIELDS)
+        PendingRating.objects.bulk_create(pending)
+        bulk_update_book_counters(deltas)
+
+    return relations
+
+
+def upsert_relation(user, book_id, changes):
+    """
+    Create or update the user's relation to a book, writing only `changes`,
+    and apply the counter deltas. Raises Book.DoesNotExist for unknown books.
+    """
+    fields = [name for name in RELATION_FIELDS if name in changes]
+    with transaction.atomic():
+        relation, old = _upsert_relation(user, book_id, changes, fields)
+        old_like, old_rate = old or (False, None)
+        deltas = {'likes': int(relation.like) - int(old_like), 'readers': int(old is None)}
+        if old_rate != relation.rate:
+            if settings.RATING_QUEUE_ENABLED:
+                PendingRating.objects.create(book_id=book_id, old_rate=old_rate, new_rate=relation.rate)
+            else:
+                deltas.update(_rating_delta(old_rate, relation.rate))
+        update_book_counters(book_id, **deltas)
+    return relation
+
+
+def _upsert_relation(user, book_id, changes, fields):
+    # The previous row is locked and read before any write, so its state is
+    # known even when another request inserts it first: the INSERT then
+    # does nothing and the row it committed is read again.
+    relations = UserBookRelation.objects.select_for_update().filter(user=user, book_id=book_id)
+    relation = relations.first()
+    if relation is None:
+        relation = UserBookRelation(user=user, book_id=book_id, **{name: changes[name] for name in fields})
+        if _insert_relations(user, [relation]):
+            return relation, None
+        relation = relations.first()
+        if relation is None:
+            raise Book.DoesNotExist(f'Book {book_id} does not exist')
+
+    old = (relation.like, relation.rate)
+    for name in fields:
+        setattr(relation, name, changes[name])
+    if fields:
+        UserBookRelation.objects.filter(pk=relation.pk).update(**{name: changes[name] for name in fields})
+    return relation, old
+
+
+def _insert_relations(user, relations):
+    # INSERT ... SELECT ... ON CONFLICT DO NOTHING of unsaved relations,
+    # returning {book_id: relation} of those inserted: rows that already
+    # exist are left alone. Foreign keys are deferred, so the books are
+    # checked by the SELECT. Rows go in book_id order, like the counter
+    # updates, so concurrent bulk requests do not deadlock.
+    opts = UserBookRelation._meta
+    quote = connection.ops.quote_name
+    names = ('like', 'in_bookmarks', 'rate')
+    columns = {name: quote(opts.get_field(name).column) for name in ('user', 'book', *names)}
+    casts = ', '.join(f'CAST(d.{quote(name)} AS {opts.get_field(name).db_type(connection)})' for name in names)
+    values = ', '.join(['(%s, %s, %s, %s)'] * len(relations))
+    sql = f'''
+        WITH d (book_id, {', '.join(quote(name) for name in names)}) AS (VALUES {values})
+        INSERT INTO {quote(opts.db_table)} ({', '.join(columns.values())})
+        SELECT %s, d.book_id, {casts} FROM d
+        WHERE d.book_id IN (SELECT {quote(Book._meta.pk.column)} FROM {quote(Book._meta.db_table)})
+        ORDER BY d.book_id
+        ON CONFLICT ({columns["user"]}, {columns["book"]}) DO NOTHING
+        RETURNING {columns["book"]}, {quote(opts.pk.column)}
+    '''
+    params = [value for relation in sorted(relations, key=attrgetter('book_id'))
+              for value in (relation.book_id, *(getattr(relation, name) for name in names))]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [*params, user.id])
+        ids = dict(cursor.fetchall())
+    inserted = {}
+    for relation in relations:
+        if relation.book_id in ids:
+            relation.id = ids[relation.book_id]
+            inserted[relation.book_id] = relation
+    return inserted
+
+
+def update_author_stats(rows):
+    """
+    Add (author_name, books, likes, rating_sum, rating_count) deltas to
+    AuthorStats, creating missing authors, with one upsert per row run
+    through executemany().
+    """
+    opts = AuthorStats._meta
+    quote = connection.ops.quote_name
+    table = quote(opts.db_table)
+    columns = [quote(opts.get_field(name).column)
+               for name in ('author_name', 'books_count', 'likes_count', 'rating_sum', 'rating_count', 'rating')]
+    name, books, likes, rating_sum, rating_count, rating = columns
+    new_sum = f'{table}.{rating_sum} + EXCLUDED.{rating_sum}'
+    new_count = f'{table}.{rating_count} + EXCLUDED.{rating_count}'
+    sql = f'''
+        INSERT INTO {table} ({', '.join(columns)}) VALUES (%s, %s, %s, %s, %s, %s)
+        ON CONFLICT ({name}) DO UPDATE SET
+            {', '.join(f'{column} = {table}.{column} + EXCLUDED.{column}' for column in columns[1:5])},
+            {rating} = CASE WHEN {new_count} > 0 THEN 1.0 * ({new_sum}) / ({new_count}) END
+    '''
+    params = [(author_name, books_delta, likes_delta, sum_delta, count_delta,
+               round(sum_delta / count_delta, 2) if count_delta > 0 else None)
+              for author_name, books_delta, likes_delta, sum_delta, count_delta in rows]
+    if params:
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, params)
+
+
+def refresh_author_stats(author_names):
+    """Recompute the existing AuthorStats rows of these authors from their books in one UPDATE."""
+    books = Book.objects.filter(author_name=OuterRef('pk')).order_by().values('author_name')
+
+    def total(aggregate):
+        return Coalesce(Subquery(books.annotate(total=aggregate).values('total')), 0)
+
+    AuthorStats.objects.filter(pk__in=list(author_names)).update(
+        books_count=total(Count('id')),
+        likes_count=total(Sum('likes_count')),
+        rating_sum=total(Sum('rating_sum')),
+        rating_count=total(Sum('rating_count')),
+        rating=_average(total(Sum('rating_sum')), total(Sum('rating_count'))),
+    )
+
+
+def rebuild_author_stats(batch_size=10000):
+    """Recompute every AuthorStats row from the books."""
+    rows = Book.objects.order_by().values('author_name').annotate(
+        books=Count('id'), likes=Sum('likes_count'), total=Sum('rating_sum'), count=Sum('rating_count'),
+    ).values_list('author_name', 'books', 'likes', 'total', 'count')
+    with transaction.atomic():
+        AuthorStats.objects.all().delete()
+        rows = rows.iterator(chunk_size=batch_size)
+        while chunk := list(islice(rows, batch_size)):
+            update_author_stats(chunk)
+
+
+def remove_author_stats(sender, instance, **kwargs):
+    # post_delete receiver; the book's counters are recounted rather than
+    # subtracted, since the instance may be older than its row.
+    refresh_author_stats([instance.author_name])
+
+
+def uncount_relations(rows):
+    """
+    Uncount deleted (book_id, like, rate) relations, summed per book, with
+    one bulk_update_book_counters() call; rates go through the rating queue
+    when it is enabled.
+    """
+    deltas = defaultdict(lambda: {'readers': 0, 'likes': 0})
+    pending = []
+    for book_id, like, rate in rows:
+        deltas[book_id]['readers'] -= 1
+        deltas[book_id]['likes'] -= int(like)
+        if rate is not None:
+            if settings.RATING_QUEUE_ENABLED:
+                pending.append(PendingRating(book_id=book_id, old_rate=rate, new_rate=None))
+            else:
+                _add_rating_delta(deltas[book_id], rate, None)
+    PendingRating.objects.bulk_create(pending)
+    bulk_update_book_counters(deltas)
+
+
+def remove_user_relation_counters(sender, instance, **kwargs):
+    # pre_delete receiver on User: its relations are uncounted here, so the
+    # cascade deletes them in one statement without loading them. Relations
+    # have no delete receivers, which keeps the Book cascade a fast delete too.
+    uncount_relations(UserBookRelation.objects.filter(user=instance).values_list('book_id', 'like', 'rate'))
+
+
+def record_tombstone(sender, instance, **kwargs):
+    # post_delete receiver, so queryset and admin deletes are recorded as well.
+    BookTombstone.objects.create(book_id=instance.pk)
+
+
+def _rating_delta(old_rate, new_rate):
+    return _add_rating_delta({}, old_rate, new_rate)
+
+
+def _add_rating_delta(deltas, old_rate, new_rate):
+    deltas['rating_sum'] = deltas.get('rating_sum', 0) + (new_rate or 0) - (old_rate or 0)
+    deltas['rating_count'] = deltas.get('rating_count', 0) + (new_rate is not None) - (old_rate is not None)
+    rates = deltas.setdefault('rates', defaultdict(int))
+    if old_rate is not None:
+        rates[old_rate] -= 1
+    if new_rate is not None:
+        rates[new_rate] += 1
+    return deltas
@@ -0,0 +1,192 @@
+"""
+"Readers also liked" neighbours for /book/{id}/similar/.
+
+A reader of a book is a user who liked it or rated it at least
+BOOK_SIMILAR_MIN_RATE. Two books score the cosine similarity of their reader
+sets, common / sqrt(readers_a * readers_b), and the top BOOK_SIMILAR_TOP_K
+of every book are stored as BookNeighbour rows.
+
+Relations are read BOOK_SIMILAR_CHUNK_USERS users at a time and counted
+into one sparse row per book of the shard being built. Those rows hold a
+count for every book co-read with it until the scan ends, so memory grows
+with the co-read pairs of the shard, not with the chunk size; building in
+more shards bounds it, each shard rescanning the relations. Shards split
+books by id and are counted by up to `processes` workers, one shard at a
+time each. An incremental build recounts the books whose counters changed
+since the last build, together with the books co-read with them or still
+listing them as a neighbour, whose scores depend on them; when more than
+BOOK_SIMILAR_MAX_TARGETS books are affected the build is a full one
+instead, which scans the same relations without filtering on their ids.
+A user crossing BOOK_SIMILAR_MAX_BASKET changes pairs of books that need
+not be among those, so a --full build should still run from time to time.
+"""
+import heapq
+import math
+import multiprocessing
+from collections import Counter, defaultdict
+from itertools import islice
+
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from store.models import Book, BookNeighbour, BookTombstone, SimilarityBuild, UserBookRelation
+
+# (targets, norms) of the running build, set before the pool forks so the
+# workers inherit them instead of receiving a pickled copy with every shard.
+_shared = None
+
+
+def reader_relations():
+    return UserBookRelation.objects.filter(Q(like=True) | Q(rate__gte=settings.BOOK_SIMILAR_MIN_RATE))
+
+
+def iter_baskets(user_ids, chunk_size):
+    """Yield the book ids each user of the `user_ids` queryset is a reader of, a chunk of users per query."""
+    last = None
+    while True:
+        chunk = user_ids.order_by('user_id') if last is None else user_ids.filter(user_id__gt=last).order_by('user_id')
+        chunk = list(chunk.values_list('user_id', flat=True).distinct()[:chunk_size])
+        if not chunk:
+            return
+
+        baskets = defaultdict(list)
+        for user_id, book_id in reader_relations().filter(user_id__in=chunk).values_list('user_id', 'book_id'):
+            baskets[user_id].append(book_id)
+        yield from baskets.values()
+
+        if len(chunk) < chunk_size:
+            return
+        last = chunk[-1]
+
+
+def count_shard(shard, shards, targets, norms, options):
+    """
+    Top-K neighbours of the books with `id % shards == shard`, only those
+    in `targets` unless it is None, as {book_id: [(score, neighbour_id)]}.
+    `norms` maps every book with readers to 1 / sqrt(readers); books that got
+    their first reader after it was computed are skipped until the next build.
+    """
+    user_ids = reader_relations()
+    if targets is not None:
+        user_ids = user_ids.filter(user_id__in=reader_relations().filter(book_id__in=targets).values('user_id'))
+
+    common = defaultdict(Counter)
+    for basket in iter_baskets(user_ids, options['chunk_size']):
+        if len(basket) > options['max_basket']:
+            continue
+        for book_id in basket:
+            if book_id % shards == shard and book_id in norms and (targets is None or book_id in targets):
+                # Counter.update() counts a list in C; the book itself is dropped below.
+                common[book_id].update(basket)
+
+    neighbours = {}
+    for book_id, counts in common.items():
+        del counts[book_id]
+        # Ranked by count * norms[other], the book's own norm is the same for every neighbour.
+        top = heapq.nlargest(options['top_k'], (
+            (count * norms[other], other) for other, count in counts.items()
+            if count >= options['min_count'] and other in norms
+        ))
+        neighbours[book_id] = [(score * norms[book_id], other) for score, other in top]
+    return neighbours
+
+
+def _count_forked_shard(shard, shards, options):
+    return count_shard(shard, shards, *_shared, options)
+
+
+def build_neighbours(full=False, processes=1, shards=None, top_k=None, min_count=None, max_basket=None,
+                     chunk_size=None, max_targets=None, batch_size=10000):
+    """
+    Recount BookNeighbour rows and return the finished SimilarityBuild. The
+    first build and `full` ones cover every book, later ones the books
+    updated since the previous build started and the books affected by
+    them, see affected_books(), unless there are more than `max_targets`.
+    `shards` defaults to one per process.
+    """
+    global _shared
+    options = {
+        'top_k': settings.BOOK_SIMILAR_TOP_K if top_k is None else top_k,
+        'min_count': settings.BOOK_SIMILAR_MIN_COUNT if min_count is None else min_count,
+        'max_basket': settings.BOOK_SIMILAR_MAX_BASKET if max_basket is None else max_basket,
+        'chunk_size': settings.BOOK_SIMILAR_CHUNK_USERS if chunk_size is None else chunk_size,
+    }
+    started_at = timezone.now()
+    previous = SimilarityBuild.objects.order_by('-started_at').first()
+    max_targets = settings.BOOK_SIMILAR_MAX_TARGETS if max_targets is None else max_targets
+    full = full or previous is None
+    targets = None
+    if not full:
+        # Counter updates set updated_at, so it covers every book with new likes or rates;
+        # deleted books are recounted to nothing, which drops their rows.
+        changed = {
+            *Book.objects.filter(updated_at__gte=previous.started_at).values_list('id', flat=True),
+            *BookTombstone.objects.filter(deleted_at__gte=previous.started_at).values_list('book_id', flat=True),
+        }
+        # The ids are sent with every query of the build, so past a point a full scan is cheaper.
+        targets = affected_books(changed) if len(changed) <= max_targets else None
+        if targets is None or len(targets) > max_targets:
+            full, targets = True, None
+
+    neighbours = {}
+    if full or targets:
+        norms = {book_id: 1 / math.sqrt(readers) for book_id, readers in reader_relations().order_by().values(
+            'book_id'
+        ).annotate(readers=Count('id')).values_list('book_id', 'readers')}
+        shards = shards or processes
+        if processes == 1:
+            results = [count_shard(shard, shards, targets, norms, options) for shard in range(shards)]
+        else:
+            # Forked workers inherit the configured project but must open their own connections.
+            connections.close_all()
+            _shared = (targets, norms)
+            try:
+                with multiprocessing.get_context('fork').Pool(processes) as pool:
+                    results = pool.starmap(_count_forked_shard, [(shard, shards, options) for shard in range(shards)])
+            finally:
+                _shared = None
+        for result in results:
+            neighbours.update(result)
+
+    save_neighbours(neighbours, None if full else targets, batch_size)
+    return SimilarityBuild.objects.create(started_at=started_at, full=full,
+                                          books=len(neighbours) if targets is None else len(targets))
+
+
+def affected_books(changed):
+    """
+    `changed` plus the books whose neighbours depend on them: those sharing
+    a reader with a changed book, and those whose stored rows list one.
+    """
+    if not changed:
+        return set()
+    readers = reader_relations().filter(book_id__in=changed).values('user_id')
+    return {
+        *changed,
+        *reader_relations().filter(user_id__in=readers).values_list('book_id', flat=True).distinct(),
+        # neighbour_id has no index; this reads the table once per incremental build.
+        *BookNeighbour.objects.filter(neighbour_id__in=changed).values_list('book_id', flat=True).distinct(),
+    }
+
+
+def save_neighbours(neighbours, targets, batch_size):
+    # `targets` None replaces the whole table. Rows are plain tuples run
+    # through one prepared INSERT, as bulk_create() spends most of a build
+    # building and compiling model instances.
+    opts = BookNeighbour._meta
+    columns = ', '.join(connection.ops.quote_name(opts.get_field(name).column)
+                        for name in ('book', 'neighbour', 'score'))
+    sql = f'INSERT INTO {connection.ops.quote_name(opts.db_table)} ({columns}) VALUES (%s, %s, %s)'
+    rows = ((book_id, neighbour_id, score) for book_id, scored in neighbours.items() for score, neighbour_id in scored)
+    with transaction.atomic():
+        if targets is None:
+            BookNeighbour.objects.all().delete()
+        else:
+            targets = iter(targets)
+            while chunk := list(islice(targets, batch_size)):
+                BookNeighbour.objects.filter(book_id__in=chunk).delete()
+        with connection.cursor() as cursor:
+            while batch := list(islice(rows, batch_size)):
+                cursor.executemany(sql, batch)
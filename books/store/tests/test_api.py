@@ -1,13 +1,27 @@
+import json
+from io import StringIO
 from decimal import Decimal
+from unittest.mock import patch
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.db.backends.postgresql.base import DatabaseWrapper as PostgresDatabaseWrapper
 from django.db.models import Count, Case, When, Avg, F
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.exceptions import ErrorDetail
-from rest_framework.test import APITestCase
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, APITestCase
 
-from store.models import Book, UserBookRelation
+from store.cache import bump_book, get_cache
+from store.filters import BookSearchFilter
+from store.models import Book, BookNeighbour, UserBookRelation
+from store.pagination import KeysetPagination
 from store.serializers import BookSerializer
+from store.views import BookViewSet
 
 
 class BookTestAPI(APITestCase):
@@ -23,9 +37,9 @@ class BookTestAPI(APITestCase):
         response = self.client.get(url)
         books = Book.objects.all().annotate(
             annotated_likes=Count(Case(When(userbookrelation__like=True, then=1))),
-            owner_name=F('owner__username')).order_by('-id')
+            owner_name=F('owner__username')).order_by('id')
         serialized_data = BookSerializer(books, many=True).data
-        self.assertEqual(response.data, serialized_data)
+        self.assertEqual(response.data['results'], serialized_data)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
     def test_retrieve_book(self):
@@ -121,7 +135,7 @@ class BookTestAPI(APITestCase):
             annotated_likes=Count(Case(When(userbookrelation__like=True, then=1))),
             owner_name=F('owner__username'))
         serialized_data = BookSerializer(books, many=True).data
-        self.assertEqual(response.data, serialized_data)
+        self.assertEqual(response.data['results'], serialized_data)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
     def test_get_search(self):
@@ -132,8 +146,8 @@ class BookTestAPI(APITestCase):
             owner_name=F('owner__username')).order_by('id')
         serialized_data = BookSerializer(books, many=True).data
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 2)
-        self.assertEqual(response.data, serialized_data)
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertEqual(response.data['results'], serialized_data)
 
     def test_get_ordering(self):
         url = reverse('book-list')
@@ -142,7 +156,7 @@ class BookTestAPI(APITestCase):
             annotated_likes=Count(Case(When(userbookrelation__like=True, then=1))),
             owner_name=F('owner__username')).order_by('price')
         serialized_data = BookSerializer(books, many=True).data
-        self.assertEqual(response.data, serialized_data)
+        self.assertEqual(response.data['results'], serialized_data)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
 
@@ -198,5 +212,715 @@ class BookRelationAPI(APITestCase):
         response = self.client.patch(url, payload)
 
         self.assertEqual({'rate': [ErrorDetail(string='"7" is not a valid choice.', code='invalid_choice')]}, response.data)
+        self.assertFalse(UserBookRelation.objects.filter(user=self.user, book=self.book_1).exists())
+
+    def test_unknown_book(self):
+        url = reverse('userbookrelation-detail', args=(0, ))
+        self.client.force_login(self.user)
+        response = self.client.patch(url, {'like': True})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_counters(self):
+        url = reverse('userbookrelation-detail', args=(self.book_1.id, ))
+        self.client.force_login(self.user)
+        response = self.client.patch(url, {'like': True, 'rate': 4})
+        self.assertEqual(response.data, {'book': self.book_1.id, 'like': True, 'in_bookmarks': False, 'rate': 4})
+        self.client.force_login(self.user2)
+        self.client.patch(url, {'rate': 5})
+
+        self.book_1.refresh_from_db()
+        self.assertEqual((self.book_1.likes_count, self.book_1.readers_count, self.book_1.rating),
+                         (1, 2, Decimal('4.50')))
+
+
+class BookPaginationAPI(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="test_user")
+        prices = [10, 20, 20, 20, 30, 40, 40]
+        for i, price in enumerate(prices):
+            Book.objects.create(name=f'test_{i}', price=price, author_name=f"Author-{i % 3}", owner=self.user)
+
+    def walk(self, params):
+        url = reverse('book-list')
+        response = self.client.get(url, data=params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        pages = [response.data]
+        while pages[-1]['next']:
+            pages.append(self.client.get(pages[-1]['next']).data)
+        return pages
+
+    def test_pages_follow_ordering(self):
+        for ordering, order_by in [('price', ('price', 'id')),
+                                   ('-price', ('-price', '-id')),
+                                   ('author_name,-price', ('author_name', '-price', 'id'))]:
+            pages = self.walk({'page_size': 2, 'ordering': ordering})
+            ids = [book['id'] for page in pages for book in page['results']]
+            expected = list(Book.objects.order_by(*order_by).values_list('id', flat=True))
+            self.assertEqual(ids, expected)
+            self.assertEqual(len(pages), 4)
+            self.assertIsNone(pages[0]['previous'])
+
+    def test_previous_link(self):
+        pages = self.walk({'page_size': 3, 'ordering': '-price'})
+        previous = self.client.get(pages[-1]['previous']).data
+        self.assertEqual(previous['results'], pages[-2]['results'])
+        first = self.client.get(previous['previous']).data
+        self.assertEqual(first['results'], pages[0]['results'])
+        self.assertIsNone(first['previous'])
+
+    def test_with_filter_and_search(self):
+        pages = self.walk({'page_size': 1, 'price': 20, 'search': 'Author-'})
+        ids = [book['id'] for page in pages for book in page['results']]
+        self.assertEqual(ids, list(Book.objects.filter(price=20).order_by('id').values_list('id', flat=True)))
+
+    def test_invalid_cursor(self):
+        url = reverse('book-list')
+        response = self.client.get(url, data={'cursor': 'garbage'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_paginated_without_params(self):
+        url = reverse('book-list')
+        response = self.client.get(url)
+        self.assertEqual(len(response.data['results']), 7)
+        self.assertIsNone(response.data['next'])
+
+        with patch.object(KeysetPagination, 'max_page_size', 3):
+            pages = self.walk({'page_size': 100})
+        self.assertEqual([len(page['results']) for page in pages], [3, 3, 1])
+
+
+class BookExportAPI(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="test_user")
+        self.book_1 = Book.objects.create(name='test_1', price=25.5, author_name="Valera-1", owner=self.user)
+        self.book_2 = Book.objects.create(name='test_2', price=450, author_name="Valera-2", owner=self.user)
+        UserBookRelation.objects.create(user=self.user, book=self.book_1, like=True, rate=5)
+
+    def expected_data(self, **filters):
+        books = Book.objects.filter(**filters).annotate(owner_name=F('owner__username')).order_by('price')
+        return json.loads(json.dumps(BookSerializer(books, many=True).data))
+
+    def test_export_json(self):
+        url = reverse('book-export')
+        response = self.client.get(url, data={'ordering': 'price'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(json.loads(b''.join(response.streaming_content)), self.expected_data())
+
+    def test_export_ndjson_filtered(self):
+        url = reverse('book-export')
+        response = self.client.get(url, data={'export_format': 'ndjson', 'search': 'Valera-2'})
+
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], self.expected_data(id=self.book_2.id))
 
 
+class BookReadersAPI(APITestCase):
+    def setUp(self):
+        self.users = [User.objects.create(username=f'test_user_{i}', first_name=f'first_{i}', last_name=f'last_{i}')
+                      for i in range(8)]
+        self.book = Book.objects.create(name='test_1', price=25.5, author_name="Valera-1", owner=self.users[0])
+        self.other_book = Book.objects.create(name='test_2', price=25.5, author_name="Valera-1")
+        for user in self.users:
+            UserBookRelation.objects.create(user=user, book=self.book)
+        UserBookRelation.objects.create(user=self.users[0], book=self.other_book)
+
+    def test_preview_is_capped(self):
+        url = reverse('book-detail', args=(self.book.id, ))
+        response = self.client.get(url)
+
+        self.assertEqual(response.data['readers_count'], 8)
+        self.assertEqual([reader['first_name'] for reader in response.data['readers_preview']],
+                         [f'first_{i}' for i in range(settings.BOOK_READERS_PREVIEW_SIZE)])
+
+    def test_readers_list_is_paginated(self):
+        url = reverse('book-readers', args=(self.book.id, ))
+        response = self.client.get(url, data={'page_size': 3})
+        names = [reader['first_name'] for reader in response.data['results']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            names += [reader['first_name'] for reader in response.data['results']]
+
+        self.assertEqual(names, [f'first_{i}' for i in range(8)])
+
+    def test_readers_missing_book(self):
+        url = reverse('book-readers', args=(self.other_book.id + 1, ))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get(reverse('book-readers', args=('abc', )))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class BookCacheAPI(APITestCase):
+    def setUp(self):
+        get_cache().clear()
+        self.user = User.objects.create(username="test_user")
+        self.book_1 = Book.objects.create(name='test_1', price=25.5, author_name="Valera-1", owner=self.user)
+        self.book_2 = Book.objects.create(name='test_2', price=450, author_name="Valera-2", owner=self.user)
+
+    def test_list_is_cached_until_a_book_changes(self):
+        url = reverse('book-list')
+        first = self.client.get(url, data={'ordering': 'price'})
+        with self.assertNumQueries(0):
+            second = self.client.get(url, data={'ordering': 'price'})
+        self.assertEqual(first.data, second.data)
+
+        UserBookRelation.objects.create(user=self.user, book=self.book_1, like=True)
+        third = self.client.get(url, data={'ordering': 'price'})
+        self.assertEqual(third.data['results'][0]['annotated_likes'], 1)
+
+    def test_detail_invalidation_is_targeted(self):
+        url_1 = reverse('book-detail', args=(self.book_1.id, ))
+        url_2 = reverse('book-detail', args=(self.book_2.id, ))
+        self.client.get(url_1)
+        self.client.get(url_2)
+
+        UserBookRelation.objects.create(user=self.user, book=self.book_1, rate=4)
+
+        with self.assertNumQueries(0):
+            self.client.get(url_2)
+        response = self.client.get(url_1)
+        self.assertEqual(response.data['rating'], '4.00')
+
+    def test_conditional_requests(self):
+        url = reverse('book-detail', args=(self.book_1.id, ))
+        response = self.client.get(url)
+        etag, last_modified = response['ETag'], response['Last-Modified']
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.book_1.name = 'renamed'
+        self.book_1.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_queryset_delete(self):
+        list_url, url = reverse('book-list'), reverse('book-detail', args=(self.book_1.id, ))
+        self.client.get(list_url)
+        self.client.get(url)
+
+        Book.objects.filter(id=self.book_1.id).delete()
+
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get(list_url)
+        self.assertEqual([book['id'] for book in response.data['results']], [self.book_2.id])
+
+    def test_book_bumped_while_list_is_built(self):
+        url = reverse('book-list')
+        paginate = KeysetPagination.paginate_queryset
+
+        def paginate_and_bump(pagination, *args, **kwargs):
+            page = paginate(pagination, *args, **kwargs)
+            bump_book(self.book_1.id)
+            return page
+
+        with patch.object(KeysetPagination, 'paginate_queryset', paginate_and_bump):
+            self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        self.assertTrue(queries)
+
+    def test_authenticated_requests_bypass_cache(self):
+        url = reverse('book-list')
+        self.client.get(url)
+        self.client.force_login(self.user)
+        response = self.client.get(url)
+        self.assertNotIn('ETag', response)
+
+
+class BookSearchAPI(APITestCase):
+    def setUp(self):
+        self.book_1 = Book.objects.create(name='Boring', price=10, author_name="Someone")
+        self.book_2 = Book.objects.create(name='Unrelated', price=10, author_name="Nobody")
+        self.book_3 = Book.objects.create(name='Ringworld', price=10, author_name="Niven")
+        self.book_4 = Book.objects.create(name='Lord', price=10, author_name="Ring")
+
+    def test_relevance_ordering(self):
+        url = reverse('book-list')
+        response = self.client.get(url, data={'search': 'ring', 'ordering': '-relevance,id'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([book['id'] for book in response.data['results']],
+                         [self.book_4.id, self.book_3.id, self.book_1.id])
+
+    def test_search_uses_indexed_expressions(self):
+        # Compiled for PostgreSQL without connecting: the icontains WHERE clause
+        # must apply the same UPPER() expression the trigram indexes are built on.
+        postgres = PostgresDatabaseWrapper({**connection.settings_dict,
+                                            'ENGINE': 'django.db.backends.postgresql'})
+        request = Request(APIRequestFactory().get(reverse('book-list'), {'search': 'ring'}))
+        queryset = BookSearchFilter().filter_queryset(request, Book.objects.all(), BookViewSet())
+        sql, params = queryset.query.get_compiler(connection=postgres).as_sql()
+        where = sql.split(' WHERE ', 1)[1]
+        editor = postgres.SchemaEditorClass(postgres, collect_sql=True)
+        indexes = {index.name: str(index.create_sql(Book, editor)) for index in Book._meta.indexes}
+
+        for column, index in [('name', 'store_book_name_trgm_idx'), ('author_name', 'store_book_author_trgm_idx')]:
+            self.assertIn(f'UPPER("store_book"."{column}"::text) LIKE UPPER(%s)', where)
+            self.assertIn(f'USING gin ((UPPER("{column}") gin_trgm_ops))', indexes[index])
+        self.assertIn('%ring%', params)
+
+    def test_bench_search_command(self):
+        out = StringIO()
+        call_command('bench_search', 'ring', '--repeat', '2', stdout=out)
+        self.assertEqual(out.getvalue().count("'ring'"), 3)
+
+
+class BookRelationBulkAPI(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="test_user")
+        self.user2 = User.objects.create(username="test_user2")
+        self.books = [Book.objects.create(name=f'test_{i}', price=25.5, author_name="Valera") for i in range(20)]
+        UserBookRelation.objects.create(user=self.user, book=self.books[0], like=True, rate=2)
+        UserBookRelation.objects.create(user=self.user2, book=self.books[0], rate=4)
+
+    def test_bulk_upsert(self):
+        url = reverse('userbookrelation-bulk')
+        payload = [
+            {'book': self.books[0].id, 'rate': 5},
+            {'book': self.books[1].id, 'like': True, 'in_bookmarks': True},
+            {'book': self.books[1].id, 'rate': 3},
+        ]
+        self.client.force_login(self.user)
+        response = self.client.post(url, payload, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, [
+            {'book': self.books[0].id, 'like': True, 'in_bookmarks': False, 'rate': 5},
+            {'book': self.books[1].id, 'like': True, 'in_bookmarks': True, 'rate': 3},
+        ])
+        self.assertEqual(UserBookRelation.objects.filter(user=self.user).count(), 2)
+
+        book_0, book_1 = Book.objects.get(id=self.books[0].id), Book.objects.get(id=self.books[1].id)
+        self.assertEqual((book_0.rating, book_0.likes_count, book_0.readers_count), (Decimal('4.50'), 1, 2))
+        self.assertEqual((book_1.rating, book_1.likes_count, book_1.readers_count), (Decimal('3.00'), 1, 1))
+
+    def test_query_count_does_not_grow_with_entries(self):
+        url = reverse('userbookrelation-bulk')
+        self.client.force_login(self.user)
+
+        def post(books):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(url, [{'book': book.id} for book in books], format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return len(queries)
+
+        self.assertEqual(post(self.books[2:4]), post(self.books[10:20]))
+
+    def test_bulk_unknown_book(self):
+        url = reverse('userbookrelation-bulk')
+        self.client.force_login(self.user)
+        response = self.client.post(url, [{'book': self.books[-1].id + 1, 'like': True}], format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        liked = UserBookRelation.objects.filter(user=self.user, like=True)
+        self.assertFalse(liked.exclude(book=self.books[0]).exists())
+
+
+class BookAsyncAPI(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='test_user')
+        readers = [User.objects.create(username=f'reader_{i}', first_name=f'first_{i}') for i in range(7)]
+        for i, price in enumerate([10, 20, 20, 30]):
+            book = Book.objects.create(name=f'test_{i}', price=price, author_name=f'Author-{i % 2}', owner=self.user)
+            for reader in readers[i:]:
+                UserBookRelation.objects.create(user=reader, book=book, like=True, rate=i + 1)
+
+    async def assertSameAsSync(self, params, path='/book/'):
+        sync_response = await self.async_client.get(path, params, headers={'Accept': 'application/json'})
+        async_response = await self.async_client.get(f'/async{path}', params)
+        self.assertEqual(async_response.status_code, sync_response.status_code)
+        self.assertEqual(async_response.content.replace(b'/async/', b'/'), sync_response.content)
+        return json.loads(async_response.content)
+
+    async def test_list(self):
+        data = await self.assertSameAsSync({})
+        self.assertEqual(len(data['results']), 4)
+        self.assertEqual(len(data['results'][0]['readers_preview']), settings.BOOK_READERS_PREVIEW_SIZE)
+
+    async def test_filter_search_ordering(self):
+        await self.assertSameAsSync({'price': 20})
+        await self.assertSameAsSync({'search': 'Author-1', 'ordering': '-price'})
+
+    async def test_pages(self):
+        data = await self.assertSameAsSync({'page_size': 1, 'ordering': '-price'})
+        while data['next']:
+            response = await self.async_client.get(data['next'])
+            data = json.loads(response.content)
+            self.assertEqual(len(data['results']), 1)
+        self.assertEqual(data['results'][0]['price'], '10.00')
+
+    async def test_invalid_cursor(self):
+        await self.assertSameAsSync({'cursor': 'garbage'})
+
+    async def test_detail(self):
+        book = await Book.objects.afirst()
+        await self.assertSameAsSync({}, f'/book/{book.id}/')
+        await self.assertSameAsSync({}, '/book/0/')
+
+
+class BookLeaderboardAPI(APITestCase):
+    def setUp(self):
+        self.owner = User.objects.create(username='owner')
+        self.users = [User.objects.create(username=f'user_{i}') for i in range(3)]
+        self.books = [Book.objects.create(name=f'test_{i}', price=10, author_name='Author', owner=self.owner)
+                      for i in range(4)]
+        for user, book, rate in [(self.users[0], self.books[1], 5), (self.users[1], self.books[1], 4),
+                                 (self.users[0], self.books[2], 5), (self.users[2], self.books[3], 1)]:
+            UserBookRelation.objects.create(user=user, book=book, like=True, rate=rate)
+
+    def ids(self, name, params=None):
+        response = self.client.get(reverse(f'book-{name}'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [book['id'] for book in response.data]
+
+    def test_top_rated(self):
+        self.assertEqual(self.ids('top-rated'), [self.books[2].id, self.books[1].id, self.books[3].id])
+
+    def test_most_liked(self):
+        self.assertEqual(self.ids('most-liked'), [self.books[1].id, self.books[2].id, self.books[3].id,
+                                                  self.books[0].id])
+
+    def test_trending(self):
+        self.assertEqual(self.ids('trending')[0], self.books[1].id)
+        self.assertNotIn(self.books[0].id, self.ids('trending'))
+
+    def test_limit(self):
+        self.assertEqual(self.ids('most-liked', {'limit': 2}), [self.books[1].id, self.books[2].id])
+        self.assertEqual(len(self.ids('most-liked', {'limit': 'x'})), 4)
+        self.assertEqual(len(self.ids('most-liked', {'limit': 0})), 4)
+        with override_settings(LEADERBOARD_MAX_SIZE=3):
+            self.assertEqual(len(self.ids('most-liked', {'limit': 100})), 3)
+
+    def test_queries(self):
+        with self.assertNumQueries(2):
+            self.client.get(reverse('book-top-rated'))
+
+
+class BookUserStateAPI(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='test_user')
+        self.other = User.objects.create(username='other_user')
+        self.book_1 = Book.objects.create(name='test_1', price=10, author_name='Author', owner=self.user)
+        self.book_2 = Book.objects.create(name='test_2', price=20, author_name='Author', owner=self.user)
+        self.book_3 = Book.objects.create(name='test_3', price=30, author_name='Author', owner=self.user)
+        UserBookRelation.objects.create(user=self.user, book=self.book_1, like=True, rate=4)
+        UserBookRelation.objects.create(user=self.user, book=self.book_2, in_bookmarks=True)
+        UserBookRelation.objects.create(user=self.other, book=self.book_3, like=True, in_bookmarks=True, rate=5)
+
+    def test_list(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('book-list'), {'page_size': 10})
+        states = {book['id']: (book['my_like'], book['my_bookmark'], book['my_rate'])
+                  for book in response.data['results']}
+        self.assertEqual(states, {
+            self.book_1.id: (True, False, 4),
+            self.book_2.id: (False, True, None),
+            self.book_3.id: (False, False, None),
+        })
+
+    def test_retrieve_and_update(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('book-detail', args=(self.book_1.id, )))
+        self.assertTrue(response.data['my_like'])
+
+        response = self.client.patch(reverse('book-detail', args=(self.book_1.id, )), {'price': '11.00'})
+        self.assertEqual(response.data['my_rate'], 4)
+
+        response = self.client.post(reverse('book-list'), {'name': 'new', 'price': '5.00', 'author_name': 'Author'})
+        self.assertEqual((response.data['my_like'], response.data['my_bookmark'], response.data['my_rate']),
+                         (False, False, None))
+
+    def test_anonymous(self):
+        response = self.client.get(reverse('book-list'))
+        self.assertNotIn('my_like', response.data['results'][0])
+
+
+class BookShelfAPI(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='test_user')
+        self.other = User.objects.create(username='other_user')
+        self.books = [Book.objects.create(name=f'test_{i}', price=10 + i, author_name='Author', owner=self.other)
+                      for i in range(6)]
+        for book in self.books[:5]:
+            UserBookRelation.objects.create(user=self.user, book=book, in_bookmarks=book.price % 2 == 0,
+                                            like=book.price % 2 == 1)
+        UserBookRelation.objects.create(user=self.other, book=self.books[5], like=True, in_bookmarks=True)
+
+    def test_filters(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('book-list'), {'bookmarked': 'me'})
+        self.assertEqual([book['id'] for book in response.data['results']],
+                         [book.id for book in self.books[0:5:2]])
+        self.assertTrue(all(book['my_bookmark'] for book in response.data['results']))
+
+        response = self.client.get(reverse('book-list'), {'liked': 'me', 'price': 11})
+        self.assertEqual([book['id'] for book in response.data['results']], [self.books[1].id])
+
+    def test_filter_anonymous(self):
+        response = self.client.get(reverse('book-list'), {'bookmarked': 'me'})
+        self.assertIn(response.status_code, (status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN))
+
+    def test_bookmarks(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('me-bookmarks-list'), {'page_size': 2})
+        ids = [book['id'] for book in response.data['results']]
+        next_page = self.client.get(response.data['next']).data
+        self.assertIsNone(next_page['next'])
+        ids += [book['id'] for book in next_page['results']]
+        self.assertEqual(ids, [book.id for book in self.books[0:5:2]])
+
+    def test_likes(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('me-likes-list'))
+        self.assertEqual([book['id'] for book in response.data['results']], [self.books[1].id, self.books[3].id])
+        self.assertTrue(all(book['my_like'] for book in response.data['results']))
+
+    def test_requires_login(self):
+        response = self.client.get(reverse('me-likes-list'))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class BookFastSerializerAPI(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='test_user')
+        readers = [User.objects.create(username=f'reader_{i}', first_name=f'first_{i}', last_name=' ')
+                   for i in range(7)]
+        for i, price in enumerate(['10.00', '20.50', '20.50', '30.99']):
+            book = Book.objects.create(name=f'test_{i} ä', price=price, author_name=f'Author-{i % 2}',
+                                       owner=self.user if i else None)
+            for reader in readers[i:]:
+                UserBookRelation.objects.create(user=reader, book=book, like=i % 2 == 0, rate=i + 1)
+        UserBookRelation.objects.create(user=self.user, book=book, in_bookmarks=True, like=True, rate=2)
+
+    def assertSameAsSlow(self, name, params=None):
+        responses = []
+        for fast in (True, False):
+            get_cache().clear()
+            with self.settings(BOOK_FAST_SERIALIZER=fast):
+                response = self.client.get(reverse(name), params, HTTP_ACCEPT='application/json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            responses.append(b''.join(response.streaming_content) if response.streaming else response.content)
+        self.assertEqual(responses[0], responses[1])
+
+    def test_anonymous(self):
+        self.assertSameAsSlow('book-list')
+        self.assertSameAsSlow('book-list', {'page_size': 2, 'ordering': '-price'})
+        self.assertSameAsSlow('book-list', {'search': 'Author-1', 'ordering': '-relevance'})
+        self.assertSameAsSlow('book-export')
+        self.assertSameAsSlow('book-export', {'export_format': 'ndjson'})
+        self.assertSameAsSlow('book-top-rated')
+
+    def test_authenticated(self):
+        self.client.force_login(self.user)
+        self.assertSameAsSlow('book-list')
+        self.assertSameAsSlow('book-list', {'page_size': 2})
+        self.assertSameAsSlow('book-export')
+        self.assertSameAsSlow('book-most-liked')
+        self.assertSameAsSlow('me-bookmarks-list')
+        self.assertSameAsSlow('me-likes-list')
+
+
+@override_settings(BOOK_CHANGES_LAG_SECONDS=0)
+class BookChangesAPI(APITestCase):
+    def setUp(self):
+        self.owner = User.objects.create(username='owner')
+        self.books = [Book.objects.create(name=f'test_{i}', price=10 + i, author_name='Author', owner=self.owner)
+                      for i in range(5)]
+
+    def sync(self, since=None, page_size=2):
+        params = {'page_size': page_size}
+        if since is not None:
+            params['since'] = since
+        results = []
+        while True:
+            response = self.client.get(reverse('book-changes'), params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            results += response.data['results']
+            params['since'] = response.data['since']
+            if not response.data['has_more']:
+                return results, params['since']
+
+    def test_full_then_incremental(self):
+        results, since = self.sync()
+        self.assertEqual([book['id'] for book in results], [book.id for book in self.books])
+        self.assertEqual(results[0]['price'], '10.00')
+        self.assertEqual(self.sync(since), ([], since))
+
+        self.client.force_login(self.owner)
+        self.client.patch(reverse('book-detail', args=(self.books[3].id, )), {'price': '99.00'})
+        self.client.patch(reverse('userbookrelation-detail', args=(self.books[1].id, )), {'like': True})
+        self.client.delete(reverse('book-detail', args=(self.books[0].id, )))
+        self.client.logout()
+
+        results, since = self.sync(since)
+        self.assertEqual(results, [
+            self.client.get(reverse('book-detail', args=(self.books[3].id, ))).data,
+            self.client.get(reverse('book-detail', args=(self.books[1].id, ))).data,
+            {'id': self.books[0].id, 'deleted': True},
+        ])
+        self.assertEqual(results[1]['annotated_likes'], 1)
+        self.assertEqual(self.sync(since), ([], since))
+
+    def test_lag_holds_back_recent_changes(self):
+        _, since = self.sync()
+        with self.settings(BOOK_CHANGES_LAG_SECONDS=60):
+            self.books[2].save()
+            self.assertEqual(self.sync(since)[0], [])
+        self.assertEqual([book['id'] for book in self.sync(since)[0]], [self.books[2].id])
+
+    def test_first_sync_skips_old_tombstones(self):
+        self.books[0].delete()
+        results, _ = self.sync()
+        self.assertEqual([book['id'] for book in results], [book.id for book in self.books[1:]])
+
+    def test_invalid_token(self):
+        response = self.client.get(reverse('book-changes'), {'since': 'garbage'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class BookImportAPI(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='test_user')
+        self.url = reverse('book-import')
+
+    def post(self, body, content_type):
+        return self.client.generic('POST', self.url, body, content_type=content_type)
+
+    def test_csv(self):
+        self.client.force_login(self.user)
+        body = 'name,price,author_name\n' \
+               'First, 10.5,Author\n' \
+               ',abc,Author\n' \
+               '"Quoted, name",7,"Ä ""B"""\n'
+        response = self.post(body.encode() + b'Bad bytes,1,\xff\n', 'text/csv; charset=utf-8')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        invalid = {'name': '', 'price': 'abc', 'author_name': 'Author'}
+        serializer = BookSerializer(data=invalid)
+        serializer.is_valid()
+        self.assertEqual(response.data['rows'], 4)
+        self.assertEqual(response.data['imported'], 2)
+        self.assertEqual(response.data['error_count'], 2)
+        self.assertEqual(response.data['errors'][0], {'line': 3, 'errors': serializer.errors})
+        self.assertEqual(response.data['errors'][1]['line'], 5)
+        self.assertEqual(list(response.data['errors'][1]['errors']), ['author_name'])
+
+        books = Book.objects.order_by('id')
+        self.assertEqual([(book.name, book.price, book.author_name, book.owner) for book in books], [
+            ('First', Decimal('10.50'), 'Author', self.user),
+            ('Quoted, name', Decimal('7.00'), 'Ä "B"', self.user),
+        ])
+
+    def test_ndjson(self):
+        self.client.force_login(self.user)
+        body = '{"name": "One", "price": 1.25, "author_name": "A"}\n\n' \
+               '[1, 2]\n' \
+               '{"name": "Two", "price": "123456.00", "author_name": "A"}\n' \
+               '{"name": "Three", "price": "2", "author_name": "A"}\n'
+        response = self.post(body, 'application/x-ndjson')
+        self.assertEqual(response.data['imported'], 2)
+        self.assertEqual([error['line'] for error in response.data['errors']], [3, 4])
+        self.assertEqual(list(response.data['errors'][1]['errors']), ['price'])
+        self.assertEqual(list(Book.objects.order_by('id').values_list('name', 'price')),
+                         [('One', Decimal('1.25')), ('Three', Decimal('2.00'))])
+
+    def test_invalidates_cache(self):
+        self.assertEqual(self.client.get(reverse('book-list')).data['results'], [])
+        self.client.force_login(self.user)
+        self.post('name,price,author_name\nOne,1,A\n', 'text/csv')
+        self.client.logout()
+        self.assertEqual(len(self.client.get(reverse('book-list')).data['results']), 1)
+
+    def test_rejected(self):
+        response = self.post('name,price,author_name\n', 'text/csv')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_login(self.user)
+        response = self.post('{}', 'application/json')
+        self.assertEqual(response.status_code, status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
+
+class BookRatingsAPI(APITestCase):
+    def setUp(self):
+        self.book = Book.objects.create(name='test', price=10, author_name='Author')
+        for i, rate in enumerate((5, 5, 3)):
+            UserBookRelation.objects.create(user=User.objects.create(username=f'user_{i}'), book=self.book, rate=rate)
+
+    def test_ratings(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('book-ratings', args=(self.book.id, )))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'id': self.book.id, 'rating': '4.33', 'rating_count': 3,
+                                         'histogram': {'1': 0, '2': 0, '3': 1, '4': 0, '5': 2}})
+        self.assertEqual(len(queries), 1)
+
+    def test_missing(self):
+        response = self.client.get(reverse('book-ratings', args=(self.book.id + 1, )))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get(reverse('book-ratings', args=('abc', )))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class AuthorStatsAPI(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='user')
+        self.books = [Book.objects.create(name=f'test_{i}', price=10, author_name=author)
+                      for i, author in enumerate(['B. Author', 'A. Author', 'B. Author'])]
+        with self.captureOnCommitCallbacks(execute=True):
+            UserBookRelation.objects.create(user=self.user, book=self.books[0], like=True, rate=4)
+            UserBookRelation.objects.create(user=self.user, book=self.books[2], like=True, rate=5)
+
+    def test_retrieve(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('authorstats-detail', args=('B. Author', )))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'author_name': 'B. Author', 'books_count': 2, 'likes_count': 2,
+                                         'rating': '4.50', 'rating_count': 2})
+        self.assertEqual(len(queries), 1)
+
+    def test_list(self):
+        self.books[1].delete()
+        response = self.client.get(reverse('authorstats-list'), {'page_size': 1})
+        self.assertEqual([author['author_name'] for author in response.data['results']], ['B. Author'])
+        self.assertIsNone(response.data['next'])
+
+
+class BookSimilarAPI(APITestCase):
+    def setUp(self):
+        self.books = [Book.objects.create(name=f'test_{i}', price=10, author_name='Author') for i in range(4)]
+        BookNeighbour.objects.bulk_create([
+            BookNeighbour(book=self.books[0], neighbour=self.books[2], score=0.9),
+            BookNeighbour(book=self.books[0], neighbour=self.books[1], score=0.5),
+            BookNeighbour(book=self.books[0], neighbour=self.books[3], score=0.7),
+        ])
+
+    def test_similar(self):
+        url = reverse('book-similar', args=(self.books[0].id, ))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([book['id'] for book in response.data], [self.books[i].id for i in (2, 3, 1)])
+        self.assertEqual(len(queries), 2)
+
+        self.books[3].delete()
+        response = self.client.get(url, {'limit': 1})
+        self.assertEqual([book['id'] for book in response.data], [self.books[2].id])
+        response = self.client.get(url)
+        self.assertEqual([book['id'] for book in response.data], [self.books[2].id, self.books[1].id])
+
+    def test_without_neighbours(self):
+        response = self.client.get(reverse('book-similar', args=(self.books[1].id, )))
+        self.assertEqual(response.data, [])
+        response = self.client.get(reverse('book-similar', args=(self.books[3].id + 1, )))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get(reverse('book-similar', args=('abc', )))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
@@ -0,0 +1,101 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase
+
+from store.benchmarks import SCENARIOS, BenchmarkRunner, compare
+from store.models import Book, UserBookRelation
+
+
+class GenerateDatasetTestCase(TestCase):
+    def test_counters_match_relations(self):
+        call_command('generate_dataset', '--books', '50', '--users', '20', '--relations', '200',
+                     '--authors', '5', '--batch-size', '30', stdout=StringIO())
+
+        self.assertEqual(Book.objects.count(), 50)
+        self.assertEqual(User.objects.filter(username__startswith='bench_user_').count(), 20)
+        self.assertEqual(Book.objects.aggregate(total=Sum('readers_count'))['total'],
+                         UserBookRelation.objects.count())
+
+        out = StringIO()
+        call_command('check_counters', stdout=out)
+        self.assertIn('All counters are consistent', out.getvalue())
+
+        ratings = dict(Book.objects.values_list('id', 'rating'))
+        call_command('rebuild_ratings', stdout=StringIO())
+        self.assertEqual(dict(Book.objects.values_list('id', 'rating')), ratings)
+
+
+class BenchApiTestCase(TestCase):
+    def test_results_are_written_and_compared(self):
+        owner = User.objects.create(username='owner')
+        for i in range(5):
+            Book.objects.create(name=f'ring {i}', price=10 + i, author_name='Author', owner=owner)
+
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'results.json')
+            call_command('bench_api', '--requests', '5', '--warmup', '1', '--host', 'testserver',
+                         '--output', output, stdout=StringIO())
+            with open(output) as file:
+                results = json.load(file)
+
+        self.assertEqual(set(results['scenarios']), set(SCENARIOS))
+        for result in results['scenarios'].values():
+            self.assertEqual(result['requests'], 5)
+            self.assertEqual(result['errors'], 0)
+            self.assertIsNotNone(result['p99_ms'])
+        self.assertTrue(compare(results, results))
+
+    def test_asgi_modes(self):
+        owner = User.objects.create(username='owner')
+        Book.objects.create(name='ring', price=10, author_name='Author', owner=owner)
+
+        # WSGI workers are threads with their own connections, which cannot
+        # see the test transaction.
+        for mode, concurrency in [('wsgi', 1), ('asgi', 2), ('asgi-async', 2)]:
+            runner = BenchmarkRunner(requests=4, warmup=1, concurrency=concurrency, cold_cache=True,
+                                     host='testserver', mode=mode)
+            results = runner.run(['list', 'detail', 'relation_patch'])
+            self.assertEqual(results['meta']['mode'], mode)
+            for result in results['scenarios'].values():
+                self.assertEqual(result['requests'], 4)
+                self.assertEqual(result['errors'], 0)
+                self.assertGreater(result['queries_mean'], 0, (mode, result))
+            # No read was answered from the response cache, even with concurrent workers.
+            for name in ('list', 'detail'):
+                result = results['scenarios'][name]
+                self.assertEqual(result['queries_mean'], result['queries_max'], (mode, name, result))
+
+
+class BenchSerializersTestCase(TestCase):
+    def test_fast_path_matches(self):
+        owner = User.objects.create(username='owner', first_name='Own')
+        for i in range(3):
+            book = Book.objects.create(name=f'ring {i}', price=10 + i, author_name='Author', owner=owner)
+            UserBookRelation.objects.create(user=owner, book=book, like=True, rate=i + 1)
+
+        out = StringIO()
+        call_command('bench_serializers', '--limit', '10', '--repeat', '2', stdout=out)
+        self.assertIn('3 books, identical output: True', out.getvalue())
+
+
+class BenchApiConnectionsTestCase(TransactionTestCase):
+    def test_conn_max_age_override(self):
+        owner = User.objects.create(username='owner')
+        Book.objects.create(name='ring', price=10, author_name='Author', owner=owner)
+
+        runner = BenchmarkRunner(requests=3, warmup=0, host='testserver', conn_max_age=0)
+        try:
+            results = runner.run(['detail'])
+        finally:
+            connection.settings_dict['CONN_MAX_AGE'] = settings.DATABASES['default']['CONN_MAX_AGE']
+
+        self.assertEqual(results['meta']['conn_max_age'], 0)
+        self.assertEqual(results['scenarios']['detail']['errors'], 0)
@@ -0,0 +1,28 @@
+from django.test import SimpleTestCase, override_settings
+
+from store.checks import check_replica_pins, check_response_cache
+
+SHARED_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'cache'}}
+LOCAL_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+class CacheChecksTestCase(SimpleTestCase):
+    @override_settings(CACHES=LOCAL_CACHE)
+    def test_local_response_cache(self):
+        self.assertEqual([error.id for error in check_response_cache(None)], ['store.E001'])
+
+    @override_settings(CACHES=SHARED_CACHE)
+    def test_shared_response_cache(self):
+        self.assertEqual(check_response_cache(None), [])
+
+    @override_settings(CACHES=LOCAL_CACHE, DATABASE_REPLICAS=['replica_0'])
+    def test_local_replica_pins(self):
+        self.assertEqual([error.id for error in check_replica_pins(None)], ['store.E002'])
+
+    @override_settings(CACHES=SHARED_CACHE, DATABASE_REPLICAS=['replica_0'])
+    def test_shared_replica_pins(self):
+        self.assertEqual(check_replica_pins(None), [])
+
+    @override_settings(CACHES=LOCAL_CACHE, DATABASE_REPLICAS=[])
+    def test_no_replicas(self):
+        self.assertEqual(check_replica_pins(None), [])
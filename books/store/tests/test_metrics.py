@@ -0,0 +1,65 @@
+from django.contrib.auth.models import User
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from store import metrics
+from store.models import Book
+
+
+class QueryMetricsMiddlewareTestCase(APITestCase):
+    def setUp(self):
+        for histogram in metrics.REGISTRY:
+            histogram.clear()
+        self.user = User.objects.create(username='test_user')
+        self.book = Book.objects.create(name='test_1', price=25.5, author_name='Valera', owner=self.user)
+
+    def test_request_is_recorded(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse('book-list'))
+
+        labels = (('endpoint', 'book-list'), ('method', 'GET'))
+        counts, total_queries = metrics.query_count.collect()[labels]
+        self.assertEqual(sum(counts), 1)
+        self.assertGreater(total_queries, 0)
+        self.assertIn(labels, metrics.request_duration.collect())
+        self.assertIn(labels, metrics.render_duration.collect())
+
+    async def test_async_request_is_recorded(self):
+        await self.async_client.get(reverse('async-book-list'))
+
+        labels = (('endpoint', 'async-book-list'), ('method', 'GET'))
+        counts, total_queries = metrics.query_count.collect()[labels]
+        self.assertEqual(sum(counts), 1)
+        self.assertGreater(total_queries, 0)
+
+    def test_metrics_endpoint(self):
+        self.client.get(reverse('book-list'))
+        response = self.client.get('/metrics/')
+
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        body = response.content.decode()
+        self.assertIn('# TYPE store_request_queries histogram', body)
+        self.assertIn('store_request_queries_count{endpoint="book-list",method="GET"} 1', body)
+        self.assertIn('store_request_duration_seconds_bucket{endpoint="book-list",method="GET",le="+Inf"} 1', body)
+
+    def test_metrics_endpoint_access(self):
+        response = self.client.get('/metrics/', REMOTE_ADDR='203.0.113.7')
+        self.assertEqual(response.status_code, 403)
+
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_login(self.user)
+        response = self.client.get('/metrics/', REMOTE_ADDR='203.0.113.7')
+        self.assertEqual(response.status_code, 200)
+
+        with override_settings(METRICS_ALLOWED_IPS=['203.0.113.7']):
+            self.client.logout()
+            response = self.client.get('/metrics/', REMOTE_ADDR='203.0.113.7')
+            self.assertEqual(response.status_code, 200)
+
+    @override_settings(STORE_QUERY_BUDGETS={'book-detail': 0})
+    def test_query_budget_warning(self):
+        with self.assertLogs('store.middleware', level='WARNING') as logs:
+            self.client.get(reverse('book-detail', args=(self.book.id, )))
+        self.assertIn('possible N+1', logs.output[0])
@@ -0,0 +1,134 @@
+from decimal import Decimal
+
+from django.urls import reverse
+from rest_framework.test import APIRequestFactory, APITestCase
+
+from store.models import Book
+from store.permissions import IsOwnerOrStaffORReadOnly
+from store.tests.utils import QueryCountMixin
+
+
+class BookViewSetQueryCountTestCase(QueryCountMixin, APITestCase):
+    def test_list(self):
+        queries = self.assertQueryCounts(lambda: self.client.get(reverse('book-list')), 2)
+        self.assertNotIn('GROUP BY', queries[0])
+        self.assertIn('ROW_NUMBER()', queries[1])
+
+    def test_list_with_user_state(self):
+        self.client.force_login(self.readers[0])
+        queries = self.assertQueryCounts(lambda: self.client.get(reverse('book-list'), {'page_size': 20}), 4)
+        self.assertIn('LEFT OUTER JOIN "store_userbookrelation" my_relation', queries[2])
+
+    def test_list_paginated(self):
+        params = {'page_size': 20, 'ordering': '-price'}
+        self.assertQueryCounts(lambda: self.client.get(reverse('book-list'), params), 2)
+
+    def test_search(self):
+        self.assertQueryCounts(lambda: self.client.get(reverse('book-list'), {'search': 'book', 'page_size': 20}), 2)
+
+    def test_export(self):
+        self.sizes = (1, 10)
+        self.assertQueryCounts(lambda: self.stream(self.client.get(reverse('book-export'))), 2)
+
+    def test_retrieve(self):
+        self.assertQueryCounts(lambda: self.client.get(reverse('book-detail', args=(self.books[0].id, ))), 2)
+
+    def test_readers(self):
+        self.assertQueryCounts(lambda: self.client.get(reverse('book-readers', args=(self.books[0].id, ))), 2)
+
+    def test_create(self):
+        self.client.force_login(self.owner)
+        payload = {'name': 'new', 'price': Decimal('10.00'), 'author_name': 'author'}
+        # One more for the AuthorStats upsert.
+        self.assertQueryCounts(lambda: self.client.post(reverse('book-list'), payload), 5)
+
+    def test_update(self):
+        self.client.force_login(self.owner)
+        self.grow_dataset(1)
+        payload = {'name': 'updated', 'price': Decimal('10.00'), 'author_name': self.books[0].author_name}
+        self.assertQueryCounts(lambda: self.client.put(reverse('book-detail', args=(self.books[0].id, )), payload), 5)
+
+    def test_update_author(self):
+        # Changing the author recounts the old and new AuthorStats rows.
+        self.client.force_login(self.owner)
+        self.grow_dataset(1)
+        payload = {'name': 'updated', 'price': Decimal('10.00'), 'author_name': 'another author'}
+        queries = self.capture(lambda: self.client.put(reverse('book-detail', args=(self.books[0].id, )), payload))
+        self.assertEqual(len(queries), 7, '\n'.join(queries))
+
+    def test_partial_update(self):
+        self.client.force_login(self.owner)
+        self.grow_dataset(1)
+        self.assertQueryCounts(
+            lambda: self.client.patch(reverse('book-detail', args=(self.books[0].id, )), {'price': '11.00'}), 5
+        )
+
+    def test_destroy(self):
+        self.client.force_login(self.owner)
+        self.grow_dataset(1000)
+        for book in self.books[:3]:
+            queries = self.capture(lambda: self.client.delete(reverse('book-detail', args=(book.id, ))))
+            # The relations have no delete receivers, so they go in one DELETE without being loaded.
+            self.assertEqual(len(queries), 8, '\n'.join(queries))
+
+    @staticmethod
+    def stream(response):
+        b''.join(response.streaming_content)
+        return response
+
+
+class ShelfQueryCountTestCase(QueryCountMixin, APITestCase):
+    def test_likes(self):
+        self.client.force_login(self.readers[0])
+        self.assertQueryCounts(lambda: self.client.get(reverse('me-likes-list'), {'page_size': 20}), 4)
+
+
+class UserBookRelationViewQueryCountTestCase(QueryCountMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.owner)
+        self.grow_dataset(1)
+        self.url = reverse('userbookrelation-detail', args=(self.books[0].id, ))
+
+    def test_create(self):
+        self.assertEqual(len(self.capture(lambda: self.client.patch(self.url, {'like': True}))), 8)
+
+    def test_like(self):
+        self.client.patch(self.url, {'like': False})
+        likes = iter([True, False] * 10)
+        self.assertQueryCounts(lambda: self.client.patch(self.url, {'like': next(likes)}), 8)
+
+    def test_rate(self):
+        self.client.patch(self.url, {'rate': 1})
+        rates = iter(range(2, 100))
+        self.assertQueryCounts(lambda: self.client.patch(self.url, {'rate': next(rates) % 5 + 1}), 8)
+
+    def test_bulk(self):
+        # Counters of every touched book are updated in one statement, their AuthorStats rows in another.
+        for size in (10, 100):
+            synced = len(self.books)
+            self.grow_dataset(size)
+            payload = [{'book': book.id, 'like': True} for book in self.books[synced:]]
+            queries = self.capture(lambda: self.client.post(reverse('userbookrelation-bulk'), payload, format='json'))
+            self.assertEqual(len(queries), 9, '\n'.join(queries))
+            payload = [{'book': book.id, 'rate': 3} for book in self.books[synced:]]
+            queries = self.capture(lambda: self.client.post(reverse('userbookrelation-bulk'), payload, format='json'))
+            self.assertEqual(len(queries), 9, '\n'.join(queries))
+
+
+class PermissionQueryCountTestCase(QueryCountMixin, APITestCase):
+    def test_owner_check(self):
+        self.grow_dataset(1)
+        book = Book.objects.get(id=self.books[0].id)
+        request = APIRequestFactory().patch('/')
+        request.user = self.owner
+        with self.assertNumQueries(0):
+            self.assertTrue(IsOwnerOrStaffORReadOnly().has_object_permission(request, None, book))
+
+
+class AdminQueryCountTestCase(QueryCountMixin, APITestCase):
+    def test_relation_changelist(self):
+        self.owner.is_staff = self.owner.is_superuser = True
+        self.owner.save()
+        self.client.force_login(self.owner)
+        self.assertQueryCounts(lambda: self.client.get(reverse('admin:store_userbookrelation_changelist')), 5)
@@ -0,0 +1,40 @@
+import datetime
+import json
+import uuid
+from decimal import Decimal
+from unittest import mock
+
+from django.test import SimpleTestCase
+from rest_framework.renderers import JSONRenderer
+
+from store import renderers
+from store.renderers import FastJSONRenderer, dumps
+
+
+class FastJSONRendererTestCase(SimpleTestCase):
+    data = {
+        'text': 'ä "quoted" \\ \n\t\x01    /',
+        'numbers': [0, -1, 2 ** 63 - 1, 0.25, True, None],
+        'price': Decimal('25.50'),
+        'created': datetime.datetime(2023, 8, 1, 12, 30, 15, 123456, tzinfo=datetime.timezone.utc),
+        'day': datetime.date(2023, 8, 1),
+        'id': uuid.UUID(int=1),
+        'nested': [{'a': []}],
+    }
+
+    def test_same_bytes_as_json_renderer(self):
+        self.assertEqual(FastJSONRenderer().render(self.data), JSONRenderer().render(self.data))
+        self.assertEqual(dumps(self.data).encode(), JSONRenderer().render(self.data))
+
+    def test_fallbacks(self):
+        data = {'big': 2 ** 70, 1: 'key'}
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(json.loads(dumps(data)), {'big': 2 ** 70, '1': 'key'})
+
+        context = {'indent': 2}
+        self.assertEqual(FastJSONRenderer().render(self.data, 'application/json', context),
+                         JSONRenderer().render(self.data, 'application/json', context))
+
+        with mock.patch.object(renderers, 'orjson', None):
+            self.assertEqual(FastJSONRenderer().render(self.data), JSONRenderer().render(self.data))
+        self.assertEqual(FastJSONRenderer().render(None), b'')
@@ -0,0 +1,152 @@
+import os
+import tempfile
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from store.cache import get_cache
+from store.models import AuthorStats, Book, UserBookRelation
+from store.routers import PrimaryReplicaRouter, use_replica
+
+
+@override_settings(DATABASE_REPLICAS=['replica_0'])
+class PrimaryReplicaRouterTestCase(SimpleTestCase):
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+
+    def test_read(self):
+        self.assertEqual('default', self.router.db_for_read(Book))
+        with use_replica():
+            self.assertEqual('replica_0', self.router.db_for_read(Book))
+        self.assertEqual('default', self.router.db_for_read(Book))
+
+    def test_write(self):
+        with use_replica():
+            self.assertEqual('default', self.router.db_for_write(Book))
+
+    def test_migrate(self):
+        self.assertTrue(self.router.allow_migrate('default', 'store'))
+        self.assertFalse(self.router.allow_migrate('replica_0', 'store'))
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_replicas(self):
+        with use_replica():
+            self.assertEqual('default', self.router.db_for_read(Book))
+
+
+# The replica alias does not exist in tests, so picking it is recorded and
+# the query is sent to default instead.
+@override_settings(DATABASE_REPLICAS=['replica_0'])
+@patch('store.routers.random.choice', return_value='default')
+class ReplicaRoutingAPITestCase(APITestCase):
+    def setUp(self):
+        get_cache().clear()
+        self.user = User.objects.create(username='test_username')
+        self.book = Book.objects.create(name='test_1', price=25, author_name='Author 1', owner=self.user)
+
+    def test_reads_use_replica(self, choice):
+        self.client.force_login(self.user)
+        self.client.get(reverse('book-list'))
+        self.client.get(reverse('book-detail', args=(self.book.id, )))
+        self.assertTrue(choice.called)
+
+    def test_cached_reads_use_primary(self, choice):
+        self.client.get(reverse('book-list'))
+        self.client.get(reverse('book-detail', args=(self.book.id, )))
+        self.assertFalse(choice.called)
+
+    def test_writes_use_primary(self, choice):
+        self.client.force_login(self.user)
+        response = self.client.patch(reverse('userbookrelation-detail', args=(self.book.id, )), {'like': True})
+        self.assertEqual(200, response.status_code)
+        self.assertFalse(choice.called)
+
+    def test_read_your_writes(self, choice):
+        self.client.force_login(self.user)
+        self.client.get(reverse('book-list'))
+        self.assertTrue(choice.called)
+
+        self.client.patch(reverse('userbookrelation-detail', args=(self.book.id, )), {'like': True})
+        choice.reset_mock()
+        response = self.client.get(reverse('book-detail', args=(self.book.id, )))
+        self.assertEqual(1, response.data['annotated_likes'])
+        self.assertFalse(choice.called)
+
+    def test_failed_write_does_not_pin(self, choice):
+        self.client.force_login(self.user)
+        self.client.patch(reverse('userbookrelation-detail', args=(self.book.id, )), {'rate': 10})
+        self.client.get(reverse('book-list'))
+        self.assertTrue(choice.called)
+
+
+@override_settings(DATABASE_REPLICAS=['replica_0'])
+class StaleReplicaAPITestCase(APITestCase):
+    """
+    replica_0 is a separate SQLite database holding an AuthorStats row and a
+    book the primary has moved past. The alias is added after the test case
+    has set up its databases, so it is used as a real replica, outside the
+    test transaction.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.directory = tempfile.TemporaryDirectory()
+        connections.settings['replica_0'] = connections.configure_settings({
+            DEFAULT_DB_ALIAS: {},
+            'replica_0': {'ENGINE': 'django.db.backends.sqlite3',
+                          'NAME': os.path.join(cls.directory.name, 'replica.sqlite3')},
+        })['replica_0']
+        with connections['replica_0'].schema_editor() as editor:
+            for model in (User, Book, UserBookRelation, AuthorStats):
+                editor.create_model(model)
+            # The trigram indexes are PostgreSQL only.
+            editor.deferred_sql = [sql for sql in editor.deferred_sql if 'gin_trgm_ops' not in str(sql)]
+        AuthorStats.objects.using('replica_0').create(author_name='Author', books_count=1)
+        # bulk_create() leaves AuthorStats and the cache versions alone.
+        Book.objects.using('replica_0').bulk_create([Book(id=1000, name='stale', price=25, author_name='Author')])
+
+    @classmethod
+    def tearDownClass(cls):
+        connections['replica_0'].close()
+        del connections['replica_0']
+        del connections.settings['replica_0']
+        cls.directory.cleanup()
+        super().tearDownClass()
+
+    def setUp(self):
+        get_cache().clear()
+        self.user = User.objects.create(username='test_username')
+        self.books = [Book.objects.create(name=f'test_{i}', price=25, author_name='Author', owner=self.user)
+                      for i in range(2)]
+        self.url = reverse('authorstats-detail', args=('Author', ))
+
+    def test_reads_use_replica(self):
+        self.assertEqual(self.client.get(self.url).data['books_count'], 1)
+
+    def test_read_your_writes(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(self.url).data['books_count'], 1)
+
+        response = self.client.post(reverse('book-list'), {'name': 'test_2', 'price': 25, 'author_name': 'Author'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.client.get(self.url).data['books_count'], 3)
+
+        self.client.force_login(User.objects.create(username='other_user'))
+        self.assertEqual(self.client.get(self.url).data['books_count'], 1)
+
+    def test_cache_is_filled_from_primary(self):
+        Book.objects.create(id=1000, name='fresh', price=25, author_name='Author', owner=self.user)
+        url = reverse('book-detail', args=(1000, ))
+
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(url).data['name'], 'stale')
+
+        self.client.logout()
+        self.assertEqual(self.client.get(url).data['name'], 'fresh')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).data['name'], 'fresh')
@@ -4,7 +4,8 @@ from django.db.models import Count, Case, When, F
 from django.test import TestCase
 
 from store.models import Book, UserBookRelation
-from store.serializers import BookSerializer
+from store.serializers import BookSerializer, FastBookSerializer
+from store.services import attach_readers_previews
 
 
 class BookSerializerTestCase(TestCase):
@@ -46,7 +47,8 @@ class BookSerializerTestCase(TestCase):
                 'annotated_likes': 3,
                 'rating': '4.33',
                 'owner_name': user_1.username,
-                'readers': [
+                'readers_count': 3,
+                'readers_preview': [
                     {
                         'first_name': 'test_first_name_1',
                         'last_name': 'test_last_name_1',
@@ -69,7 +71,8 @@ class BookSerializerTestCase(TestCase):
                 'annotated_likes': 2,
                 'rating': '3.50',
                 'owner_name': None,
-                'readers': [
+                'readers_count': 3,
+                'readers_preview': [
                     {
                         'first_name': 'test_first_name_1',
                         'last_name': 'test_last_name_1',
@@ -86,3 +89,16 @@ class BookSerializerTestCase(TestCase):
             },
         ]
         self.assertEqual(data, expected_data)
+
+
+class FastBookSerializerTestCase(TestCase):
+    def test_same_as_book_serializer(self):
+        user = User.objects.create(username='test_username', first_name='first', last_name='last')
+        book_1 = Book.objects.create(name='test_1', price=25.5, author_name='Valera', owner=user)
+        Book.objects.create(name='test_2', price=Decimal('266.49'), author_name='Valera')
+        UserBookRelation.objects.create(user=user, book=book_1, like=True, rate=5)
+
+        books = Book.objects.annotate(owner_name=F('owner__username')).order_by('id')
+        rows = attach_readers_previews(list(books.values('id', 'name', 'price', 'author_name', 'likes_count',
+                                                         'rating', 'owner_name', 'readers_count')))
+        self.assertEqual(FastBookSerializer(rows, many=True).data, BookSerializer(books, many=True).data)
@@ -1,11 +1,25 @@
+import json
+import math
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
 from unittest.mock import patch
 
 from _decimal import Decimal
 from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from django_filters.compat import TestCase
 
-from store.models import Book, UserBookRelation
-from store.services import set_rating
+from store import services
+from store.models import AuthorStats, Book, BookNeighbour, BookTombstone, PendingRating, SimilarityBuild, \
+    UserBookRelation
+from store.services import bulk_update_relations, flush_rating_queue, rebuild_author_stats, upsert_relation
+from store.similarity import build_neighbours, count_shard
 
 
 class SetRaTingTestCase(TestCase):
@@ -21,22 +35,514 @@ class SetRaTingTestCase(TestCase):
         UserBookRelation.objects.create(user=self.user_3, book=self.book_1, like=True, rate=5)
 
     def test_calculate_average_rating(self):
-        set_rating(self.book_1)
         self.book_1.refresh_from_db()
         self.assertEqual(self.book_1.rating, Decimal('4.67'))
 
-    @patch("store.services.set_rating")
-    def test_set_rating_called_when_condition_met(self, mock_set_rating):
-        relation = UserBookRelation(user=self.user_1, book=self.book_1)
+    @patch("store.services.update_rating")
+    def test_update_rating_called_when_condition_met(self, mock_update_rating):
+        user_4 = User.objects.create(username='test_username_4')
+        relation = UserBookRelation(user=user_4, book=self.book_1)
         relation.rate = 2
         relation.save()
 
-        mock_set_rating.assert_called_once_with(self.book_1)
+        mock_update_rating.assert_called_once_with(self.book_1.id, None, 2)
 
-    @patch("store.services.set_rating")
-    def test_set_rating_not_called_when_condition_not_met(self, mock_set_rating):
+    @patch("store.services.update_rating")
+    def test_update_rating_not_called_when_condition_not_met(self, mock_update_rating):
         relation = UserBookRelation.objects.get(user=self.user_1, book=self.book_1)
         relation.rate = 5
         relation.save()
 
-        mock_set_rating.assert_not_called()
+        mock_update_rating.assert_not_called()
+
+    def test_incremental_rating(self):
+        self.book_1.refresh_from_db()
+        self.assertEqual(self.book_1.rating_sum, 14)
+        self.assertEqual(self.book_1.rating_count, 3)
+        self.assertEqual(self.book_1.rating, Decimal('4.67'))
+
+        relation = UserBookRelation.objects.get(user=self.user_2, book=self.book_1)
+        relation.rate = 1
+        relation.save()
+        self.book_1.refresh_from_db()
+        self.assertEqual(self.book_1.rating_sum, 11)
+        self.assertEqual(self.book_1.rating, Decimal('3.67'))
+
+        relation.rate = None
+        relation.save()
+        self.book_1.refresh_from_db()
+        self.assertEqual(self.book_1.rating_count, 2)
+        self.assertEqual(self.book_1.rating, Decimal('5.00'))
+
+        UserBookRelation.objects.get(user=self.user_1, book=self.book_1).delete()
+        UserBookRelation.objects.get(user=self.user_3, book=self.book_1).delete()
+        self.book_1.refresh_from_db()
+        self.assertEqual(self.book_1.rating_count, 0)
+        self.assertIsNone(self.book_1.rating)
+
+    def test_rebuild_ratings_command(self):
+        book_2 = Book.objects.create(name='test_2', price=10, author_name="Valera")
+        UserBookRelation.objects.create(user=self.user_1, book=book_2, rate=3)
+        book_2.refresh_from_db()
+        Book.objects.filter(id=self.book_1.id).update(rating=None, rating_sum=0, rating_count=0)
+
+        out = StringIO()
+        call_command('rebuild_ratings', stdout=out)
+
+        self.assertIn('Rebuilt ratings for 1 of 2 books', out.getvalue())
+        self.book_1.refresh_from_db()
+        self.assertEqual(self.book_1.rating_sum, 14)
+        self.assertEqual(self.book_1.rating_count, 3)
+        self.assertEqual(self.book_1.rating, Decimal('4.67'))
+        self.assertEqual(Book.objects.get(id=book_2.id).updated_at, book_2.updated_at)
+
+
+class LikesCountTestCase(TestCase):
+    def setUp(self):
+        self.user_1 = User.objects.create(username='test_username_1')
+        self.user_2 = User.objects.create(username='test_username_2')
+        self.book_1 = Book.objects.create(name='test_1', price=25.5, author_name="Valera", owner=self.user_1)
+
+        UserBookRelation.objects.create(user=self.user_1, book=self.book_1, like=True)
+        self.relation = UserBookRelation.objects.create(user=self.user_2, book=self.book_1)
+
+    def test_like_toggle(self):
+        self.book_1.refresh_from_db()
+        self.assertEqual(self.book_1.likes_count, 1)
+
+        self.relation.like = True
+        self.relation.save()
+        self.book_1.refresh_from_db()
+        self.assertEqual(self.book_1.likes_count, 2)
+
+        self.relation.in_bookmarks = True
+        self.relation.save()
+        self.book_1.refresh_from_db()
+        self.assertEqual(self.book_1.likes_count, 2)
+
+        self.relation.delete()
+        self.book_1.refresh_from_db()
+        self.assertEqual(self.book_1.likes_count, 1)
+
+    def test_cascade_delete(self):
+        self.relation.rate = 4
+        self.relation.save()
+        self.user_1.delete()
+        self.user_2.delete()
+        self.book_1.refresh_from_db()
+        self.assertEqual((self.book_1.likes_count, self.book_1.readers_count), (0, 0))
+        self.assertEqual((self.book_1.rating_count, self.book_1.rating), (0, None))
+
+    def test_user_delete_uncounts_per_book(self):
+        books = [Book.objects.create(name=f'test_{i}', price=10, author_name="Valera") for i in range(5)]
+        for book in books:
+            UserBookRelation.objects.create(user=self.user_2, book=book, like=True, rate=4)
+        with CaptureQueriesContext(connection) as queries:
+            self.user_2.delete()
+        self.assertEqual(sum('"readers_count" =' in query['sql'] for query in queries), 1)
+
+        self.book_1.refresh_from_db()
+        self.assertEqual((self.book_1.likes_count, self.book_1.readers_count), (1, 1))
+        self.assertEqual(list(Book.objects.filter(pk__in=[book.pk for book in books]).values_list(
+            'likes_count', 'readers_count', 'rating_count', 'rating_4')), [(0, 0, 0, 0)] * 5)
+
+    def test_delete_with_drifted_counters(self):
+        Book.objects.filter(id=self.book_1.id).update(likes_count=0, readers_count=0)
+        self.user_1.delete()
+        self.book_1.refresh_from_db()
+        self.assertEqual((self.book_1.likes_count, self.book_1.readers_count), (0, 0))
+
+    def test_queryset_delete(self):
+        UserBookRelation.objects.filter(book=self.book_1).delete()
+        self.book_1.refresh_from_db()
+        self.assertEqual((self.book_1.likes_count, self.book_1.readers_count), (0, 0))
+
+    def test_check_counters_command(self):
+        Book.objects.filter(id=self.book_1.id).update(likes_count=5)
+
+        out = StringIO()
+        call_command('check_counters', stdout=out)
+        self.assertIn('Found 1 books with drifted counters', out.getvalue())
+        self.book_1.refresh_from_db()
+        self.assertEqual(self.book_1.likes_count, 5)
+
+        call_command('check_counters', '--repair', stdout=StringIO())
+        self.book_1.refresh_from_db()
+        self.assertEqual(self.book_1.likes_count, 1)
+
+
+@override_settings(RATING_QUEUE_ENABLED=True)
+class RatingQueueTestCase(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create(username=f'test_username_{i}') for i in range(3)]
+        self.book_1 = Book.objects.create(name='test_1', price=25.5, author_name="Valera")
+        self.book_2 = Book.objects.create(name='test_2', price=25.5, author_name="Valera")
+
+    def test_rate_changes_are_coalesced(self):
+        relation = UserBookRelation.objects.create(user=self.users[0], book=self.book_1, rate=5)
+        relation.rate = 3
+        relation.save()
+        UserBookRelation.objects.create(user=self.users[1], book=self.book_1, rate=4)
+        UserBookRelation.objects.create(user=self.users[2], book=self.book_2, rate=2)
+
+        self.book_1.refresh_from_db()
+        self.assertIsNone(self.book_1.rating)
+        self.assertEqual(PendingRating.objects.count(), 4)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(flush_rating_queue(), 4)
+        # Both books are updated by one statement.
+        book_updates = [q for q in queries if 'UPDATE "store_book"' in q['sql']]
+        self.assertEqual(len(book_updates), 1)
+
+        self.book_1.refresh_from_db()
+        self.book_2.refresh_from_db()
+        self.assertEqual((self.book_1.rating_sum, self.book_1.rating_count), (7, 2))
+        self.assertEqual(self.book_1.rating, Decimal('3.50'))
+        self.assertEqual(self.book_2.rating, Decimal('2.00'))
+        self.assertFalse(PendingRating.objects.exists())
+
+    def test_process_rating_queue_command(self):
+        UserBookRelation.objects.create(user=self.users[0], book=self.book_1, rate=5)
+
+        call_command('process_rating_queue', '--once', stdout=StringIO())
+
+        self.book_1.refresh_from_db()
+        self.assertEqual(self.book_1.rating, Decimal('5.00'))
+        self.assertFalse(PendingRating.objects.exists())
+
+
+class TrendingTestCase(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create(username='owner')
+        self.users = [User.objects.create(username=f'user_{i}') for i in range(3)]
+        self.old_book = Book.objects.create(name='old', price=10, author_name='Author', owner=self.owner)
+        self.new_book = Book.objects.create(name='new', price=10, author_name='Author', owner=self.owner)
+        self.quiet_book = Book.objects.create(name='quiet', price=10, author_name='Author', owner=self.owner)
+
+    def test_recent_activity_ranks_higher(self):
+        with patch('store.services.time.time', return_value=1_000_000):
+            for user in self.users:
+                UserBookRelation.objects.create(user=user, book=self.old_book, like=True)
+        with patch('store.services.time.time', return_value=1_000_000 + 3 * 24 * 3600):
+            UserBookRelation.objects.create(user=self.users[0], book=self.new_book, like=True)
+
+        old_book, new_book, quiet_book = (Book.objects.get(id=book.id)
+                                          for book in (self.old_book, self.new_book, self.quiet_book))
+        # 6 events three half-lives ago weigh 6 / 8 of the 2 events just now.
+        self.assertGreater(new_book.trending_score, old_book.trending_score)
+        self.assertAlmostEqual(math.exp(old_book.trending_score - new_book.trending_score), 6 / 8 / 2)
+        self.assertIsNone(quiet_book.trending_score)
+
+    def test_rating_queue_counts_every_event(self):
+        with override_settings(RATING_QUEUE_ENABLED=True), patch('store.services.time.time', return_value=0):
+            relation = UserBookRelation.objects.create(user=self.users[0], book=self.new_book)
+            score = Book.objects.get(id=self.new_book.id).trending_score
+            for rate in (2, 4, 2):
+                relation.rate = rate
+                relation.save()
+            flush_rating_queue()
+
+        self.assertAlmostEqual(Book.objects.get(id=self.new_book.id).trending_score - score, math.log(4))
+
+
+class UpsertRelationTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='test_user')
+        self.book = Book.objects.create(name='test_1', price=10, author_name='Author', owner=self.user)
+
+    def assertCounters(self, likes, readers, rating):
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.likes_count, self.book.readers_count, self.book.rating),
+                         (likes, readers, rating))
+
+    def test_create_and_update(self):
+        relation = upsert_relation(self.user, self.book.id, {'like': True, 'rate': 4})
+        self.assertEqual((relation.like, relation.in_bookmarks, relation.rate), (True, False, 4))
+        self.assertCounters(1, 1, Decimal('4.00'))
+
+        relation = upsert_relation(self.user, self.book.id, {'in_bookmarks': True})
+        self.assertEqual((relation.like, relation.in_bookmarks, relation.rate), (True, True, 4))
+        self.assertCounters(1, 1, Decimal('4.00'))
+
+        upsert_relation(self.user, self.book.id, {'like': False, 'rate': None})
+        self.assertCounters(0, 1, None)
+        self.assertEqual(UserBookRelation.objects.filter(user=self.user, book=self.book).count(), 1)
+
+    @override_settings(RATING_QUEUE_ENABLED=True)
+    def test_rating_queue(self):
+        upsert_relation(self.user, self.book.id, {'rate': 2})
+        upsert_relation(self.user, self.book.id, {'rate': 5})
+        self.assertCounters(0, 1, None)
+        flush_rating_queue()
+        self.assertCounters(0, 1, Decimal('5.00'))
+
+    def insert_after_another_request(self):
+        insert = services._insert_relations
+
+        def insert_relations(user, relations):
+            # Another request commits the relation between our lookup and insert.
+            UserBookRelation.objects.create(user=user, book=self.book, like=True, rate=2)
+            return insert(user, relations)
+
+        return patch('store.services._insert_relations', side_effect=insert_relations)
+
+    @override_settings(RATING_QUEUE_ENABLED=True)
+    def test_concurrent_insert(self):
+        with self.insert_after_another_request():
+            upsert_relation(self.user, self.book.id, {'like': False, 'rate': 5})
+        flush_rating_queue()
+        self.assertCounters(0, 1, Decimal('5.00'))
+
+    def test_bulk_concurrent_insert(self):
+        other = Book.objects.create(name='test_2', price=10, author_name='Author', owner=self.user)
+        with self.insert_after_another_request(), self.captureOnCommitCallbacks(execute=True):
+            relations = bulk_update_relations(self.user, [{'book_id': self.book.id, 'rate': 5},
+                                                          {'book_id': other.id, 'like': True}])
+        self.assertEqual([(relation.like, relation.rate) for relation in relations], [(True, 5), (True, None)])
+        self.assertCounters(1, 1, Decimal('5.00'))
+        other.refresh_from_db()
+        self.assertEqual((other.likes_count, other.readers_count), (1, 1))
+        stats = AuthorStats.objects.get(pk='Author')
+        self.assertEqual((stats.likes_count, stats.rating_count, stats.rating), (2, 1, Decimal('5.00')))
+
+    def test_bulk_matches_single(self):
+        other = Book.objects.create(name='test_2', price=10, author_name='Author', owner=self.user)
+        users = [self.user, User.objects.create(username='other_user')]
+        for user, changes in zip(users, [{'like': True, 'rate': 4}, {'rate': 2}]):
+            upsert_relation(user, self.book.id, changes)
+            bulk_update_relations(user, [{'book_id': other.id, **changes}])
+
+        fields = ('likes_count', 'readers_count', 'rating_sum', 'rating_count', 'rating', 'rating_2', 'rating_4')
+        single, bulk = Book.objects.filter(pk__in=[self.book.id, other.id]).order_by('id')
+        self.assertEqual([getattr(bulk, name) for name in fields], [getattr(single, name) for name in fields])
+        self.assertAlmostEqual(bulk.trending_score, single.trending_score, places=3)
+
+    def test_unknown_book(self):
+        with self.assertRaises(Book.DoesNotExist):
+            upsert_relation(self.user, 0, {'like': True})
+
+
+class UpdatedAtTestCase(TestCase):
+    def test_counter_updates_bump_updated_at(self):
+        user = User.objects.create(username='user')
+        book = Book.objects.create(name='test', price=10, author_name='Author')
+        stamps = [book.updated_at]
+        for change in (lambda: UserBookRelation.objects.create(user=user, book=book, like=True, rate=5),
+                       lambda: UserBookRelation.objects.filter(user=user, book=book).delete()):
+            change()
+            book.refresh_from_db()
+            stamps.append(book.updated_at)
+        self.assertEqual(stamps, sorted(set(stamps)))
+
+    def test_delete_records_tombstone(self):
+        book = Book.objects.create(name='test', price=10, author_name='Author')
+        Book.objects.filter(pk=book.pk).delete()
+        self.assertTrue(BookTombstone.objects.filter(book_id=book.pk).exists())
+
+
+class RatingHistogramTestCase(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create(username=f'user_{i}') for i in range(3)]
+        self.book = Book.objects.create(name='test', price=10, author_name='Author')
+
+    def histogram(self):
+        self.book.refresh_from_db()
+        return [self.book.rating_1, self.book.rating_2, self.book.rating_3, self.book.rating_4, self.book.rating_5]
+
+    def test_incremental(self):
+        relation = UserBookRelation.objects.create(user=self.users[0], book=self.book, rate=5)
+        upsert_relation(self.users[1], self.book.id, {'rate': 3})
+        bulk_update_relations(self.users[2], [{'book_id': self.book.id, 'rate': 3}])
+        self.assertEqual(self.histogram(), [0, 0, 2, 0, 1])
+
+        relation.rate = 1
+        relation.save()
+        upsert_relation(self.users[1], self.book.id, {'rate': None})
+        self.assertEqual(self.histogram(), [1, 0, 1, 0, 0])
+
+    @override_settings(RATING_QUEUE_ENABLED=True)
+    def test_queued(self):
+        UserBookRelation.objects.create(user=self.users[0], book=self.book, rate=4)
+        upsert_relation(self.users[1], self.book.id, {'rate': 4})
+        upsert_relation(self.users[1], self.book.id, {'rate': 2})
+        self.assertEqual(self.histogram(), [0] * 5)
+        flush_rating_queue()
+        self.assertEqual(self.histogram(), [0, 1, 0, 1, 0])
+
+    def test_rebuild(self):
+        UserBookRelation.objects.create(user=self.users[0], book=self.book, rate=2)
+        UserBookRelation.objects.create(user=self.users[1], book=self.book, rate=2)
+        Book.objects.filter(pk=self.book.pk).update(rating_2=0, rating_5=3)
+        call_command('rebuild_ratings', stdout=StringIO())
+        self.assertEqual(self.histogram(), [0, 2, 0, 0, 0])
+
+
+class AuthorStatsTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='user')
+        self.books = [Book.objects.create(name=f'test_{i}', price=10, author_name='Author') for i in range(2)]
+
+    def stats(self, author_name='Author'):
+        stats = AuthorStats.objects.get(pk=author_name)
+        return stats.books_count, stats.likes_count, stats.rating_count, stats.rating
+
+    def test_incremental(self):
+        self.assertEqual(self.stats(), (2, 0, 0, None))
+        with self.captureOnCommitCallbacks(execute=True):
+            UserBookRelation.objects.create(user=self.user, book=self.books[0], like=True, rate=5)
+            upsert_relation(self.user, self.books[1].id, {'like': True, 'rate': 2})
+        self.assertEqual(self.stats(), (2, 2, 2, Decimal('3.50')))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            upsert_relation(self.user, self.books[1].id, {'like': False})
+        self.assertEqual(self.stats(), (2, 1, 2, Decimal('3.50')))
+
+    def test_updated_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            upsert_relation(self.user, self.books[0].id, {'like': True, 'rate': 4})
+            self.assertEqual(self.stats(), (2, 0, 0, None))
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.stats(), (2, 1, 1, Decimal('4.00')))
+
+    def test_author_change_and_delete(self):
+        UserBookRelation.objects.create(user=self.user, book=self.books[0], like=True, rate=4)
+        self.books[0].refresh_from_db()
+        self.books[0].author_name = 'Other'
+        self.books[0].save()
+        self.assertEqual(self.stats(), (1, 0, 0, None))
+        self.assertEqual(self.stats('Other'), (1, 1, 1, Decimal('4.00')))
+
+        self.books[0].delete()
+        self.assertEqual(self.stats('Other'), (0, 0, 0, None))
+
+    def test_rebuild(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            UserBookRelation.objects.create(user=self.user, book=self.books[0], like=True, rate=3)
+        expected = self.stats()
+        AuthorStats.objects.update(books_count=7, likes_count=0)
+        Book.objects.create(name='test', price=10, author_name='New')
+        AuthorStats.objects.filter(pk='New').delete()
+
+        rebuild_author_stats()
+        self.assertEqual(self.stats(), expected)
+        self.assertEqual(self.stats('New'), (1, 0, 0, None))
+
+
+class SimilarBooksTestCase(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create(username=f'user_{i}') for i in range(4)]
+        self.books = [Book.objects.create(name=f'test_{i}', price=10, author_name='Author') for i in range(4)]
+        self.ids = [book.id for book in self.books]
+        # Books 0 and 1 share three readers, 0 and 2 one; a rate of 3 and a bookmark are not reads.
+        for user in self.users[:3]:
+            self.relate(user, 0, like=True)
+            self.relate(user, 1, rate=4)
+        self.relate(self.users[0], 2, like=True)
+        self.relate(self.users[3], 2, like=True)
+        self.relate(self.users[3], 0, rate=3)
+        self.relate(self.users[3], 3, in_bookmarks=True)
+
+    def relate(self, user, index, **fields):
+        UserBookRelation.objects.create(user=user, book=self.books[index], **fields)
+
+    def neighbours(self, index):
+        return [(self.ids.index(neighbour_id), round(score, 3)) for neighbour_id, score in BookNeighbour.objects.filter(
+            book_id=self.ids[index]
+        ).order_by('-score', 'neighbour_id').values_list('neighbour_id', 'score')]
+
+    def test_full(self):
+        build = build_neighbours(min_count=1)
+        self.assertTrue(build.full)
+        self.assertEqual(self.neighbours(0), [(1, 1.0), (2, round(1 / math.sqrt(6), 3))])
+        self.assertEqual(self.neighbours(1), [(0, 1.0), (2, round(1 / math.sqrt(6), 3))])
+        self.assertEqual(self.neighbours(3), [])
+
+        build_neighbours(min_count=2, full=True)
+        self.assertEqual(self.neighbours(0), [(1, 1.0)])
+
+    def test_incremental(self):
+        other = [Book.objects.create(name=f'other_{i}', price=10, author_name='Author') for i in range(2)]
+        reader = User.objects.create(username='other_reader')
+        for book in other:
+            UserBookRelation.objects.create(user=reader, book=book, like=True)
+        build_neighbours(min_count=1)
+        Book.objects.update(updated_at=timezone.now() - timedelta(minutes=2))
+        SimilarityBuild.objects.update(started_at=timezone.now() - timedelta(minutes=1))
+        BookNeighbour.objects.filter(book__in=[self.books[1], *other]).update(score=0.5)
+        self.relate(self.users[0], 3, like=True)
+        self.books[2].delete()
+
+        build = build_neighbours(min_count=1)
+        self.assertFalse(build.full)
+        self.assertEqual(self.neighbours(3), [(0, round(1 / math.sqrt(3), 3)), (1, round(1 / math.sqrt(3), 3))])
+        # Book 1 shares a reader with book 3 and listed book 2, so it is recounted as well.
+        self.assertEqual(self.neighbours(1), [(0, 1.0), (3, round(1 / math.sqrt(3), 3))])
+        self.assertEqual(self.neighbours(2), [])
+        # Books without a reader in common with the changed ones are left as they were.
+        self.assertEqual(list(BookNeighbour.objects.filter(book__in=other).values_list('score', flat=True)),
+                         [0.5, 0.5])
+
+    def test_incremental_over_max_targets(self):
+        build_neighbours(min_count=1)
+        SimilarityBuild.objects.update(started_at=timezone.now() - timedelta(minutes=1))
+        self.relate(self.users[0], 3, like=True)
+
+        # Book 3 and the three books co-read with it.
+        self.assertFalse(build_neighbours(min_count=1, max_targets=4).full)
+        SimilarityBuild.objects.update(started_at=timezone.now() - timedelta(minutes=1))
+        build = build_neighbours(min_count=1, max_targets=3)
+        self.assertTrue(build.full)
+        self.assertEqual(self.neighbours(3), [(2, round(1 / math.sqrt(2), 3)), (0, round(1 / math.sqrt(3), 3)),
+                                              (1, round(1 / math.sqrt(3), 3))])
+
+    def test_explicit_zero_options(self):
+        build_neighbours(min_count=0)
+        self.assertEqual(self.neighbours(0), [(1, 1.0), (2, round(1 / math.sqrt(6), 3))])
+
+    def test_shards(self):
+        build_neighbours(min_count=1, shards=3)
+        self.assertEqual(self.neighbours(0), [(1, 1.0), (2, round(1 / math.sqrt(6), 3))])
+        self.assertEqual(self.neighbours(2), [(0, round(1 / math.sqrt(6), 3)), (1, round(1 / math.sqrt(6), 3))])
+
+    def test_first_reader_during_build(self):
+        # Book 3 gets its first reader after the norms were computed.
+        norms = {book_id: 1.0 for book_id in self.ids[:3]}
+        self.relate(self.users[0], 3, like=True)
+        options = {'top_k': 10, 'min_count': 1, 'max_basket': 100, 'chunk_size': 100}
+        neighbours = count_shard(0, 1, None, norms, options)
+        self.assertNotIn(self.ids[3], neighbours)
+        self.assertNotIn(self.ids[3], [other for _, other in neighbours[self.ids[0]]])
+
+    def test_command(self):
+        out = StringIO()
+        call_command('build_similar_books', '--min-count', '1', stdout=out)
+        self.assertIn('Built neighbours of 3 books (full)', out.getvalue())
+
+        with self.assertRaises(CommandError):
+            call_command('build_similar_books', '--top-k', '0', stdout=StringIO())
+
+
+class ImportBooksCommandTestCase(TestCase):
+    def test_import(self):
+        owner = User.objects.create(username='owner')
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'books.ndjson')
+            errors = os.path.join(directory, 'errors.ndjson')
+            with open(path, 'w') as file:
+                for i in range(7):
+                    file.write(json.dumps({'name': f'Book {i}', 'price': str(i) if i != 3 else '-', 'author_name': 'A'})
+                               + '\n')
+
+            out = StringIO()
+            call_command('import_books', path, '--owner', 'owner', '--batch-size', '3', '--errors', errors,
+                         stdout=out)
+            with open(errors) as file:
+                rejected = [json.loads(line) for line in file]
+
+        self.assertEqual(Book.objects.filter(owner=owner).count(), 6)
+        self.assertEqual([error['line'] for error in rejected], [4])
+        self.assertIn('Imported 6 of 7 rows, 1 rejected', out.getvalue())
+        self.assertEqual(out.getvalue().count('rows/s'), 3)
+        self.assertEqual(AuthorStats.objects.get(pk='A').books_count, 6)
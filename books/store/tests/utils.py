@@ -0,0 +1,55 @@
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from store.cache import get_cache
+from store.models import Book, UserBookRelation
+
+
+class QueryCountMixin:
+    """
+    Helpers for pinning how many queries an API action runs.
+
+    `assertQueryCounts` replays a request against growing datasets and
+    fails if the number of queries differs from the pinned value at any
+    size, which is how N+1 regressions show up.
+    """
+    sizes = (1, 10, 1000)
+    readers_per_book = 2
+
+    def setUp(self):
+        super().setUp()
+        self.owner = User.objects.create(username='owner')
+        self.readers = [User.objects.create(username=f'reader_{i}', first_name=f'first_{i}')
+                        for i in range(self.readers_per_book)]
+        self.books = []
+
+    def grow_dataset(self, size):
+        missing = size - len(self.books)
+        if missing <= 0:
+            return
+        books = Book.objects.bulk_create([
+            Book(name=f'book {len(self.books) + i}', price=10 + i % 50, author_name=f'author {i % 7}',
+                 owner=self.owner, readers_count=len(self.readers))
+            for i in range(missing)
+        ])
+        UserBookRelation.objects.bulk_create([
+            UserBookRelation(user=reader, book=book, like=True, rate=4) for book in books for reader in self.readers
+        ])
+        self.books.extend(books)
+
+    def capture(self, func):
+        get_cache().clear()
+        # AuthorStats updates run after commit and are counted with the request.
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            response = func()
+        self.assertLess(response.status_code, 400, getattr(response, 'data', response))
+        return [query['sql'] for query in queries]
+
+    def assertQueryCounts(self, func, expected):
+        for size in self.sizes:
+            self.grow_dataset(size)
+            queries = self.capture(func)
+            self.assertEqual(len(queries), expected,
+                             f'{len(queries)} queries with {size} books, expected {expected}:\n' + '\n'.join(queries))
+        return queries
@@ -1,32 +1,245 @@
-from django.db.models import Count, Case, When, Avg, F
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import PermissionDenied, ValidationError as DjangoValidationError
+from django.db.models import F, FilteredRelation, Prefetch, Q
+from django.db.models.functions import Coalesce
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.shortcuts import render
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import mixins
-from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework.decorators import action
+from rest_framework.exceptions import UnsupportedMediaType, ValidationError
+from rest_framework.filters import OrderingFilter
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet, GenericViewSet
 
-from store.models import Book, UserBookRelation
+from store.cache import CachedReadMixin
+from store.changes import changes_page, decode_token, encode_token, initial_position
+from store.metrics import render_metrics
+from store.filters import BookFilter, BookSearchFilter
+from store.imports import CONTENT_TYPES, READERS, BookImporter, decode_lines
+from store.models import AuthorStats, Book, UserBookRelation
+from store.pagination import AuthorPagination, KeysetPagination, ReaderPagination, ShelfPagination, positive_int
 from store.permissions import IsOwnerOrStaffORReadOnly
-from store.serializers import BookSerializer, UserBookRelationSerializer
+from store.renderers import iter_json_array, iter_ndjson
+from store.routers import ReplicaReadMixin
+from store.serializers import AuthorStatsSerializer, BookRatingsSerializer, BookReaderSerializer, BookSerializer, \
+    FastBookSerializer, UserBookRelationBulkSerializer, UserBookRelationSerializer
+from store.services import HISTOGRAM_FIELDS, attach_readers_previews, bulk_update_relations, upsert_relation
+
+
+def annotate_user_relation(queryset, user):
+    # One LEFT JOIN on the user's own relation fills my_like, my_bookmark
+    # and my_rate for every book of the page.
+    if not user.is_authenticated:
+        return queryset
+    return queryset.annotate(
+        my_relation=FilteredRelation('userbookrelation', condition=Q(userbookrelation__user=user)),
+        my_like=Coalesce('my_relation__like', False),
+        my_bookmark=Coalesce('my_relation__in_bookmarks', False),
+        my_rate=F('my_relation__rate'),
+    )
+
+
+class FastListMixin:
+    """
+    List books from `.values()` rows with FastBookSerializer.
+
+    Skips model instances, the readers Prefetch and BookSerializer's
+    per-field dispatch, and returns the same JSON. BOOK_FAST_SERIALIZER
+    switches back to BookSerializer.
+    """
+
+    def list(self, request, *args, **kwargs):
+        if not settings.BOOK_FAST_SERIALIZER:
+            return super().list(request, *args, **kwargs)
+
+        page = self.paginate_queryset(self.get_rows(self.filter_queryset(self.get_queryset())))
+        return self.get_paginated_response(self.serialize_rows(list(page)))
+
+    def get_fast_serializer(self, *args, **kwargs):
+        return FastBookSerializer(*args, context=self.get_serializer_context(), **kwargs)
+
+    def get_rows(self, queryset):
+        # Annotations are kept so the paginator can read the ordering values.
+        fields = self.get_fast_serializer().value_fields
+        return queryset.prefetch_related(None).values(*dict.fromkeys([*fields, *queryset.query.annotations]))
+
+    def serialize_books(self, queryset):
+        if settings.BOOK_FAST_SERIALIZER:
+            return self.serialize_rows(list(self.get_rows(queryset)))
+        return self.get_serializer(queryset, many=True).data
 
+    def serialize_rows(self, rows):
+        return self.get_fast_serializer(attach_readers_previews(rows), many=True).data
 
-class BookViewSet(ModelViewSet):
+
+class BookViewSet(CachedReadMixin, ReplicaReadMixin, FastListMixin, ModelViewSet):
     queryset = Book.objects.all().annotate(
-        annotated_likes=Count(Case(When(userbookrelation__like=True, then=1))),
         owner_name=F('owner__username')
-    ).prefetch_related('readers')
+    ).prefetch_related(
+        Prefetch('readers',
+                 queryset=User.objects.only('id', 'first_name', 'last_name')
+                                      .order_by('id')[:settings.BOOK_READERS_PREVIEW_SIZE],
+                 to_attr='readers_preview')
+    )
     serializer_class = BookSerializer
     permission_classes = [IsOwnerOrStaffORReadOnly]
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
-    filterset_fields = ['price']
+    pagination_class = KeysetPagination
+    filter_backends = [DjangoFilterBackend, BookSearchFilter, OrderingFilter]
+    filterset_class = BookFilter
     search_fields = ['name', 'author_name']
-    ordering_fields = ['price', 'author_name']
+    ordering_fields = ['price', 'author_name', 'relevance']
+    write_actions = ('update', 'partial_update', 'destroy')
+
+    def get_queryset(self):
+        if self.action in self.write_actions:
+            # Writes only need the row itself, the preview is loaded once for the response.
+            queryset = Book.objects.annotate(owner_name=F('owner__username'))
+        else:
+            queryset = super().get_queryset()
+        return annotate_user_relation(queryset, self.request.user)
 
     def perform_create(self, serializer):
         serializer.validated_data['owner'] = self.request.user
         serializer.save()
 
+    @action(detail=False)
+    def export(self, request):
+        queryset = self.filter_queryset(self.get_queryset())
+        if settings.BOOK_FAST_SERIALIZER:
+            rows = self.iter_fast_rows(queryset)
+        else:
+            serializer = self.get_serializer()
+            rows = (serializer.to_representation(book)
+                    for book in queryset.iterator(chunk_size=settings.BOOK_EXPORT_CHUNK_SIZE))
+
+        if request.query_params.get('export_format') == 'ndjson':
+            return StreamingHttpResponse(iter_ndjson(rows), content_type='application/x-ndjson')
+        return StreamingHttpResponse(iter_json_array(rows), content_type='application/json')
+
+    def iter_fast_rows(self, queryset):
+        # Previews are loaded per chunk, as the Prefetch does for iterator().
+        serializer = self.get_fast_serializer()
+        rows = self.get_rows(queryset).iterator(chunk_size=settings.BOOK_EXPORT_CHUNK_SIZE)
+        while chunk := list(islice(rows, settings.BOOK_EXPORT_CHUNK_SIZE)):
+            for row in attach_readers_previews(chunk):
+                yield serializer.to_representation(row)
+
+    @action(detail=False, url_path='top-rated')
+    def top_rated(self, request):
+        return self.leaderboard(self.get_queryset().filter(rating__isnull=False).order_by('-rating', 'id'))
+
+    @action(detail=False, url_path='most-liked')
+    def most_liked(self, request):
+        return self.leaderboard(self.get_queryset().order_by('-likes_count', 'id'))
+
+    @action(detail=False)
+    def trending(self, request):
+        return self.leaderboard(self.get_queryset().filter(trending_score__isnull=False)
+                                .order_by('-trending_score', 'id'))
+
+    def leaderboard(self, queryset):
+        # Each ordering has a matching index, so top-N reads only N rows.
+        limit = self.get_limit('limit', settings.LEADERBOARD_SIZE, settings.LEADERBOARD_MAX_SIZE)
+        return Response(self.serialize_books(queryset[:limit]))
+
+    @action(detail=False)
+    def changes(self, request):
+        """
+        Books changed and deleted after the `since` token, oldest first.
+        Clients store the returned `since` and poll with it until `has_more` is false.
+        """
+        try:
+            position = decode_token(request.query_params['since'])
+        except KeyError:
+            position = initial_position()
+        except ValueError:
+            raise ValidationError({'since': ['Invalid token.']})
+
+        limit = self.get_limit('page_size', settings.BOOK_CHANGES_PAGE_SIZE, settings.BOOK_CHANGES_MAX_PAGE_SIZE)
+        changes, position, has_more = changes_page(position, limit)
+        books = {book['id']: book for book in self.serialize_books(
+            self.get_queryset().filter(id__in=[pk for _, pk, deleted in changes if not deleted])
+        )}
+        # A book deleted since its change was read is left to its tombstone.
+        results = [{'id': pk, 'deleted': True} if deleted else books[pk]
+                   for _, pk, deleted in changes if deleted or pk in books]
+        return Response({'since': encode_token(position), 'has_more': has_more, 'results': results})
+
+    @action(detail=False, methods=['post'], url_path='import', url_name='import',
+            permission_classes=[IsAuthenticated])
+    def import_books(self, request):
+        """
+        Import a text/csv or application/x-ndjson body of books owned by the
+        requesting user. The body is streamed and every BOOK_IMPORT_BATCH_SIZE
+        rows are committed on their own, so rejected rows do not stop the import.
+        """
+        input_format = CONTENT_TYPES.get(request.content_type.split(';')[0].strip())
+        if input_format is None:
+            raise UnsupportedMediaType(request.content_type)
+
+        importer = BookImporter(owner=request.user).run(READERS[input_format](decode_lines(request.stream or ())))
+        return Response(importer.summary())
+
+    def get_book_id(self):
+        # Detail actions that skip get_object() answer a malformed id with a 404 like it does.
+        try:
+            return Book._meta.pk.to_python(self.kwargs[self.lookup_field])
+        except DjangoValidationError:
+            raise Http404
+
+    def get_limit(self, param, default, cutoff):
+        try:
+            return positive_int(self.request.query_params[param], cutoff=cutoff)
+        except (KeyError, ValueError):
+            return default
+
+    @action(detail=True, pagination_class=ReaderPagination)
+    def readers(self, request, pk=None):
+        book_id = self.get_book_id()
+        if not Book.objects.filter(pk=book_id).exists():
+            raise Http404
+
+        readers = User.objects.filter(books=book_id).only('id', 'first_name', 'last_name')
+        page = self.paginate_queryset(readers)
+        serializer = BookReaderSerializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=True)
+    def similar(self, request, pk=None):
+        """Books most often liked by readers of this one, from `manage.py build_similar_books`."""
+        book_id = self.get_book_id()
+        limit = self.get_limit('limit', settings.BOOK_SIMILAR_SIZE, settings.BOOK_SIMILAR_TOP_K)
+        # The neighbour rows are read through their (book, -score) index and joined to Book.
+        books = self.serialize_books(self.get_queryset().filter(neighbour_of__book_id=book_id).annotate(
+            similarity=F('neighbour_of__score')
+        ).order_by('-similarity', 'id')[:limit])
+        if not books and not Book.objects.filter(pk=book_id).exists():
+            raise Http404
+        return Response(books)
+
+    @action(detail=True)
+    def ratings(self, request, pk=None):
+        """The book's rating and how many ratings it got per value, read from its own row."""
+        book = Book.objects.filter(pk=self.get_book_id()).only(
+            'id', 'rating', 'rating_count', *HISTOGRAM_FIELDS.values()
+        ).first()
+        if book is None:
+            raise Http404
+        return Response(BookRatingsSerializer(book).data)
+
+
+class AuthorStatsView(ReplicaReadMixin, mixins.ListModelMixin, mixins.RetrieveModelMixin, GenericViewSet):
+    """Per-author totals, by author name; retrieve is a primary key lookup."""
+    queryset = AuthorStats.objects.filter(books_count__gt=0)
+    serializer_class = AuthorStatsSerializer
+    pagination_class = AuthorPagination
+    lookup_value_regex = '[^/]+'
+
 
 class UserBookRelationView(mixins.UpdateModelMixin, GenericViewSet):
     queryset = UserBookRelation.objects.all()
@@ -34,12 +247,57 @@ class UserBookRelationView(mixins.UpdateModelMixin, GenericViewSet):
     permission_classes = [IsAuthenticated]
     lookup_field = 'book'
 
-    def get_object(self):
-        obj, _ = UserBookRelation.objects.get_or_create(user=self.request.user,
-                                                        book_id=self.kwargs['book'])
+    def update(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data, partial=kwargs.pop('partial', False))
+        serializer.is_valid(raise_exception=True)
+        try:
+            book_id = int(self.kwargs['book'])
+            relation = upsert_relation(request.user, book_id, serializer.validated_data)
+        except (ValueError, Book.DoesNotExist):
+            raise Http404
+        return Response(self.get_serializer(relation).data)
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        serializer = UserBookRelationBulkSerializer(data=request.data, many=True,
+                                                    max_length=settings.BOOK_RELATION_BULK_MAX)
+        serializer.is_valid(raise_exception=True)
+        relations = bulk_update_relations(request.user, serializer.validated_data)
+        return Response(UserBookRelationBulkSerializer(relations, many=True).data)
 
-        return obj
+
+class ShelfView(FastListMixin, mixins.ListModelMixin, GenericViewSet):
+    """
+    The requesting user's bookmarked or liked books.
+
+    Pages are ordered and sought by the relation's book id, so each page is
+    a range scan of the user's partial index however large the catalogue is.
+    """
+    serializer_class = BookSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = ShelfPagination
+    relation_field = None
+
+    def get_queryset(self):
+        return annotate_user_relation(BookViewSet.queryset.all(), self.request.user).filter(
+            **{f'my_relation__{self.relation_field}': True}
+        ).annotate(shelf_id=F('my_relation__book_id'))
+
+
+class BookmarksView(ShelfView):
+    relation_field = 'in_bookmarks'
+
+
+class LikesView(ShelfView):
+    relation_field = 'like'
 
 
 def auth(request):
     return render(request, 'oauth.html')
+
+
+def metrics(request):
+    # Endpoint names and timings are internal, so anonymous scrapers must come from METRICS_ALLOWED_IPS.
+    if not request.user.is_staff and request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        raise PermissionDenied
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')